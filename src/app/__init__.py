@@ -1,2 +1,2 @@
 __version__ = "0.0.1"
-__dbrevision__: str = "88c11dd071fc"
+__dbrevision__: str = "e1c84f2a6b70"
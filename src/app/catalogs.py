@@ -0,0 +1,119 @@
+"""
+In process cache of the small lookup tables the importers consult on every row.
+
+The catalogs are loaded once per worker and reloaded when the catalog_version row,
+which is bumped by statement triggers on the lookup tables, no longer matches the
+version they were loaded at. Callers should fetch the catalogs once per import and
+pass them down, rather than once per row.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.constants import ValueType
+
+
+@dataclass(frozen=True)
+class DetailType:
+    code: str
+    value_type: ValueType
+    description: Optional[str]
+
+
+@dataclass(frozen=True)
+class CountryEntry:
+    code: str
+    code2: str
+    name: str
+    lat: float
+    lon: float
+
+
+@dataclass(frozen=True)
+class Catalogs:
+    version: int
+    specimen_detail_types: Tuple[DetailType, ...]
+    sample_detail_types: Tuple[DetailType, ...]
+    other_types: Tuple[DetailType, ...]
+    drug_resistance_result_types: Mapping[str, Optional[str]]
+    countries: Mapping[str, CountryEntry]
+
+
+_catalogs: Optional[Catalogs] = None
+_lock = asyncio.Lock()
+
+
+async def get_catalogs(session: AsyncSession) -> Catalogs:
+    """Return the cached catalogs, reloading them if the lookup tables have changed.
+
+    Args:
+        session (AsyncSession): The database session.
+
+    Returns:
+        Catalogs: The lookup table catalogs.
+    """
+    global _catalogs
+
+    version = await session.scalar(select(models.CatalogVersion.version))
+    if _catalogs is not None and _catalogs.version == version:
+        return _catalogs
+
+    async with _lock:
+        if _catalogs is None or _catalogs.version != version:
+            _catalogs = await load_catalogs(session, version or 0)
+    return _catalogs
+
+
+def invalidate_catalogs() -> None:
+    """Drop the cached catalogs so the next get_catalogs reloads them"""
+    global _catalogs
+    _catalogs = None
+
+
+async def load_catalogs(session: AsyncSession, version: int) -> Catalogs:
+    async def detail_types(model) -> Tuple[DetailType, ...]:
+        result = await session.execute(
+            select(model.code, model.value_type, model.description).order_by(model.code)
+        )
+        return tuple(
+            DetailType(code=code, value_type=value_type, description=description)
+            for code, value_type, description in result
+        )
+
+    drug_resistance_result_types = await session.execute(
+        select(
+            models.DrugResistanceResultType.code,
+            models.DrugResistanceResultType.description,
+        )
+    )
+    countries = await session.execute(
+        select(
+            models.Country.code,
+            models.Country.code2,
+            models.Country.name,
+            models.Country.lat,
+            models.Country.lon,
+        )
+    )
+
+    return Catalogs(
+        version=version,
+        specimen_detail_types=await detail_types(models.SpecimenDetailType),
+        sample_detail_types=await detail_types(models.SampleDetailType),
+        other_types=await detail_types(models.OtherType),
+        drug_resistance_result_types=MappingProxyType(
+            {code: description for code, description in drug_resistance_result_types}
+        ),
+        countries=MappingProxyType(
+            {
+                code: CountryEntry(code, code2, name, lat, lon)
+                for code, code2, name, lat, lon in countries
+            }
+        ),
+    )
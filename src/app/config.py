@@ -30,8 +30,50 @@ class Config:
         self.AUTH0_API_AUDIENCE = os.environ.get("AUTH0_API_AUDIENCE", None)
         self.AUTH0_ISSUER = os.environ.get("AUTH0_ISSUER", None)
         self.AUTH0_ALGORITHMS = [os.environ.get("AUTH0_ALGORITHMS", "RS256")]
+        self.JWKS_REFRESH_SECONDS = int(os.environ.get("JWKS_REFRESH_SECONDS", 3600))
+        self.JWKS_MIN_REFRESH_SECONDS = int(
+            os.environ.get("JWKS_MIN_REFRESH_SECONDS", 60)
+        )
+        self.TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 1024))
         self.HOST = os.environ.get("HOST", "localhost:8000")
         self.PORT = os.environ.get("PORT", 8000)
+        self.DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 5))
+        self.DATABASE_MAX_OVERFLOW = int(os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+        self.DATABASE_POOL_TIMEOUT = int(os.environ.get("DATABASE_POOL_TIMEOUT", 30))
+        self.DATABASE_POOL_RECYCLE = int(os.environ.get("DATABASE_POOL_RECYCLE", 1800))
+        self.DATABASE_POOL_PRE_PING = os.environ.get(
+            "DATABASE_POOL_PRE_PING", "true"
+        ).lower() in ("1", "true", "yes")
+        self.IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 500))
+        self.IMPORT_COPY_ROWS = int(os.environ.get("IMPORT_COPY_ROWS", 5000))
+        self.VALIDATION_WORKERS = int(os.environ.get("VALIDATION_WORKERS", 2))
+        self.VALIDATION_PARALLEL_ROWS = int(
+            os.environ.get("VALIDATION_PARALLEL_ROWS", 5000)
+        )
+        self.UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 5000))
+        self.PLAN_TTL_SECONDS = int(os.environ.get("PLAN_TTL_SECONDS", 3600))
+        self.PLAN_PAGE_SIZE = int(os.environ.get("PLAN_PAGE_SIZE", 1000))
+        self.SAMPLE_MAPPING_CACHE_SIZE = int(
+            os.environ.get("SAMPLE_MAPPING_CACHE_SIZE", 100000)
+        )
+        self.SAMPLE_MAPPING_TTL_SECONDS = int(
+            os.environ.get("SAMPLE_MAPPING_TTL_SECONDS", 300)
+        )
+        self.VIEW_PAGE_SIZE = int(os.environ.get("VIEW_PAGE_SIZE", 100))
+        self.VIEW_MAX_PAGE_SIZE = int(os.environ.get("VIEW_MAX_PAGE_SIZE", 1000))
+        self.EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 5000))
+        self.EXPORT_QUEUE_SIZE = int(os.environ.get("EXPORT_QUEUE_SIZE", 64))
+        self.EXPORT_GZIP_LEVEL = int(os.environ.get("EXPORT_GZIP_LEVEL", 6))
+        self.JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 1.0))
+        self.JOB_HEARTBEAT_SECONDS = float(
+            os.environ.get("JOB_HEARTBEAT_SECONDS", 10.0)
+        )
+        self.JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 120))
+        self.PROGRESS_INTERVAL_SECONDS = float(
+            os.environ.get("PROGRESS_INTERVAL_SECONDS", 1.0)
+        )
+        self.LOG_MAX_ENTRIES = int(os.environ.get("LOG_MAX_ENTRIES", 50000))
+        self.LOG_PAGE_SIZE = int(os.environ.get("LOG_PAGE_SIZE", 1000))
 
     @property
     def DATABASE_URL(self):
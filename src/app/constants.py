@@ -20,6 +20,8 @@ ValueType = Literal["str", "int", "float", "bool", "date", "text"]
 SampleCategory = Literal["culture", "unclutured"]
 NucleicAcidType = Literal["DNA", "RNA", "cDNA"]
 SequencingMethod = Literal["illumina", "ont", "pacbio"]
+JobKind = Literal["spreadsheet", "summary", "mutation"]
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
 
 
 def coerce_to_str(x: Any) -> str:
@@ -28,6 +30,9 @@ def coerce_to_str(x: Any) -> str:
 
 ExcelStr = Annotated[str, BeforeValidator(coerce_to_str)]
 
+# Maximum number of keys sent in a single IN (...) lookup query
+LOOKUP_CHUNK_SIZE = 1000
+
 # Drugs in the order they appear in the summary csv. Key is the location in the string
 tb_drugs = {
     0: "Isoniazid (INH)",
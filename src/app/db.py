@@ -1,11 +1,14 @@
 import logging
 from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
 
 from alembic import command
 from alembic.config import Config as alembic_config
 from sqlalchemy import MetaData, text
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
+    async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase
@@ -51,10 +54,68 @@ class Model(DeclarativeBase):
     )
 
 
+_engine: Optional[AsyncEngine] = None
+_sessionmaker: Optional[async_sessionmaker[AsyncSession]] = None
+
+
+def init_engine() -> AsyncEngine:
+    """Create the engine and connection pool shared by every session of this process.
+
+    This is called once by the lifespan handler of each uvicorn worker, and by each
+    job worker, so connections are reused across requests rather than opened per
+    request.
+
+    Returns:
+        AsyncEngine: The shared engine.
+    """
+    global _engine, _sessionmaker
+    if _engine is None:
+        _engine = create_async_engine(
+            config.DATABASE_URL,
+            pool_size=config.DATABASE_POOL_SIZE,
+            max_overflow=config.DATABASE_MAX_OVERFLOW,
+            pool_timeout=config.DATABASE_POOL_TIMEOUT,
+            pool_recycle=config.DATABASE_POOL_RECYCLE,
+            pool_pre_ping=config.DATABASE_POOL_PRE_PING,
+        )
+        _sessionmaker = async_sessionmaker(_engine, class_=AsyncSession)
+    return _engine
+
+
+async def dispose_engine() -> None:
+    """Close every pooled connection, at shutdown"""
+    global _engine, _sessionmaker
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _sessionmaker = None
+
+
+def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    init_engine()
+    assert _sessionmaker is not None
+    return _sessionmaker
+
+
+def pool_stats() -> Dict[str, Any]:
+    """The state of this process's connection pool, to size it against the workers"""
+    if _engine is None:
+        return {"initialised": False}
+    pool: Any = _engine.pool
+    return {
+        "initialised": True,
+        "size": pool.size(),
+        "checkedIn": pool.checkedin(),
+        "checkedOut": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "maxOverflow": config.DATABASE_MAX_OVERFLOW,
+        "status": pool.status(),
+    }
+
+
 @asynccontextmanager
 async def get_session():
-    engine = create_async_engine(config.DATABASE_URL)
-    session = AsyncSession(engine)
+    session = get_sessionmaker()()
     try:
         yield session
     except:
@@ -63,7 +124,6 @@ async def get_session():
     finally:
         await session.commit()
         await session.close()
-        await engine.dispose()
 
 
 # this is run synchronously at startup
@@ -0,0 +1,133 @@
+"""
+Streaming exports of the reporting views.
+
+An export runs a single statement on a connection of its own and streams its rows
+to the response as Postgres returns them, so memory stays constant however many rows
+there are, and every row is read from the one snapshot that statement sees.
+
+CSV exports use COPY ... TO STDOUT through asyncpg, so Postgres formats the CSV and
+the chunks it sends are passed straight on. NDJSON exports read row_to_json of each
+row through a server-side cursor, EXPORT_CHUNK_ROWS rows at a time. Either can be
+gzipped on the fly.
+"""
+
+import asyncio
+import zlib
+from contextlib import suppress
+from typing import Any, AsyncIterator, Literal, Optional, Union
+
+from sqlalchemy import Text, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import config
+from app.db import init_engine
+from app.view_query import ViewQuery, build_statement
+
+ExportFormat = Literal["csv", "ndjson"]
+
+media_types = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+async def copy_csv(conn: AsyncConnection, query: ViewQuery) -> AsyncIterator[bytes]:
+    """Stream the rows of a query as CSV with a header, formatted by COPY"""
+    compiled = build_statement(query, paged=False).compile(
+        dialect=conn.dialect, compile_kwargs={"render_postcompile": True}
+    )
+    args = [compiled.params[name] for name in compiled.positiontup or []]
+    raw = await conn.get_raw_connection()
+    driver: Any = raw.driver_connection
+
+    # asyncpg pushes the COPY data to a callback, which hands it to this generator
+    # through a bounded queue, so Postgres is only read as fast as the client reads
+    queue: asyncio.Queue[Union[bytes, Exception, None]] = asyncio.Queue(
+        maxsize=config.EXPORT_QUEUE_SIZE
+    )
+
+    async def output(data: bytes) -> None:
+        await queue.put(bytes(data))
+
+    async def copy() -> None:
+        try:
+            await driver.copy_from_query(
+                str(compiled), *args, output=output, format="csv", header=True
+            )
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    task = asyncio.create_task(copy())
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        # the client may have gone away part way through
+        if not task.done():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+
+async def stream_ndjson(
+    conn: AsyncConnection, query: ViewQuery
+) -> AsyncIterator[bytes]:
+    """Stream the rows of a query as NDJSON, serialised by Postgres"""
+    rows = build_statement(query, paged=False).subquery("v")
+    statement = select(cast(func.row_to_json(rows.table_valued()), Text))
+    result = await conn.stream(
+        statement.execution_options(yield_per=config.EXPORT_CHUNK_ROWS)
+    )
+    async for partition in result.scalars().partitions():
+        yield ("\n".join(partition) + "\n").encode("utf-8")
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(
+        config.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+    )
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def export_view(
+    query: ViewQuery,
+    export_format: ExportFormat,
+    gzip: bool = False,
+    engine: Optional[AsyncEngine] = None,
+) -> AsyncIterator[bytes]:
+    """Stream all rows of a query of a view, for a StreamingResponse.
+
+    Args:
+        query (ViewQuery): The validated query, whose limit is ignored.
+        export_format (ExportFormat): csv or ndjson.
+        gzip (bool, optional): Compress the export with gzip.
+        engine (Optional[AsyncEngine], optional): The engine to connect with, the
+            shared engine by default.
+
+    Yields:
+        bytes: The next chunk of the export.
+    """
+    engine = engine or init_engine()
+    # the connection is held for as long as the export streams
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(postgresql_readonly=True)
+        async with conn.begin():
+            chunks = (copy_csv if export_format == "csv" else stream_ndjson)(
+                conn, query
+            )
+            if gzip:
+                chunks = gzip_chunks(chunks)
+            async for chunk in chunks:
+                yield chunk
+
+
+def export_filename(view_name: str, export_format: ExportFormat, gzip: bool) -> str:
+    return f"{view_name}.{export_format}" + (".gz" if gzip else "")
@@ -0,0 +1,120 @@
+"""
+Batched reconciliation of the entity-attribute-value detail tables.
+
+specimen_details, sample_details and others hold one row per parent and detail type.
+sync_details loads the existing rows for a whole batch of parents in one query per
+chunk of parent ids, works out which rows to insert, update and delete in memory and
+hands them to the session, so the next flush writes each set as a single batched
+statement while sqlalchemy-continuum still records their versions.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Tuple, Type
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.catalogs import DetailType
+from app.constants import LOOKUP_CHUNK_SIZE
+from app.upload_models import ImportModel
+from app.utils.utils import chunked
+
+
+@dataclass(frozen=True)
+class DetailTable:
+    model: Type[models.GpasLocalModel]
+    parent_column: str
+    type_column: str
+
+
+specimen_details = DetailTable(
+    models.SpecimenDetail, "specimen_id", "specimen_detail_type_code"
+)
+sample_details = DetailTable(
+    models.SampleDetail, "sample_id", "sample_detail_type_code"
+)
+other_details = DetailTable(models.Other, "analysis_id", "other_type_code")
+
+
+@dataclass
+class DetailChanges:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+
+
+async def load_details(
+    session: AsyncSession, table: DetailTable, parent_ids: Iterable[int]
+) -> Dict[Tuple[int, str], Any]:
+    """Fetch the existing detail rows of the given parents, keyed on (parent id, type code)"""
+    parent_column = getattr(table.model, table.parent_column)
+
+    existing: Dict[Tuple[int, str], Any] = {}
+    for chunk in chunked(sorted(set(parent_ids)), LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(table.model).filter(parent_column.in_(chunk))
+        )
+        for record in result:
+            existing[(record[table.parent_column], record[table.type_column])] = record
+    return existing
+
+
+async def sync_details(
+    session: AsyncSession,
+    table: DetailTable,
+    values: Mapping[int, ImportModel],
+    detail_types: Iterable[DetailType],
+) -> DetailChanges:
+    """Make the detail rows of each parent match the values of its import model.
+
+    A None value deletes the detail row, any other value inserts or updates it.
+
+    Args:
+        session (AsyncSession): The database session.
+        table (DetailTable): The detail table to reconcile.
+        values (Mapping[int, ImportModel]): The import model for each parent id.
+        detail_types (Iterable[DetailType]): The detail types to reconcile.
+
+    Returns:
+        DetailChanges: The number of rows inserted, updated and deleted.
+    """
+    changes = DetailChanges()
+    if not values:
+        return changes
+
+    existing = await load_details(session, table, values.keys())
+    detail_types = list(detail_types)
+
+    inserts: List[Any] = []
+    deletes: List[Any] = []
+    for parent_id, importmodel in values.items():
+        for detail_type in detail_types:
+            value = importmodel[detail_type.code]
+            value_column = "value_" + detail_type.value_type
+            record = existing.get((parent_id, detail_type.code))
+
+            if value is None:
+                if record is not None:
+                    deletes.append(record)
+            elif record is None:
+                inserts.append(
+                    table.model(
+                        **{
+                            table.parent_column: parent_id,
+                            table.type_column: detail_type.code,
+                            value_column: value,
+                        }
+                    )
+                )
+            elif record[value_column] != value:
+                record[value_column] = value
+                changes.updated += 1
+
+    session.add_all(inserts)
+    for record in deletes:
+        await session.delete(record)
+
+    changes.inserted = len(inserts)
+    changes.deleted = len(deletes)
+    return changes
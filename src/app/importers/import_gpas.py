@@ -1,81 +1,433 @@
-from typing import Any, Dict, List
+from typing import (
+    Any,
+    AsyncIterable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
 from app import models
-from app.constants import tb_drugs
-from app.logs import CustomLogger
-from app.upload_models import GpasSummary, Mutations
-from app.utils.utils import merge_lists
-from pydantic import ValidationError
+from app.catalogs import get_catalogs
+from app.config import config
+from app.constants import LOOKUP_CHUNK_SIZE, tb_drugs
+from app.importers.details import other_details, sync_details
+from app.importers.import_spreadsheet import finish_upload, load_samples
+from app.importers.sequences import reserve_ids
+from app.importers.upsert import upsert_rows
+from app.importers.validation import validate_sheet
+from app.logs import CustomLogger, ErrorBudgetExceeded, row_log
+from app.sample_mappings import lookup_mappings, save_mappings
+from app.upload_models import GpasSummary, ImportModel, Mutations
+from app.utils.utils import IndexedJoin, chunked
 from sqlalchemy import select
 from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+M = TypeVar("M", bound=ImportModel)
+
+# the number of unmatched row numbers listed in the log, the rest are only counted
+UNMATCHED_ROWS_LISTED = 20
+
+
+async def mapping_join(
+    session: AsyncSession,
+    Mapping: Optional[List[Dict[str, Any]]],
+    logger: CustomLogger,
+) -> IndexedJoin:
+    """Index the uploaded mapping on remote_sample_name and store it for later uploads.
+
+    Names mapped more than once are logged, and the mapping is not stored if any are.
+    """
+    mapping = IndexedJoin(Mapping or [], "remote_sample_name")
+    for name, positions in mapping.duplicates.items():
+        logger.error(
+            "Mapping Rows %s : Sample ID %s is mapped more than once",
+            ", ".join(str(position + 2) for position in positions),
+            name,
+            extra=row_log("mapping.duplicated", "Mapping", positions[0] + 2),
+        )
+        logger.check_error_budget()
+    if Mapping and not logger.error_occurred:
+        await save_mappings(session, Mapping)
+    return mapping
+
+
+async def validate_mapped(
+    session: AsyncSession,
+    import_model: Type[M],
+    rows: List[Dict[str, Any]],
+    mapping: IndexedJoin,
+    logger: CustomLogger,
+    sheet: str,
+    start: int = 0,
+) -> Dict[int, M]:
+    """Join rows to the mapping and validate them, a chunk at a time.
+
+    Sample IDs the uploaded mapping does not cover are looked up in the stored
+    mappings first. Only a chunk of merged rows is held at once, and every row keeps
+    its index in the sheet, so the rows without a mapping do not shift the numbers
+    of the rest.
+    """
+    unmapped = {
+        str(name): name
+        for name in {row.get("Sample ID") for row in rows} - mapping.index.keys()
+        if name is not None
+    }
+    stored = await lookup_mappings(session, unmapped)
+    for name, sample_name in stored.items():
+        mapping.add(
+            unmapped[name], {"remote_sample_name": name, "sample_name": sample_name}
+        )
+
+    valid: Dict[int, M] = {}
+    for chunk in chunked(
+        mapping.join(rows, "Sample ID", start), config.UPLOAD_CHUNK_SIZE
+    ):
+        indexes, merged = zip(*chunk)
+        valid.update(
+            await validate_sheet(import_model, merged, logger, sheet, indexes=indexes)
+        )
+        await logger.advance(len(chunk))
+    return valid
+
+
+def log_unmatched(mapping: IndexedJoin, logger: CustomLogger, sheet: str) -> None:
+    """Log the rows the mapping had no sample for, and so were skipped, in one line"""
+    if not mapping.unmatched:
+        return
+    count = len(mapping.unmatched)
+    rows = ", ".join(
+        str(index + 2) for index in mapping.unmatched[:UNMATCHED_ROWS_LISTED]
+    )
+    if count > UNMATCHED_ROWS_LISTED:
+        rows += f" and {count - UNMATCHED_ROWS_LISTED:,} more"
+    logger.warning(
+        "%s Rows %s: %s rows have no sample in the mapping, skipping",
+        sheet,
+        rows,
+        count,
+        extra=row_log("mapping.unmatched", sheet, mapping.unmatched[0] + 2, count),
+    )
+
+
 async def import_summary(
     session: AsyncSession,
     Summary: List[Dict[str, Any]],
-    Mapping: List[Dict[str, Any]],
+    Mapping: Optional[List[Dict[str, Any]]],
     logger: CustomLogger,
     dryrun: bool = False,
+    bulk: bool = False,
 ):
     logger.info(
-        f"Verifying and uploading data to database from Summary CSV. {'Dry run enabled' if dryrun else ''}"
+        "Verifying and uploading data to database from Summary CSV. %s",
+        "Dry run enabled" if dryrun else "",
     )
-
-    merged_list = merge_lists(Summary, Mapping, "Sample ID", "remote_sample_name")
+    write = upsert_summaries if bulk else write_summaries
 
     try:
-        for index, row in enumerate(merged_list):
-            try:
-                gpas_summary = GpasSummary(
-                    **row,
-                )
+        mapping = await mapping_join(session, Mapping, logger)
+        await logger.stage("validate")
+        gpas_summaries = await validate_mapped(
+            session, GpasSummary, Summary, mapping, logger, "Summary"
+        )
+        log_unmatched(mapping, logger, "Summary")
+        # nothing is written once any row has failed validation
+        if not logger.error_occurred:
+            await write(session, gpas_summaries, logger, dryrun)
+            await session.flush()
 
-                analysis_record = await analysis(
-                    session, gpas_summary, index, dryrun, logger
-                )
-                await session.flush()
+    except ErrorBudgetExceeded as err:
+        logger.error(str(err))
 
-                await speciation(
-                    session, gpas_summary, index, dryrun, analysis_record, logger
-                )
-                await session.flush()
+    except Exception as e:
+        logger.error("Failed to upload data: %s", e)
 
-                await drugs(
-                    session, gpas_summary, index, dryrun, analysis_record, logger
-                )
-                await session.flush()
+    return await finish_upload(session, logger, dryrun)
 
-                await details(session, gpas_summary, analysis_record)
-                await session.flush()
 
-            except ValidationError as err:
-                for error in err.errors():
-                    logger.error(
-                        f"Summary Row {index+2} {error['loc']} : {error['msg']}"
-                    )
-            except DBAPIError as err:
-                logger.error(f"Summary Row {index+2} : {err}")
+async def write_summaries(
+    session: AsyncSession,
+    gpas_summaries: Dict[int, GpasSummary],
+    logger: CustomLogger,
+    dryrun: bool,
+):
+    catalogs = await get_catalogs(session)
 
-            except ValueError as err:
-                logger.error(f"Summary Row {index+2} : {err}")
+    # look everything up once per chunk, so nothing is flushed until the end
+    sample_records = await load_samples(
+        session,
+        (gpas_summary.sample_name for gpas_summary in gpas_summaries.values()),
+    )
+    analysis_records = await load_analyses(
+        session, (sample_record.id for sample_record in sample_records.values())
+    )
+    speciation_records = await load_speciations(
+        session,
+        (analysis_record.id for analysis_record in analysis_records.values()),
+    )
+    drug_resistance_records = await load_drug_resistances(
+        session,
+        (analysis_record.id for analysis_record in analysis_records.values()),
+    )
+    new_keys = {
+        (sample_records[gpas_summary.sample_name].id, gpas_summary.batch)
+        for gpas_summary in gpas_summaries.values()
+        if gpas_summary.sample_name in sample_records
+    } - analysis_records.keys()
+    new_ids = iter(await reserve_ids(session, models.Analysis, len(new_keys)))
+
+    await logger.stage("summary")
+    detail_values: Dict[int, GpasSummary] = {}
+    analysed: List[Tuple[int, GpasSummary, models.Analysis]] = []
+    for index, gpas_summary in gpas_summaries.items():
+        await logger.advance(1)
+        sample_record = sample_records.get(gpas_summary.sample_name)
+        if not sample_record:
+            logger.error(
+                "Summary Row %s : Sample guid %s does not exist",
+                index + 2,
+                gpas_summary.sample_name,
+                extra=row_log("samples.missing", "Summary", index + 2),
+            )
+            logger.check_error_budget()
+            continue
 
-    except Exception as e:
-        logger.error(f"Failed to upload data: {e}")
+        analysis_record = analysis_records.get((sample_record.id, gpas_summary.batch))
+        if analysis_record:
+            analysis_record.assay_system = "GPAS TB"
+        else:
+            analysis_record = models.Analysis(
+                id=next(new_ids),
+                sample=sample_record,
+                batch_name=gpas_summary.batch,
+                assay_system="GPAS TB",
+            )
+            session.add(analysis_record)
+            analysis_records[(sample_record.id, gpas_summary.batch)] = analysis_record
+            logger.info(
+                "Row %s: Batch %s, Sample %s does not exist%s",
+                index + 2,
+                gpas_summary.batch,
+                gpas_summary.sample_name,
+                "" if dryrun else ", adding",
+                extra=row_log("analyses.added", "Summary", index + 2),
+            )
 
-    if logger.error_occurred:
-        await session.rollback()
-        logger.error("Upload failed, please see log messages for details")
-        return False
+        speciation(
+            session,
+            gpas_summary,
+            index,
+            dryrun,
+            analysis_record,
+            speciation_records,
+            logger,
+        )
 
-    if dryrun:
-        logger.info("Dry run mode, no data was uploaded")
-        await session.rollback()
-    else:
-        logger.info("Data uploaded successfully")
-        await session.commit()
+        detail_values[analysis_record.id] = gpas_summary
+        analysed.append((index, gpas_summary, analysis_record))
+
+    await sync_details(session, other_details, detail_values, catalogs.other_types)
+
+    await logger.stage("drugs")
+    for index, gpas_summary, analysis_record in analysed:
+        drugs(
+            session,
+            gpas_summary,
+            index,
+            dryrun,
+            analysis_record,
+            drug_resistance_records,
+            logger,
+        )
+        await logger.advance(1)
+
+
+async def upsert_summaries(
+    session: AsyncSession,
+    gpas_summaries: Dict[int, GpasSummary],
+    logger: CustomLogger,
+    dryrun: bool,
+):
+    """Write summaries with set based upserts, the bulk counterpart of write_summaries.
+
+    The samples are looked up in one query per chunk and the analyses, speciations
+    and drug resistances are each written with multi-row INSERT ... ON CONFLICT
+    statements on their unique constraints, rather than through the session. Like
+    the bulk spreadsheet path these writes are not versioned, the other details are
+    still synced through the session.
+    """
+    catalogs = await get_catalogs(session)
+    sample_records = await load_samples(
+        session,
+        (gpas_summary.sample_name for gpas_summary in gpas_summaries.values()),
+    )
+
+    await logger.stage("summary")
+    found: Dict[int, Tuple[int, GpasSummary]] = {}
+    for index, gpas_summary in gpas_summaries.items():
+        sample_record = sample_records.get(gpas_summary.sample_name)
+        if not sample_record:
+            logger.error(
+                "Summary Row %s : Sample guid %s does not exist",
+                index + 2,
+                gpas_summary.sample_name,
+                extra=row_log("samples.missing", "Summary", index + 2),
+            )
+            logger.check_error_budget()
+            continue
+        found[index] = (sample_record.id, gpas_summary)
+
+    try:
+        analysis_results = await upsert_rows(
+            session,
+            models.Analysis,
+            [
+                {
+                    "sample_id": sample_id,
+                    "batch_name": gpas_summary.batch,
+                    "assay_system": "GPAS TB",
+                }
+                for sample_id, gpas_summary in found.values()
+            ],
+            key_columns=["sample_id", "batch_name"],
+            constraint="uq_analyses_sample_id",
+        )
+    except DBAPIError as err:
+        logger.error("Summary : %s", err)
+        return
+
+    analysis_ids: Dict[int, int] = {}
+    for (index, (_, gpas_summary)), result in zip(found.items(), analysis_results):
+        analysis_ids[index] = result.id
+        if result.inserted:
+            logger.info(
+                "Row %s: Batch %s, Sample %s does not exist%s",
+                index + 2,
+                gpas_summary.batch,
+                gpas_summary.sample_name,
+                "" if dryrun else ", adding",
+                extra=row_log("analyses.added", "Summary", index + 2),
+            )
+
+    speciated = {
+        index: gpas_summary
+        for index, (_, gpas_summary) in found.items()
+        if gpas_summary.species is not None
+    }
+    for index, (_, gpas_summary) in found.items():
+        if index not in speciated:
+            logger.info(
+                "Summary row %s: Speciation for Batch %s, Sample %s not found",
+                index + 2,
+                gpas_summary.batch,
+                gpas_summary.sample_name,
+                extra=row_log("speciations.missing", "Summary", index + 2),
+            )
+    try:
+        speciation_results = await upsert_rows(
+            session,
+            models.Speciation,
+            [
+                {
+                    "analysis_id": analysis_ids[index],
+                    "species_number": 1,
+                    "species": gpas_summary.species,
+                    "sub_species": gpas_summary.sub_species,
+                    "analysis_date": gpas_summary.run_date,
+                }
+                for index, gpas_summary in speciated.items()
+            ],
+            key_columns=["analysis_id", "species_number"],
+            constraint="uq_speciations_analysis_id",
+        )
+    except DBAPIError as err:
+        logger.error("Summary : %s", err)
+        return
+
+    for (index, gpas_summary), result in zip(speciated.items(), speciation_results):
+        if result.inserted:
+            logger.info(
+                "Summary row %s: Speciation for Batch %s, Sample %s does not exist%s",
+                index + 2,
+                gpas_summary.batch,
+                gpas_summary.sample_name,
+                "" if dryrun else ", adding",
+                extra=row_log("speciations.added", "Summary", index + 2),
+            )
+        else:
+            logger.info(
+                "Summary row %s: Speciation for Batch %s, Sample %s already exists%s",
+                index + 2,
+                gpas_summary.batch,
+                gpas_summary.sample_name,
+                "" if dryrun else ", updating",
+                extra=row_log("speciations.updated", "Summary", index + 2),
+            )
+    await logger.advance(len(gpas_summaries))
+
+    await sync_details(
+        session,
+        other_details,
+        {
+            analysis_ids[index]: gpas_summary
+            for index, (_, gpas_summary) in found.items()
+        },
+        catalogs.other_types,
+    )
+
+    await logger.stage("drugs")
+    resistances: List[Tuple[int, GpasSummary, str]] = []
+    drug_rows: List[Dict[str, Any]] = []
+    for index, (_, gpas_summary) in found.items():
+        if gpas_summary.resistance_prediction is None:
+            logger.info(
+                "Summary row %s: Drug Resistance for Batch %s, Sample %s Empty",
+                index + 2,
+                gpas_summary.batch,
+                gpas_summary.sample_name,
+                extra=row_log("drug_resistances.missing", "Summary", index + 2),
+            )
+            continue
+        for key, value in tb_drugs.items():
+            resistances.append((index, gpas_summary, value))
+            drug_rows.append(
+                {
+                    "analysis_id": analysis_ids[index],
+                    "antibiotic": value,
+                    "drug_resistance_result_type_code": gpas_summary.resistance_prediction[
+                        key
+                    ],
+                }
+            )
+    try:
+        drug_results = await upsert_rows(
+            session,
+            models.DrugResistance,
+            drug_rows,
+            key_columns=["analysis_id", "antibiotic"],
+            constraint="uq_drug_resistances_analysis_id",
+        )
+    except DBAPIError as err:
+        logger.error("Summary : %s", err)
+        return
 
-    return True
+    for (index, gpas_summary, value), result in zip(resistances, drug_results):
+        if not result.inserted:
+            logger.info(
+                "Summary row %s: Drug Resistance for Batch %s, Sample %s, Antibiotic %s already exists%s",
+                index + 2,
+                gpas_summary.batch,
+                gpas_summary.sample_name,
+                value,
+                "" if dryrun else ", updating",
+                extra=row_log("drug_resistances.updated", "Summary", index + 2),
+            )
+    await logger.advance(len(found))
 
 
 async def find_samples(session: AsyncSession, guid: str) -> models.Sample:
@@ -112,44 +464,118 @@ async def analysis(
         )
         session.add(analysis)
         logger.info(
-            f"Row {index+2}: Batch {row_model.batch}, Sample {row_model.sample_name} does not exist{'' if dryrun else ', adding'}"
+            "Row %s: Batch %s, Sample %s does not exist%s",
+            index + 2,
+            row_model.batch,
+            row_model.sample_name,
+            "" if dryrun else ", adding",
+            extra=row_log("analyses.added", "Mutation", index + 2),
         )
 
     return analysis
 
 
-async def speciation(
+async def load_analyses(
+    session: AsyncSession, sample_ids: Iterable[int]
+) -> Dict[Tuple[int, str], models.Analysis]:
+    """Fetch the analyses of the given samples, keyed on (sample id, batch name)"""
+    analysis_records: Dict[Tuple[int, str], models.Analysis] = {}
+    for chunk in chunked(sorted(set(sample_ids)), LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.Analysis).filter(models.Analysis.sample_id.in_(chunk))
+        )
+        analysis_records.update(
+            {
+                (analysis_record.sample_id, analysis_record.batch_name): analysis_record
+                for analysis_record in result
+            }
+        )
+    return analysis_records
+
+
+async def load_speciations(
+    session: AsyncSession, analysis_ids: Iterable[int]
+) -> Dict[int, models.Speciation]:
+    """Fetch the first speciation of the given analyses, keyed on analysis id"""
+    speciation_records: Dict[int, models.Speciation] = {}
+    for chunk in chunked(sorted(set(analysis_ids)), LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.Speciation)
+            .filter(models.Speciation.analysis_id.in_(chunk))
+            .filter(models.Speciation.species_number == 1)
+        )
+        speciation_records.update(
+            {
+                speciation_record.analysis_id: speciation_record
+                for speciation_record in result
+            }
+        )
+    return speciation_records
+
+
+async def load_drug_resistances(
+    session: AsyncSession, analysis_ids: Iterable[int]
+) -> Dict[Tuple[int, str], models.DrugResistance]:
+    """Fetch the drug resistances of the given analyses, keyed on (analysis id, antibiotic)"""
+    drug_resistance_records: Dict[Tuple[int, str], models.DrugResistance] = {}
+    for chunk in chunked(sorted(set(analysis_ids)), LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.DrugResistance).filter(
+                models.DrugResistance.analysis_id.in_(chunk)
+            )
+        )
+        drug_resistance_records.update(
+            {
+                (
+                    drug_resistance.analysis_id,
+                    drug_resistance.antibiotic,
+                ): drug_resistance
+                for drug_resistance in result
+            }
+        )
+    return drug_resistance_records
+
+
+def speciation(
     session: AsyncSession,
     gpas_summary: GpasSummary,
     index: int,
     dryrun: bool,
     analysis_record: models.Analysis,
+    speciation_records: Dict[int, models.Speciation],
     logger: CustomLogger,
 ):
     if gpas_summary.species is None:
         logger.info(
-            f"Summary row {index+2}: Speciation for Batch {gpas_summary.batch}, Sample {gpas_summary.sample_name} not found"
+            "Summary row %s: Speciation for Batch %s, Sample %s not found",
+            index + 2,
+            gpas_summary.batch,
+            gpas_summary.sample_name,
+            extra=row_log("speciations.missing", "Summary", index + 2),
         )
         return None
 
-    speciation: models.Speciation | None = None
-    if analysis_record and analysis_record.id:
-        speciation = await session.scalar(
-            select(models.Speciation)
-            .filter(models.Speciation.analysis_id == analysis_record.id)
-            .filter(models.Speciation.species_number == 1)
-            .limit(1)
-        )
-
+    speciation = speciation_records.get(analysis_record.id)
     if not speciation:
         speciation = models.Speciation(analysis=analysis_record, species_number=1)
         session.add(speciation)
+        speciation_records[analysis_record.id] = speciation
         logger.info(
-            f"Summary row {index+2}: Speciation for Batch {gpas_summary.batch}, Sample {gpas_summary.sample_name} does not exist{'' if dryrun else ', adding'}"
+            "Summary row %s: Speciation for Batch %s, Sample %s does not exist%s",
+            index + 2,
+            gpas_summary.batch,
+            gpas_summary.sample_name,
+            "" if dryrun else ", adding",
+            extra=row_log("speciations.added", "Summary", index + 2),
         )
     else:
         logger.info(
-            f"Summary row {index+2}: Speciation for Batch {gpas_summary.batch}, Sample {gpas_summary.sample_name} already exists{'' if dryrun else ', updating'}"
+            "Summary row %s: Speciation for Batch %s, Sample %s already exists%s",
+            index + 2,
+            gpas_summary.batch,
+            gpas_summary.sample_name,
+            "" if dryrun else ", updating",
+            extra=row_log("speciations.updated", "Summary", index + 2),
         )
 
     speciation.species = gpas_summary.species
@@ -159,30 +585,36 @@ async def speciation(
     return speciation
 
 
-async def drugs(
+def drugs(
     session: AsyncSession,
     gpas_summary: GpasSummary,
     index: int,
     dryrun: bool,
     analysis_record: models.Analysis,
+    drug_resistance_records: Dict[Tuple[int, str], models.DrugResistance],
     logger: CustomLogger,
 ):
     if gpas_summary.resistance_prediction is None:
         logger.info(
-            f"Summary row {index+2}: Drug Resistance for Batch {gpas_summary.batch}, Sample {gpas_summary.sample_name} Empty"
+            "Summary row %s: Drug Resistance for Batch %s, Sample %s Empty",
+            index + 2,
+            gpas_summary.batch,
+            gpas_summary.sample_name,
+            extra=row_log("drug_resistances.missing", "Summary", index + 2),
         )
         return
 
     for key, value in tb_drugs.items():
-        drug_resistance: models.DrugResistance | None = await session.scalar(
-            select(models.DrugResistance)
-            .filter(models.DrugResistance.analysis == analysis_record)
-            .filter(models.DrugResistance.antibiotic == value)
-            .limit(1)
-        )
+        drug_resistance = drug_resistance_records.get((analysis_record.id, value))
         if drug_resistance:
             logger.info(
-                f"Summary row {index+2}: Drug Resistance for Batch {gpas_summary.batch}, Sample {gpas_summary.sample_name}, Antibiotic {value} already exists{'' if dryrun else ', updating'}"
+                "Summary row %s: Drug Resistance for Batch %s, Sample %s, Antibiotic %s already exists%s",
+                index + 2,
+                gpas_summary.batch,
+                gpas_summary.sample_name,
+                value,
+                "" if dryrun else ", updating",
+                extra=row_log("drug_resistances.updated", "Summary", index + 2),
             )
         else:
             drug_resistance = models.DrugResistance(
@@ -190,94 +622,271 @@ async def drugs(
                 antibiotic=value,
             )
             session.add(drug_resistance)
+            drug_resistance_records[(analysis_record.id, value)] = drug_resistance
         drug_resistance.drug_resistance_result_type_code = (
             gpas_summary.resistance_prediction[key]
         )
 
 
-async def details(
-    session: AsyncSession, gpas_summary: GpasSummary, analysis_record: models.Analysis
+async def import_mutation(
+    session: AsyncSession,
+    Mutation: List[Dict[str, Any]],
+    Mapping: Optional[List[Dict[str, Any]]],
+    logger: CustomLogger,
+    dryrun: bool = False,
+    bulk: bool = False,
 ):
-    other_types = await session.scalars(select(models.OtherType))
-    for other_type in other_types:
-        value = gpas_summary[other_type.code]
-
-        other_record: models.Other | None = await session.scalar(
-            select(models.Other)
-            .filter(models.Other.analysis == analysis_record)
-            .filter(models.Other.other_type_code == other_type.code)
-            .limit(1)
+    """upload data from a mutation csv"""
+    logger.info(
+        "verifying and uploading data to database from mutation csv. %s",
+        "dry run enabled" if dryrun else "",
+    )
+    write = upsert_mutations if bulk else write_mutations
+
+    try:
+        mapping = await mapping_join(session, Mapping, logger)
+        await logger.stage("validate")
+        mutations = await validate_mapped(
+            session, Mutations, Mutation, mapping, logger, "Mutation"
         )
+        log_unmatched(mapping, logger, "Mutation")
+        if not logger.error_occurred:
+            await write(session, mutations, logger, dryrun)
 
-        if value is None:
-            if other_record:
-                await session.delete(other_record)
-            continue
+    except ErrorBudgetExceeded as err:
+        logger.error(str(err))
 
-        if not other_record:
-            other_record = models.Other(
-                analysis=analysis_record,
-                other_type_code=other_type.code,
-            )
-            session.add(other_record)
+    except Exception as e:
+        logger.error("Failed to upload data: %s", e)
 
-        other_record["value" + other_type.value_type] = value
+    return await finish_upload(session, logger, dryrun)
 
 
-async def import_mutation(
+async def import_summary_file(
     session: AsyncSession,
-    Mutation: List[Dict[str, Any]],
-    Mapping: List[Dict[str, Any]],
+    Summary: AsyncIterable[List[Dict[str, Any]]],
+    Mapping: Optional[List[Dict[str, Any]]],
     logger: CustomLogger,
     dryrun: bool = False,
-):
-    """upload data from a mutation csv"""
+    bulk: bool = False,
+) -> bool:
+    """Import an uploaded summary file a chunk of rows at a time, like import_files"""
     logger.info(
-        f"verifying and uploading data to database from mutation csv. {'dry run enabled' if dryrun else ''}"
+        "Verifying and uploading data to database from Summary file. %s",
+        "Dry run enabled" if dryrun else "",
     )
+    write = upsert_summaries if bulk else write_summaries
 
     try:
-        merged_list = merge_lists(Mutation, Mapping, "Sample ID", "remote_sample_name")
-
-        for index, row in enumerate(merged_list):
-            try:
-                mut = Mutations(
-                    **row,
-                )
+        mapping = await mapping_join(session, Mapping, logger)
+        start = 0
+        async for chunk in Summary:
+            await logger.stage("validate")
+            gpas_summaries = await validate_mapped(
+                session, GpasSummary, chunk, mapping, logger, "Summary", start=start
+            )
+            start += len(chunk)
 
-                analysis_record = await analysis(session, mut, index, dryrun, logger)
+            if not logger.error_occurred:
+                await write(session, gpas_summaries, logger, dryrun)
                 await session.flush()
+        log_unmatched(mapping, logger, "Summary")
 
-                await mutation(session, mut, index, dryrun, analysis_record, logger)
-                await session.flush()
+    except ErrorBudgetExceeded as err:
+        logger.error(str(err))
 
-            except ValidationError as err:
-                for error in err.errors():
-                    logger.error(
-                        f"Mutation Row {index+2} {error['loc']} : {error['msg']}"
-                    )
-            except DBAPIError as err:
-                logger.error(f"Mutation Row {index+2} : {err}")
+    except Exception as e:
+        logger.error("Failed to upload data: %s", e)
+
+    return await finish_upload(session, logger, dryrun)
+
+
+async def import_mutation_file(
+    session: AsyncSession,
+    Mutation: AsyncIterable[List[Dict[str, Any]]],
+    Mapping: Optional[List[Dict[str, Any]]],
+    logger: CustomLogger,
+    dryrun: bool = False,
+    bulk: bool = False,
+) -> bool:
+    """Import an uploaded mutation file a chunk of rows at a time, like import_files"""
+    logger.info(
+        "verifying and uploading data to database from mutation file. %s",
+        "dry run enabled" if dryrun else "",
+    )
+    write = upsert_mutations if bulk else write_mutations
+
+    try:
+        mapping = await mapping_join(session, Mapping, logger)
+        start = 0
+        async for chunk in Mutation:
+            await logger.stage("validate")
+            mutations = await validate_mapped(
+                session, Mutations, chunk, mapping, logger, "Mutation", start=start
+            )
+            start += len(chunk)
+
+            if not logger.error_occurred:
+                await write(session, mutations, logger, dryrun)
+        log_unmatched(mapping, logger, "Mutation")
 
-            except ValueError as err:
-                logger.error(f"Mutation Row {index+2} : {err}")
+    except ErrorBudgetExceeded as err:
+        logger.error(str(err))
 
     except Exception as e:
-        logger.error(f"Failed to upload data: {e}")
+        logger.error("Failed to upload data: %s", e)
 
-    if logger.error_occurred:
-        await session.rollback()
-        logger.error("Upload failed, please see log messages for details")
-        return False
+    return await finish_upload(session, logger, dryrun)
+
+
+async def write_mutations(
+    session: AsyncSession,
+    mutations: Dict[int, Mutations],
+    logger: CustomLogger,
+    dryrun: bool,
+):
+    await logger.stage("mutations")
+    for index, mut in mutations.items():
+        await logger.advance(1)
+        try:
+            analysis_record = await analysis(session, mut, index, dryrun, logger)
+            await session.flush()
+
+            await mutation(session, mut, index, dryrun, analysis_record, logger)
+            await session.flush()
+
+        except DBAPIError as err:
+            logger.error(
+                "Mutation Row %s : %s",
+                index + 2,
+                err,
+                extra=row_log("mutations.failed", "Mutation", index + 2),
+            )
+            logger.check_error_budget()
+
+        except ValueError as err:
+            logger.error(
+                "Mutation Row %s : %s",
+                index + 2,
+                err,
+                extra=row_log("mutations.failed", "Mutation", index + 2),
+            )
+            logger.check_error_budget()
 
-    if dryrun:
-        logger.info("Dry run mode, no data was uploaded")
-        await session.rollback()
-    else:
-        logger.info("Data uploaded successfully")
-        await session.commit()
 
-    return True
+async def upsert_mutations(
+    session: AsyncSession,
+    mutations: Dict[int, Mutations],
+    logger: CustomLogger,
+    dryrun: bool,
+    batch_size: int = config.IMPORT_BATCH_SIZE,
+):
+    """Write mutations with set based upserts, the bulk counterpart of write_mutations.
+
+    The samples are looked up in one query per chunk and the analysis of each
+    distinct (sample, batch) is upserted once. The mutations are then upserted on
+    their five column key, by upsert_rows, logging how many each batch_size rows
+    added and updated rather than a line per mutation.
+    Like the bulk spreadsheet path these writes are not versioned.
+    """
+    await logger.stage("mutations")
+    sample_records = await load_samples(
+        session, (mut.sample_name for mut in mutations.values())
+    )
+
+    # the first row of each analysis, to log it against
+    analysis_rows: Dict[Tuple[int, str], int] = {}
+    found: Dict[int, Tuple[int, str]] = {}
+    for index, mut in mutations.items():
+        sample_record = sample_records.get(mut.sample_name)
+        if not sample_record:
+            logger.error(
+                "Mutation Row %s : Sample guid %s does not exist",
+                index + 2,
+                mut.sample_name,
+                extra=row_log("samples.missing", "Mutation", index + 2),
+            )
+            logger.check_error_budget()
+            continue
+        found[index] = (sample_record.id, mut.batch)
+        analysis_rows.setdefault((sample_record.id, mut.batch), index)
+
+    try:
+        analysis_results = await upsert_rows(
+            session,
+            models.Analysis,
+            [
+                {"sample_id": sample_id, "batch_name": batch, "assay_system": "GPAS TB"}
+                for sample_id, batch in analysis_rows
+            ],
+            key_columns=["sample_id", "batch_name"],
+            constraint="uq_analyses_sample_id",
+        )
+    except DBAPIError as err:
+        logger.error("Mutation : %s", err)
+        return
+
+    analysis_ids: Dict[Tuple[int, str], int] = {}
+    for (key, index), result in zip(analysis_rows.items(), analysis_results):
+        analysis_ids[key] = result.id
+        if result.inserted:
+            logger.info(
+                "Row %s: Batch %s, Sample %s does not exist%s",
+                index + 2,
+                mutations[index].batch,
+                mutations[index].sample_name,
+                "" if dryrun else ", adding",
+                extra=row_log("analyses.added", "Mutation", index + 2),
+            )
+
+    try:
+        results = await upsert_rows(
+            session,
+            models.Mutations,
+            [
+                {
+                    "analysis_id": analysis_ids[key],
+                    "species": mutations[index].species,
+                    "drug": mutations[index].drug,
+                    "gene": mutations[index].gene,
+                    "mutation": mutations[index].mutation,
+                    "position": mutations[index].position,
+                    "ref": mutations[index].ref,
+                    "alt": mutations[index].alt,
+                    "coverage": mutations[index].coverage,
+                    "prediction": mutations[index].prediction,
+                    "evidence": mutations[index].evidence,
+                    "evidence_json": mutations[index].evidence_json,
+                }
+                for index, key in found.items()
+            ],
+            key_columns=["analysis_id", "species", "drug", "gene", "mutation"],
+            constraint="uq_mutations_analysis_id",
+            batch_size=batch_size,
+        )
+    except DBAPIError as err:
+        logger.error("Mutation : %s", err)
+        return
+
+    # written in one call, so large uploads can go through COPY, but logged by batch
+    for batch in chunked(zip(found, results), batch_size):
+        first, last = batch[0][0] + 2, batch[-1][0] + 2
+        added = sum(result.inserted for _, result in batch)
+        for code, count, action in [
+            ("mutations.added", added, "" if dryrun else ", added"),
+            ("mutations.updated", len(batch) - added, "" if dryrun else ", updated"),
+        ]:
+            if count:
+                logger.info(
+                    "Mutation rows %s to %s: %s mutations %s%s",
+                    first,
+                    last,
+                    count,
+                    "did not exist" if code == "mutations.added" else "already existed",
+                    action,
+                    extra=row_log(code, "Mutation", first, count=count),
+                )
+        await logger.advance(len(batch))
 
 
 async def mutation(
@@ -300,7 +909,14 @@ async def mutation(
 
     if mut:
         logger.info(
-            f"Mutation row {index+2}: Mutation for Batch {mutation.batch}, Sample {mutation.sample_name}, Gene {mutation.gene}, Position {mutation.position} already exists{'' if dryrun else ', updating'}"
+            "Mutation row %s: Mutation for Batch %s, Sample %s, Gene %s, Position %s already exists%s",
+            index + 2,
+            mutation.batch,
+            mutation.sample_name,
+            mutation.gene,
+            mutation.position,
+            "" if dryrun else ", updating",
+            extra=row_log("mutations.updated", "Mutation", index + 2),
         )
     else:
         mut = models.Mutations(
@@ -312,7 +928,16 @@ async def mutation(
         )
         session.add(mut)
         logger.info(
-            f"Mutation row {index+2}: Mutation for Batch {mutation.batch}, Sample {mutation.sample_name}, Species {mutation.species}, Drug {mutation.drug}, Gene {mutation.gene}, Mutation {mutation.mutation} does not exist{'' if dryrun else ', adding'}"
+            "Mutation row %s: Mutation for Batch %s, Sample %s, Species %s, Drug %s, Gene %s, Mutation %s does not exist%s",
+            index + 2,
+            mutation.batch,
+            mutation.sample_name,
+            mutation.species,
+            mutation.drug,
+            mutation.gene,
+            mutation.mutation,
+            "" if dryrun else ", adding",
+            extra=row_log("mutations.added", "Mutation", index + 2),
         )
 
     mut.position = mutation.position
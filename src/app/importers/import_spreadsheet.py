@@ -1,16 +1,41 @@
 import re
 from datetime import date
-from typing import Any, Dict, List
-
-from pydantic import ValidationError
-from sqlalchemy import not_, select
+from typing import (
+    Any,
+    AsyncIterable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+from sqlalchemy import insert, select, tuple_
 from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.models as models
-from app.logs import CustomLogger
-from app.upload_models import RunImport, SamplesImport, SpecimensImport, StoragesImport
-from app.utils.utils import is_none_or_nan
+from app.catalogs import get_catalogs
+from app.config import config
+from app.constants import LOOKUP_CHUNK_SIZE, coerce_to_str
+from app.importers.details import sample_details, specimen_details, sync_details
+from app.importers.sequences import reserve_ids
+from app.importers.upsert import row_from_importmodel, upsert_rows
+from app.importers.validation import validate_sheet
+from app.logs import CustomLogger, ErrorBudgetExceeded, row_log
+from app.progress import Stage
+from app.upload_models import (
+    ImportModel,
+    RunImport,
+    SamplesImport,
+    SpecimensImport,
+    StoragesImport,
+)
+from app.utils.utils import chunked, is_none_or_nan
+
+spike_column_pattern = re.compile(r"^spike_(?:name|quantity)_(\d+)$")
 
 
 async def import_data(
@@ -21,126 +46,313 @@ async def import_data(
     Storage: List[Dict[str, Any]],
     logger: CustomLogger,
     dryrun: bool = False,
+    bulk: bool = False,
 ) -> bool:
     logger.info(
-        f"Verifying and uploading data to database from Excel Workbook. {'Dry run enabled' if dryrun else ''}"
+        "Verifying and uploading data to database from Excel Workbook. %s",
+        "Dry run enabled" if dryrun else "",
     )
 
     try:
-        await import_runs(session, data=Runs, dryrun=dryrun, logger=logger)
-        await session.flush()
+        # validate every sheet before doing any database work
+        await logger.stage("validate")
+        run_imports = await validate_sheet(RunImport, Runs, logger, "Runs Sheet")
+        await logger.advance(len(Runs))
+        specimen_imports = await validate_sheet(
+            SpecimensImport, Specimens, logger, "Specimens Sheet"
+        )
+        await logger.advance(len(Specimens))
+        sample_imports = await validate_sheet(
+            SamplesImport, Samples, logger, "Samples Sheet"
+        )
+        await logger.advance(len(Samples))
+        storage_imports = await validate_sheet(
+            StoragesImport, Storage, logger, "Storage Sheet"
+        )
+        await logger.advance(len(Storage))
 
-        await import_specimens(session, data=Specimens, dryrun=dryrun, logger=logger)
-        await session.flush()
+        # nothing is written once any row has failed validation
+        if logger.error_occurred:  # type: ignore
+            return False
 
-        await import_samples(session, data=Samples, dryrun=dryrun, logger=logger)
-        await session.flush()
+        await write_workbook(
+            session,
+            run_imports,
+            specimen_imports,
+            sample_imports,
+            storage_imports,
+            logger,
+            dryrun=dryrun,
+            bulk=bulk,
+        )
 
-        await import_storage(session, data=Storage, dryrun=dryrun, logger=logger)
-        await session.flush()
+    except ErrorBudgetExceeded as err:
+        logger.error(str(err))
 
     except Exception as e:
-        logger.error(f"Failed to upload data: {e}")
+        logger.error("Failed to upload data: %s", e)
 
     finally:
-        if logger.error_occurred:  # type: ignore
-            await session.rollback()
-            logger.error("Upload failed, please see log messages for details")
-            return False
+        return await finish_upload(session, logger, dryrun)
 
-        if dryrun:
-            logger.info("Dry run mode, no data was uploaded")
-            await session.rollback()
-        else:
-            logger.info("Data uploaded successfully")
-            await session.commit()
+
+async def write_workbook(
+    session: AsyncSession,
+    run_imports: Dict[int, RunImport],
+    specimen_imports: Dict[int, SpecimensImport],
+    sample_imports: Dict[int, SamplesImport],
+    storage_imports: Dict[int, StoragesImport],
+    logger: CustomLogger,
+    dryrun: bool = False,
+    bulk: bool = False,
+) -> None:
+    """Write the validated sheets of a workbook, in dependency order, without committing"""
+    sheets: List[Tuple[Stage, Dict[int, Any], Any]] = [
+        ("runs", run_imports, upsert_runs if bulk else import_runs),
+        ("specimens", specimen_imports, upsert_specimens if bulk else import_specimens),
+        ("samples", sample_imports, upsert_samples if bulk else import_samples),
+        ("storage", storage_imports, upsert_storage if bulk else import_storage),
+    ]
+    # the set based upserts are not versioned, so are faster for large workbooks
+    for stage, imports, write in sheets:
+        await logger.stage(stage)
+        await write(session, imports, dryrun=dryrun, logger=logger)
+        await session.flush()
+        await logger.advance(len(imports))
+
+
+async def import_files(
+    session: AsyncSession,
+    Runs: AsyncIterable[List[Dict[str, Any]]],
+    Specimens: AsyncIterable[List[Dict[str, Any]]],
+    Samples: AsyncIterable[List[Dict[str, Any]]],
+    Storage: AsyncIterable[List[Dict[str, Any]]],
+    logger: CustomLogger,
+    dryrun: bool = False,
+    bulk: bool = False,
+) -> bool:
+    """Import uploaded sheet files, a chunk of rows at a time.
+
+    Each chunk is validated and then written and flushed before the next is read, so
+    only one chunk of each sheet is held at once. Once a row has failed validation
+    the rest of the sheets are still validated but nothing more is written, and the
+    whole upload is rolled back at the end, as with import_data.
+
+    Args:
+        session (AsyncSession): The database session.
+        Runs (AsyncIterable[List[Dict[str, Any]]]): Chunks of rows of the runs sheet.
+        Specimens (AsyncIterable[List[Dict[str, Any]]]): Chunks of rows of the specimens sheet.
+        Samples (AsyncIterable[List[Dict[str, Any]]]): Chunks of rows of the samples sheet.
+        Storage (AsyncIterable[List[Dict[str, Any]]]): Chunks of rows of the storage sheet.
+        logger (CustomLogger): The request logger.
+        dryrun (bool, optional): Roll back rather than commit at the end.
+        bulk (bool, optional): Use the set based upserts, which are not versioned.
+
+    Returns:
+        bool: Whether the upload succeeded.
+    """
+    logger.info(
+        "Verifying and uploading data to database from sheet files. %s",
+        "Dry run enabled" if dryrun else "",
+    )
+
+    sheets: List[
+        Tuple[AsyncIterable[List[Dict[str, Any]]], Type[ImportModel], str, Stage, Any]
+    ] = [
+        (Runs, RunImport, "Runs Sheet", "runs", upsert_runs if bulk else import_runs),
+        (
+            Specimens,
+            SpecimensImport,
+            "Specimens Sheet",
+            "specimens",
+            upsert_specimens if bulk else import_specimens,
+        ),
+        (
+            Samples,
+            SamplesImport,
+            "Samples Sheet",
+            "samples",
+            upsert_samples if bulk else import_samples,
+        ),
+        (
+            Storage,
+            StoragesImport,
+            "Storage Sheet",
+            "storage",
+            upsert_storage if bulk else import_storage,
+        ),
+    ]
+
+    try:
+        for chunks, import_model, sheet, stage, write in sheets:
+            start = 0
+            async for data in chunks:
+                await logger.stage("validate")
+                imports = await validate_sheet(
+                    import_model, data, logger, sheet, start=start
+                )
+                start += len(data)
+                await logger.advance(len(data))
+
+                if not logger.error_occurred:  # type: ignore
+                    await logger.stage(stage)
+                    await write(session, imports, dryrun=dryrun, logger=logger)
+                    await session.flush()
+                    await logger.advance(len(imports))
+
+    except ErrorBudgetExceeded as err:
+        logger.error(str(err))
+
+    except Exception as e:
+        logger.error("Failed to upload data: %s", e)
+
+    return await finish_upload(session, logger, dryrun)
+
+
+async def finish_upload(
+    session: AsyncSession, logger: CustomLogger, dryrun: bool
+) -> bool:
+    """Commit the upload, or roll it back if it is a dry run or any error was logged"""
+    await logger.finish_stages()
+
+    if logger.error_occurred:  # type: ignore
+        await session.rollback()
+        logger.error("Upload failed, please see log messages for details")
+        return False
+
+    if dryrun:
+        logger.info("Dry run mode, no data was uploaded")
+        await session.rollback()
+    else:
+        logger.info("Data uploaded successfully")
+        await session.commit()
 
     return True
 
 
 async def import_runs(
     session: AsyncSession,
-    data: List[Dict[str, Any]],
+    run_imports: Dict[int, RunImport],
     logger: CustomLogger,
     dryrun: bool = False,
 ):
-    for index, row in enumerate(data):
-        try:
-            run_import = RunImport(**row)
+    run_records = await load_runs(
+        session, (run_import.code for run_import in run_imports.values())
+    )
 
-            run_record: models.Run | None = await session.scalar(
-                select(models.Run).filter(models.Run.code == run_import.code)
+    for index, run_import in run_imports.items():
+        run_record = run_records.get(run_import.code)
+        if run_record:
+            logger.info(
+                "Runs Sheet Row %s: Run %s already exists%s",
+                index + 2,
+                run_import.code,
+                "" if dryrun else ", updating",
+                extra=row_log("runs.updated", "Runs Sheet", index + 2),
             )
-            if run_record:
-                logger.info(
-                    f"Runs Sheet Row {index+2}: Run {run_import.code} already exists{'' if dryrun else ', updating'}"
-                )
-            else:
-                # add the run record
-                run_record = models.Run(code=run_import.code)
-                session.add(run_record)
-                logger.info(
-                    f"Runs Sheet Row {index+2}: Run {run_import.code} does not exist{'' if dryrun else ', adding'}"
-                )
-            run_record.update_from_importmodel(run_import)
+        else:
+            # add the run record
+            run_record = models.Run(code=run_import.code)
+            session.add(run_record)
+            run_records[run_import.code] = run_record
+            logger.info(
+                "Runs Sheet Row %s: Run %s does not exist%s",
+                index + 2,
+                run_import.code,
+                "" if dryrun else ", adding",
+                extra=row_log("runs.added", "Runs Sheet", index + 2),
+            )
+        run_record.update_from_importmodel(run_import)
 
-        except ValidationError as err:
-            for error in err.errors():
-                logger.error(
-                    f"Runs Sheet Row {index+2} {error['loc']} : {error['msg']}"
-                )
-        except DBAPIError as err:
-            logger.error(f"Runs Sheet Row {index+2} : {err}")
+
+async def load_runs(
+    session: AsyncSession, codes: Iterable[Any]
+) -> Dict[str, models.Run]:
+    """Fetch the runs matching the given codes, using one IN query per chunk of codes"""
+    clean_codes = sorted(
+        {coerce_to_str(code) for code in codes if not is_none_or_nan(code)}
+    )
+
+    run_records: Dict[str, models.Run] = {}
+    for chunk in chunked(clean_codes, LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.Run).filter(models.Run.code.in_(chunk))
+        )
+        run_records.update({run_record.code: run_record for run_record in result})
+    return run_records
 
 
 async def import_specimens(
     session: AsyncSession,
-    data: List[Dict[str, Any]],
+    specimen_imports: Dict[int, SpecimensImport],
     logger: CustomLogger,
     dryrun: bool = False,
 ):
-    for index, row in enumerate(data):
-        try:
-            specimen_import = SpecimensImport(**row)
-
-            # get the specimen owner
-            owner_record = await owner(session, index, specimen_import, logger, dryrun)
-
-            specimen_record: models.Specimen | None = await session.scalar(
-                select(models.Specimen)
-                .filter(models.Specimen.accession == specimen_import.accession)
-                .filter(
-                    models.Specimen.collection_date == specimen_import.collection_date
-                )
-                .filter(models.Specimen.organism == specimen_import.organism)
+    catalogs = await get_catalogs(session)
+
+    owner_records = await load_owners(
+        session,
+        (
+            (specimen_import.owner_site, specimen_import.owner_user)
+            for specimen_import in specimen_imports.values()
+        ),
+    )
+    specimen_records = await load_specimens(
+        session,
+        (
+            specimen_key(specimen_import)
+            for specimen_import in specimen_imports.values()
+        ),
+    )
+    new_keys = {
+        specimen_key(specimen_import) for specimen_import in specimen_imports.values()
+    } - specimen_records.keys()
+    new_ids = iter(await reserve_ids(session, models.Specimen, len(new_keys)))
+
+    specimen_values: Dict[int, SpecimensImport] = {}
+    for index, specimen_import in specimen_imports.items():
+        # get the specimen owner
+        owner_record = await owner(
+            session, index, specimen_import, logger, dryrun, owner_records
+        )
+
+        specimen_record = specimen_records.get(specimen_key(specimen_import))
+        if specimen_record:
+            logger.info(
+                "Specimens Sheet Row %s: Specimen %s, %s, %s already exists%s",
+                index + 2,
+                specimen_import.accession,
+                specimen_import.collection_date,
+                specimen_import.organism,
+                "" if dryrun else ", updating",
+                extra=row_log("specimens.updated", "Specimens Sheet", index + 2),
             )
-            if specimen_record:
-                logger.info(
-                    f"Specimens Sheet Row {index+2}: Specimen {specimen_import.accession}, {specimen_import.collection_date}, {specimen_import.organism} already exists{'' if dryrun else ', updating'}"
-                )
-            else:
-                specimen_record = models.Specimen(
-                    accession=specimen_import.accession,
-                    collection_date=specimen_import.collection_date,
-                    organism=specimen_import.organism,
-                )
-                session.add(specimen_record)
-                logger.info(
-                    f"Specimens Sheet Row {index+2}: Specimen {specimen_import.accession}, {specimen_import.collection_date}, {specimen_import.organism} does not exist{'' if dryrun else ', adding'}"
-                )
-            specimen_record.update_from_importmodel(specimen_import)
-            specimen_record.owner = owner_record
-            await session.flush()
+        else:
+            specimen_record = models.Specimen(
+                id=next(new_ids),
+                accession=specimen_import.accession,
+                collection_date=specimen_import.collection_date,
+                organism=specimen_import.organism,
+            )
+            session.add(specimen_record)
+            specimen_records[specimen_key(specimen_import)] = specimen_record
+            logger.info(
+                "Specimens Sheet Row %s: Specimen %s, %s, %s does not exist%s",
+                index + 2,
+                specimen_import.accession,
+                specimen_import.collection_date,
+                specimen_import.organism,
+                "" if dryrun else ", adding",
+                extra=row_log("specimens.added", "Specimens Sheet", index + 2),
+            )
+        specimen_record.update_from_importmodel(specimen_import)
+        specimen_record.owner = owner_record
 
-            await specimen_detail(session, specimen_record, specimen_import, logger)
+        specimen_values[specimen_record.id] = specimen_import
 
-        except ValidationError as err:
-            for error in err.errors():
-                logger.error(
-                    f"Specimens Sheet Row {index+2} {error['loc']} : {error['msg']}"
-                )
-        except DBAPIError as err:
-            logger.error(f"Specimens Sheet Row {index+2} : {err}")
+    await sync_details(
+        session, specimen_details, specimen_values, catalogs.specimen_detail_types
+    )
 
 
 async def owner(
@@ -149,274 +361,657 @@ async def owner(
     specimen_import: SpecimensImport,
     logger: CustomLogger,
     dryrun: bool,
+    owner_records: Optional[Dict[Tuple[str, str], models.Owner]] = None,
 ) -> models.Owner:
-    owner_record: models.Owner | None = await session.scalar(
-        select(models.Owner)
-        .filter(models.Owner.site == specimen_import.owner_site)
-        .filter(models.Owner.user == specimen_import.owner_user)
-        .limit(1)
-    )
+    """Find or add the owner of a specimen, from owner_records when they are preloaded"""
+    key = (specimen_import.owner_site, specimen_import.owner_user)
+
+    owner_record: models.Owner | None
+    if owner_records is not None:
+        owner_record = owner_records.get(key)
+    else:
+        owner_record = await session.scalar(
+            select(models.Owner)
+            .filter(models.Owner.site == specimen_import.owner_site)
+            .filter(models.Owner.user == specimen_import.owner_user)
+            .limit(1)
+        )
     if not owner_record:
         owner_record = models.Owner(
             site=specimen_import.owner_site, user=specimen_import.owner_user
         )
         session.add(owner_record)
+        if owner_records is not None:
+            owner_records[key] = owner_record
         logger.info(
-            f"Specimens Sheet Row {index+2}: Owner {specimen_import.owner_site}, {specimen_import.owner_user} does not exist{'' if dryrun else ', adding'}"
+            "Specimens Sheet Row %s: Owner %s, %s does not exist%s",
+            index + 2,
+            specimen_import.owner_site,
+            specimen_import.owner_user,
+            "" if dryrun else ", adding",
+            extra=row_log("owners.added", "Specimens Sheet", index + 2),
         )
     return owner_record
 
 
-async def specimen_detail(
-    session: AsyncSession,
-    specimen_record: models.Specimen,
-    specimen_import: SpecimensImport,
-    logger: CustomLogger,
-) -> None:
-    specimen_detail_types = await session.execute(select(models.SpecimenDetailType))
-
-    for specimen_detail_type in specimen_detail_types.scalars().all():
-        value = specimen_import[specimen_detail_type.code]
-
-        specimen_detail_record: models.SpecimenDetail | None = await session.scalar(
-            select(models.SpecimenDetail)
-            .filter(models.SpecimenDetail.specimen == specimen_record)
-            .filter(
-                models.SpecimenDetail.specimen_detail_type_code
-                == specimen_detail_type.code
+async def load_owners(
+    session: AsyncSession, keys: Iterable[Tuple[str, str]]
+) -> Dict[Tuple[str, str], models.Owner]:
+    """Fetch the owners matching the given (site, user) keys"""
+    owner_records: Dict[Tuple[str, str], models.Owner] = {}
+    for chunk in chunked(sorted(set(keys)), LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.Owner).filter(
+                tuple_(models.Owner.site, models.Owner.user).in_(chunk)
             )
-            .limit(1)
         )
-
-        if value is None:
-            if specimen_detail_record:
-                await session.delete(specimen_detail_record)
-            continue
-
-        if not specimen_detail_record:
-            specimen_detail_record = models.SpecimenDetail(
-                specimen=specimen_record,
-                specimen_detail_type_code=specimen_detail_type.code,
-            )
-            session.add(specimen_detail_record)
-
-        specimen_detail_record["value_" + specimen_detail_type.value_type] = value
+        owner_records.update(
+            {
+                (owner_record.site, owner_record.user): owner_record
+                for owner_record in result
+            }
+        )
+    return owner_records
 
 
 async def import_samples(
     session: AsyncSession,
-    data: List[Dict[str, Any]],
+    sample_imports: Dict[int, SamplesImport],
     logger: CustomLogger,
     dryrun: bool = False,
 ):
-    for index, row in enumerate(data):
-        try:
-            sample_import = SamplesImport(**row)
+    catalogs = await get_catalogs(session)
+    suffixes = spike_suffixes(sample_imports.values())
 
-            run_record = await find_run(session, sample_import.run_code)
-            specimen_record = await find_specimen(
-                session,
+    run_records = await load_runs(
+        session, (sample_import.run_code for sample_import in sample_imports.values())
+    )
+    specimen_records = await load_specimens(
+        session,
+        (specimen_key(sample_import) for sample_import in sample_imports.values()),
+    )
+    sample_records = await load_samples(
+        session, (sample_import.guid for sample_import in sample_imports.values())
+    )
+    new_guids = {
+        sample_import.guid for sample_import in sample_imports.values()
+    } - sample_records.keys()
+    new_ids = iter(await reserve_ids(session, models.Sample, len(new_guids)))
+
+    sample_values: Dict[int, SamplesImport] = {}
+    for index, sample_import in sample_imports.items():
+        run_record = run_records.get(sample_import.run_code)
+        if not run_record:
+            logger.error(
+                "Samples Sheet Row %s : Run %s not found",
+                index + 2,
+                sample_import.run_code,
+            )
+            logger.check_error_budget()
+            continue
+        specimen_record = specimen_records.get(specimen_key(sample_import))
+        if not specimen_record:
+            logger.error(
+                "Samples Sheet Row %s : Specimen %s, %s, %s not found",
+                index + 2,
                 sample_import.accession,
                 sample_import.collection_date,
                 sample_import.organism,
             )
+            logger.check_error_budget()
+            continue
 
-            sample_record: models.Sample | None = await session.scalar(
-                select(models.Sample)
-                .filter(models.Sample.guid == sample_import.guid)
-                .limit(1)
+        sample_record = sample_records.get(sample_import.guid)
+        if sample_record:
+            logger.info(
+                "Samples Sheet Row %s: Sample %s already exists%s",
+                index + 2,
+                sample_import.guid,
+                "" if dryrun else ", updating",
+                extra=row_log("samples.updated", "Samples Sheet", index + 2),
             )
+        else:
+            sample_record = models.Sample(id=next(new_ids))
+            session.add(sample_record)
+            sample_records[sample_import.guid] = sample_record
+            logger.info(
+                "Samples Sheet Row %s: Sample %s does not exist%s",
+                index + 2,
+                sample_import.guid,
+                "" if dryrun else ", adding",
+                extra=row_log("samples.added", "Samples Sheet", index + 2),
+            )
+        sample_record.update_from_importmodel(sample_import)
+        sample_record.run = run_record
+        sample_record.specimen = specimen_record
 
-            if sample_record:
-                logger.info(
-                    f"Samples Sheet Row {index+2}: Sample {sample_import.guid} already exists{'' if dryrun else ', updating'}"
-                )
-            else:
-                sample_record = models.Sample()
-                session.add(sample_record)
-                logger.info(
-                    f"Samples Sheet Row {index+2}: Sample {sample_import.guid} does not exist{'' if dryrun else ', adding'}"
-                )
-            sample_record.update_from_importmodel(sample_import)
-            sample_record.run = run_record
-            sample_record.specimen = specimen_record
+        sample_values[sample_record.id] = sample_import
+
+    await sync_details(
+        session, sample_details, sample_values, catalogs.sample_detail_types
+    )
+    await sync_spikes(session, sample_values, suffixes)
 
-            await session.flush()
 
-            await sample_detail(session, sample_record, sample_import)
+async def load_samples(
+    session: AsyncSession, guids: Iterable[str]
+) -> Dict[str, models.Sample]:
+    """Fetch the samples matching the given guids"""
+    sample_records: Dict[str, models.Sample] = {}
+    for chunk in chunked(sorted(set(guids)), LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.Sample).filter(models.Sample.guid.in_(chunk))
+        )
+        sample_records.update(
+            {sample_record.guid: sample_record for sample_record in result}
+        )
+    return sample_records
 
-            await spikes(session, sample_record, sample_import, index, logger)
 
-        except ValidationError as err:
-            for error in err.errors():
-                logger.error(
-                    f"Samples Sheet Row {index+2} {error['loc']} : {error['msg']}"
+def spike_suffixes(sample_imports: Iterable[SamplesImport]) -> List[int]:
+    """Find the N of the spike_name_N and spike_quantity_N columns of a sheet"""
+    columns = {
+        column
+        for sample_import in sample_imports
+        for column in sample_import.model_extra or {}
+    }
+    return sorted(
+        {
+            int(match.group(1))
+            for column in columns
+            if (match := spike_column_pattern.match(column))
+        }
+    )
+
+
+def is_blank(value: Any) -> bool:
+    return is_none_or_nan(value) or str(value).strip() == ""
+
+
+def sheet_spikes(
+    sample_import: SamplesImport, suffixes: List[int]
+) -> Tuple[Set[str], Dict[str, str]]:
+    """Read the spike names of a sample, and the quantities of those that have one"""
+    names: Set[str] = set()
+    quantities: Dict[str, str] = {}
+    for i in suffixes:
+        spike_name = sample_import.get(f"spike_name_{i}")
+        if is_blank(spike_name):
+            continue
+        spike_name = coerce_to_str(spike_name)
+        names.add(spike_name)
+
+        spike_quantity = sample_import.get(f"spike_quantity_{i}")
+        if not is_blank(spike_quantity):
+            quantities[spike_name] = coerce_to_str(spike_quantity)
+    return names, quantities
+
+
+async def sync_spikes(
+    session: AsyncSession,
+    sample_values: Dict[int, SamplesImport],
+    suffixes: List[int],
+) -> None:
+    """Make the spikes of each sample match its spike_name_N / spike_quantity_N pairs.
+
+    The existing spikes of every sample are loaded with one query per chunk of samples.
+    Spikes whose name is no longer in the sheet are deleted, a name without a quantity
+    leaves an existing spike as it is. Sheets without spike columns are left alone.
+    """
+    if not suffixes or not sample_values:
+        return
+
+    existing: Dict[int, Dict[str, models.Spike]] = {}
+    for chunk in chunked(sorted(sample_values), LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.Spike).filter(models.Spike.sample_id.in_(chunk))
+        )
+        for record in result:
+            existing.setdefault(record.sample_id, {})[record.name] = record
+
+    for sample_id, sample_import in sample_values.items():
+        names, quantities = sheet_spikes(sample_import, suffixes)
+        sample_spikes = existing.get(sample_id, {})
+        for spike_name, spike_quantity in quantities.items():
+            spike_record = sample_spikes.get(spike_name)
+            if spike_record is None:
+                session.add(
+                    models.Spike(
+                        sample_id=sample_id, name=spike_name, quantity=spike_quantity
+                    )
                 )
-        except ValueError as err:
-            logger.error(f"Samples Sheet Row {index+2} : {err}")
+            elif spike_record.quantity != spike_quantity:
+                spike_record.quantity = spike_quantity
+
+        for spike_name, spike_record in sample_spikes.items():
+            if spike_name not in names:
+                await session.delete(spike_record)
 
 
-async def find_run(session: AsyncSession, run_code: str) -> models.Run:
-    run_record: models.Run | None = await session.scalar(
-        select(models.Run).filter(models.Run.code == run_code).limit(1)
+async def import_storage(
+    session: AsyncSession,
+    storage_imports: Dict[int, StoragesImport],
+    logger: CustomLogger,
+    dryrun: bool = False,
+):
+    specimen_records = await load_specimens(
+        session,
+        (specimen_key(storage_import) for storage_import in storage_imports.values()),
     )
-    if not run_record:
-        raise ValueError(f"Run {run_code} not found")
-    return run_record
-
-
-async def find_specimen(
-    session: AsyncSession, accession: str, collection_date: date, organism: str | None
-) -> models.Specimen:
-    specimen_record: models.Specimen | None = await session.scalar(
-        select(models.Specimen)
-        .filter(models.Specimen.accession == accession)
-        .filter(models.Specimen.collection_date == collection_date)
-        .filter(models.Specimen.organism == organism)
-        .limit(1)
+    storage_records: Dict[Any, models.Storage] = {}
+    qr_codes = sorted(
+        {storage_import.storage_qr_code for storage_import in storage_imports.values()}
     )
-    if not specimen_record:
-        raise ValueError(
-            f"Specimen {accession}, {collection_date}, {organism} not found"
+    for chunk in chunked(qr_codes, LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.Storage).filter(models.Storage.storage_qr_code.in_(chunk))
+        )
+        storage_records.update(
+            {
+                storage_record.storage_qr_code: storage_record
+                for storage_record in result
+            }
         )
-    return specimen_record
 
+    for index, storage_import in storage_imports.items():
+        specimen_record = specimen_records.get(specimen_key(storage_import))
+        if not specimen_record:
+            logger.error(
+                "Storage Sheet Row %s : Specimen %s, %s, %s not found",
+                index + 2,
+                storage_import.accession,
+                storage_import.collection_date,
+                storage_import.organism,
+            )
+            logger.check_error_budget()
+            continue
 
-async def sample_detail(
-    session: AsyncSession, sample_record: models.Sample, sample_import: SamplesImport
-) -> None:
-    sample_detail_types = await session.execute(select(models.SampleDetailType))
+        storage_record = storage_records.get(storage_import.storage_qr_code)
+        if storage_record:
+            logger.info(
+                "Storage Sheet Row %s: Storage %s already exists%s",
+                index + 2,
+                storage_import.storage_qr_code,
+                "" if dryrun else ", updating",
+                extra=row_log("storage.updated", "Storage Sheet", index + 2),
+            )
+        else:
+            storage_record = models.Storage()
+            session.add(storage_record)
+            storage_records[storage_import.storage_qr_code] = storage_record
+            logger.info(
+                "Storage Sheet Row %s: Storage %s does not exist%s",
+                index + 2,
+                storage_import.storage_qr_code,
+                "" if dryrun else ", adding",
+                extra=row_log("storage.added", "Storage Sheet", index + 2),
+            )
+        storage_record.update_from_importmodel(storage_import)
+        storage_record.specimen = specimen_record
 
-    for sample_detail_type in sample_detail_types.scalars().all():
-        value = sample_import[sample_detail_type.code]
 
-        sample_detail_record: models.SampleDetail | None = await session.scalar(
-            select(models.SampleDetail)
-            .filter(models.SampleDetail.sample == sample_record)
-            .filter(
-                models.SampleDetail.sample_detail_type_code == sample_detail_type.code
+def specimen_key(
+    importmodel: SpecimensImport | SamplesImport | StoragesImport,
+) -> Tuple[str, date, str | None]:
+    return (importmodel.accession, importmodel.collection_date, importmodel.organism)
+
+
+async def load_specimens(
+    session: AsyncSession, keys: Iterable[Tuple[str, date, str | None]]
+) -> Dict[Tuple[str, date, str | None], models.Specimen]:
+    """Fetch the specimens matching the given (accession, collection_date, organism) keys.
+
+    The organism can be NULL, which never matches in an IN list, so the query is on
+    (accession, collection_date) and the organism is matched here.
+    """
+    unique_keys = set(keys)
+    pairs = sorted(
+        {(accession, collection_date) for accession, collection_date, _ in unique_keys}
+    )
+
+    specimen_records: Dict[Tuple[str, date, str | None], models.Specimen] = {}
+    for chunk in chunked(pairs, LOOKUP_CHUNK_SIZE):
+        result = await session.scalars(
+            select(models.Specimen).filter(
+                tuple_(models.Specimen.accession, models.Specimen.collection_date).in_(
+                    chunk
+                )
             )
-            .limit(1)
         )
+        for specimen_record in result:
+            key = (
+                specimen_record.accession,
+                specimen_record.collection_date,
+                specimen_record.organism,
+            )
+            if key in unique_keys:
+                specimen_records[key] = specimen_record
+    return specimen_records
 
-        if value is None:
-            if sample_detail_record:
-                await session.delete(sample_detail_record)
-            continue
 
-        if not sample_detail_record:
-            sample_detail_record = models.SampleDetail(
-                sample=sample_record,
-                sample_detail_type_code=sample_detail_type.code,
+async def upsert_runs(
+    session: AsyncSession,
+    run_imports: Dict[int, RunImport],
+    logger: CustomLogger,
+    dryrun: bool = False,
+    batch_size: int = config.IMPORT_BATCH_SIZE,
+):
+    try:
+        results = await upsert_rows(
+            session,
+            models.Run,
+            [
+                row_from_importmodel(models.Run, run_import)
+                for run_import in run_imports.values()
+            ],
+            key_columns=["code"],
+            constraint="uq_runs_code",
+            batch_size=batch_size,
+        )
+    except DBAPIError as err:
+        logger.error("Runs Sheet : %s", err)
+        return
+
+    for (index, run_import), result in zip(run_imports.items(), results):
+        if result.inserted:
+            logger.info(
+                "Runs Sheet Row %s: Run %s does not exist%s",
+                index + 2,
+                run_import.code,
+                "" if dryrun else ", adding",
+                extra=row_log("runs.added", "Runs Sheet", index + 2),
+            )
+        else:
+            logger.info(
+                "Runs Sheet Row %s: Run %s already exists%s",
+                index + 2,
+                run_import.code,
+                "" if dryrun else ", updating",
+                extra=row_log("runs.updated", "Runs Sheet", index + 2),
             )
-            session.add(sample_detail_record)
-
-        sample_detail_record["value_" + sample_detail_type.value_type] = value
 
 
-async def spikes(
+async def upsert_owners(
     session: AsyncSession,
-    sample_record: models.Sample,
-    sample_import: SamplesImport,
-    index: int,
+    specimen_imports: Dict[int, SpecimensImport],
     logger: CustomLogger,
-) -> None:
-    spikes_names: dict = {
-        k: v
-        for k, v in sample_import.model_dump().items()
-        if k.startswith("spike_name_")
-    }
-    spike_quantities: dict = {
-        k: v
-        for k, v in sample_import.model_dump().items()
-        if k.startswith("spike_quantity_")
-    }
-    spike_fields = spikes_names | spike_quantities
-
-    suffixes: List = []
-    for k in spike_fields:
-        match = re.search(r"\d+$", k)
-        if match is not None:
-            suffixes.append(int(match.group()))
-    # make sure the suffixes are unique
-    suffixes = list(set(suffixes))
+    dryrun: bool,
+) -> Dict[Tuple[str, str], int]:
+    """Find or add the owners of the given specimens, returning their ids by (site, user)"""
+    owner_keys = sorted(
+        {
+            (specimen_import.owner_site, specimen_import.owner_user)
+            for specimen_import in specimen_imports.values()
+        }
+    )
 
-    for i in suffixes:
-        spike_name: str = sample_import.get(f"spike_name_{i}", "")
-        spike_quantity: str = sample_import.get(f"spike_quantity_{i}", "")
+    owner_ids: Dict[Tuple[str, str], int] = {}
+    for chunk in chunked(owner_keys, LOOKUP_CHUNK_SIZE):
+        result = await session.execute(
+            select(models.Owner.id, models.Owner.site, models.Owner.user).filter(
+                tuple_(models.Owner.site, models.Owner.user).in_(chunk)
+            )
+        )
+        owner_ids.update({(site, user): id for id, site, user in result})
 
-        if is_none_or_nan(spike_name) or is_none_or_nan(spike_quantity):
-            continue
-        if is_none_or_nan(spike_name):
-            logger.error(f"Samples Sheet Row {index+2} : Spike name is required")
+    new_owners: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for index, specimen_import in specimen_imports.items():
+        key = (specimen_import.owner_site, specimen_import.owner_user)
+        if key in owner_ids or key in new_owners:
             continue
+        new_owners[key] = {"site": key[0], "user": key[1]}
+        logger.info(
+            "Specimens Sheet Row %s: Owner %s, %s does not exist%s",
+            index + 2,
+            key[0],
+            key[1],
+            "" if dryrun else ", adding",
+            extra=row_log("owners.added", "Specimens Sheet", index + 2),
+        )
 
-        spike_record: models.Spike | None = await session.scalar(
-            select(models.Spike)
-            .filter(models.Spike.sample == sample_record)
-            .filter(models.Spike.name == spike_name)
-            .limit(1)
+    for owners_chunk in chunked(new_owners.values(), LOOKUP_CHUNK_SIZE):
+        result = await session.execute(
+            insert(models.Owner)
+            .values(owners_chunk)
+            .returning(models.Owner.id, models.Owner.site, models.Owner.user)
         )
+        owner_ids.update({(site, user): id for id, site, user in result})
 
-        if not spike_record:
-            spike_record = models.Spike(sample=sample_record, name=spike_name)
-            session.add(spike_record)
+    return owner_ids
 
-        spike_record.quantity = spike_quantity
 
-        clean_spike_names = [x for x in spikes_names.values() if not is_none_or_nan(x)]
+async def upsert_specimens(
+    session: AsyncSession,
+    specimen_imports: Dict[int, SpecimensImport],
+    logger: CustomLogger,
+    dryrun: bool = False,
+    batch_size: int = config.IMPORT_BATCH_SIZE,
+):
+    catalogs = await get_catalogs(session)
 
-        rs_to_delete = await session.scalars(
-            select(models.Spike)
-            .filter(not_(models.Spike.name.in_(clean_spike_names)))
-            .filter(models.Spike.sample == sample_record)
+    try:
+        owner_ids = await upsert_owners(session, specimen_imports, logger, dryrun)
+        results = await upsert_rows(
+            session,
+            models.Specimen,
+            [
+                row_from_importmodel(models.Specimen, specimen_import)
+                | {
+                    "owner_id": owner_ids[
+                        (specimen_import.owner_site, specimen_import.owner_user)
+                    ]
+                }
+                for specimen_import in specimen_imports.values()
+            ],
+            key_columns=["accession", "collection_date", "organism"],
+            constraint="ux_specimen",
+            batch_size=batch_size,
         )
-        for record in rs_to_delete:
-            await session.delete(record)
+    except DBAPIError as err:
+        logger.error("Specimens Sheet : %s", err)
+        return
+
+    detail_values: Dict[int, SpecimensImport] = {}
+    for (index, specimen_import), result in zip(specimen_imports.items(), results):
+        if result.inserted:
+            logger.info(
+                "Specimens Sheet Row %s: Specimen %s, %s, %s does not exist%s",
+                index + 2,
+                specimen_import.accession,
+                specimen_import.collection_date,
+                specimen_import.organism,
+                "" if dryrun else ", adding",
+                extra=row_log("specimens.added", "Specimens Sheet", index + 2),
+            )
+        else:
+            logger.info(
+                "Specimens Sheet Row %s: Specimen %s, %s, %s already exists%s",
+                index + 2,
+                specimen_import.accession,
+                specimen_import.collection_date,
+                specimen_import.organism,
+                "" if dryrun else ", updating",
+                extra=row_log("specimens.updated", "Specimens Sheet", index + 2),
+            )
+        detail_values[result.id] = specimen_import
 
+    await sync_details(
+        session, specimen_details, detail_values, catalogs.specimen_detail_types
+    )
 
-async def import_storage(
+
+async def upsert_samples(
     session: AsyncSession,
-    data: List[Dict[str, Any]],
+    sample_imports: Dict[int, SamplesImport],
     logger: CustomLogger,
     dryrun: bool = False,
+    batch_size: int = config.IMPORT_BATCH_SIZE,
 ):
-    for index, row in enumerate(data):
-        try:
-            storage_import = StoragesImport(**row)
+    catalogs = await get_catalogs(session)
+
+    run_records = await load_runs(
+        session, (sample_import.run_code for sample_import in sample_imports.values())
+    )
+    specimen_records = await load_specimens(
+        session,
+        (
+            (
+                sample_import.accession,
+                sample_import.collection_date,
+                sample_import.organism,
+            )
+            for sample_import in sample_imports.values()
+        ),
+    )
+
+    # the rows whose run and specimen were found, leaving the caller's dict as it is
+    found: Dict[int, SamplesImport] = {}
+    rows: List[Dict[str, Any]] = []
+    for index, sample_import in sample_imports.items():
+        run_record = run_records.get(sample_import.run_code)
+        specimen_record = specimen_records.get(
+            (
+                sample_import.accession,
+                sample_import.collection_date,
+                sample_import.organism,
+            )
+        )
+        if not run_record:
+            logger.error(
+                "Samples Sheet Row %s : Run %s not found",
+                index + 2,
+                sample_import.run_code,
+            )
+            logger.check_error_budget()
+        elif not specimen_record:
+            logger.error(
+                "Samples Sheet Row %s : Specimen %s, %s, %s not found",
+                index + 2,
+                sample_import.accession,
+                sample_import.collection_date,
+                sample_import.organism,
+            )
+            logger.check_error_budget()
+        else:
+            row = row_from_importmodel(models.Sample, sample_import)
+            row["nucleic_acid_type"] = row["nucleic_acid_type"] or []
+            rows.append(
+                row | {"run_id": run_record.id, "specimen_id": specimen_record.id}
+            )
+            found[index] = sample_import
 
-            specimen_record = await find_specimen(
-                session,
+    try:
+        results = await upsert_rows(
+            session,
+            models.Sample,
+            rows,
+            key_columns=["guid"],
+            constraint="uq_samples_guid",
+            batch_size=batch_size,
+        )
+    except DBAPIError as err:
+        logger.error("Samples Sheet : %s", err)
+        return
+
+    sample_values: Dict[int, SamplesImport] = {}
+    for (index, sample_import), result in zip(found.items(), results):
+        if result.inserted:
+            logger.info(
+                "Samples Sheet Row %s: Sample %s does not exist%s",
+                index + 2,
+                sample_import.guid,
+                "" if dryrun else ", adding",
+                extra=row_log("samples.added", "Samples Sheet", index + 2),
+            )
+        else:
+            logger.info(
+                "Samples Sheet Row %s: Sample %s already exists%s",
+                index + 2,
+                sample_import.guid,
+                "" if dryrun else ", updating",
+                extra=row_log("samples.updated", "Samples Sheet", index + 2),
+            )
+        sample_values[result.id] = sample_import
+
+    await sync_details(
+        session, sample_details, sample_values, catalogs.sample_detail_types
+    )
+    await sync_spikes(session, sample_values, spike_suffixes(found.values()))
+
+
+async def upsert_storage(
+    session: AsyncSession,
+    storage_imports: Dict[int, StoragesImport],
+    logger: CustomLogger,
+    dryrun: bool = False,
+    batch_size: int = config.IMPORT_BATCH_SIZE,
+):
+    specimen_records = await load_specimens(
+        session,
+        (
+            (
                 storage_import.accession,
                 storage_import.collection_date,
                 storage_import.organism,
             )
+            for storage_import in storage_imports.values()
+        ),
+    )
 
-            storage_record: models.Storage | None = await session.scalar(
-                select(models.Storage)
-                .filter(
-                    models.Storage.storage_qr_code == storage_import.storage_qr_code
-                )
-                .limit(1)
+    # the rows whose specimen was found, leaving the caller's dict as it is
+    found: Dict[int, StoragesImport] = {}
+    rows: List[Dict[str, Any]] = []
+    for index, storage_import in storage_imports.items():
+        specimen_record = specimen_records.get(
+            (
+                storage_import.accession,
+                storage_import.collection_date,
+                storage_import.organism,
             )
+        )
+        if not specimen_record:
+            logger.error(
+                "Storage Sheet Row %s : Specimen %s, %s, %s not found",
+                index + 2,
+                storage_import.accession,
+                storage_import.collection_date,
+                storage_import.organism,
+            )
+            logger.check_error_budget()
+            continue
+        rows.append(
+            row_from_importmodel(models.Storage, storage_import)
+            | {"specimen_id": specimen_record.id}
+        )
+        found[index] = storage_import
 
-            if storage_record:
-                logger.info(
-                    f"Storage Sheet Row {index+2}: Storage {storage_import.storage_qr_code} already exists{'' if dryrun else ', updating'}"
-                )
-            else:
-                storage_record = models.Storage()
-                session.add(storage_record)
-                logger.info(
-                    f"Storage Sheet Row {index+2}: Storage {storage_import.storage_qr_code} does not exist{'' if dryrun else ', adding'}"
-                )
-            storage_record.update_from_importmodel(storage_import)
-            storage_record.specimen = specimen_record
-
-        except ValidationError as err:
-            for error in err.errors():
-                logger.error(
-                    f"Storage Sheet Row {index+2} {error['loc']} : {error['msg']}"
-                )
-        except ValueError as err:
-            logger.error(f"Storage Sheet Row {index+2} : {err}")
+    try:
+        results = await upsert_rows(
+            session,
+            models.Storage,
+            rows,
+            key_columns=["storage_qr_code"],
+            constraint="uq_storages_storage_qr_code",
+            batch_size=batch_size,
+        )
+    except DBAPIError as err:
+        logger.error("Storage Sheet : %s", err)
+        return
+
+    for (index, storage_import), result in zip(found.items(), results):
+        if result.inserted:
+            logger.info(
+                "Storage Sheet Row %s: Storage %s does not exist%s",
+                index + 2,
+                storage_import.storage_qr_code,
+                "" if dryrun else ", adding",
+                extra=row_log("storage.added", "Storage Sheet", index + 2),
+            )
+        else:
+            logger.info(
+                "Storage Sheet Row %s: Storage %s already exists%s",
+                index + 2,
+                storage_import.storage_qr_code,
+                "" if dryrun else ", updating",
+                extra=row_log("storage.updated", "Storage Sheet", index + 2),
+            )
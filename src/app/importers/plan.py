@@ -0,0 +1,1285 @@
+"""
+Dry run planning of spreadsheet imports.
+
+WorkbookPlanner reads the current state of every key a workbook touches, in bulk, and
+works out in memory what importing it would create, update and delete, with the
+before and after value of every changed field. Nothing is ever added to, changed in
+or deleted from the session, so a dry run issues no writes and sqlalchemy-continuum
+writes no version rows. plan_data plans a workbook, and plan_files sheet files read a
+chunk of rows at a time.
+
+Every existing row the planner reads, whether or not the plan changes it, is stamped
+with its xmin, read in the same snapshot as the plan, which every write changes,
+including the set based and COPY upserts that sqlalchemy-continuum does not version.
+A plan without errors is stored in the import_plans table until PLAN_TTL_SECONDS, so
+any worker can commit it, under a token hashing the uploaded rows and those stamps.
+commit_plan refuses a plan if any row it read has been written since, and otherwise
+writes exactly the planned changes, without validating or looking up the sheets
+again.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import ARRAY, delete, func, literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.catalogs import DetailType, get_catalogs
+from app.config import config
+from app.constants import LOOKUP_CHUNK_SIZE
+from app.importers.details import (
+    DetailTable,
+    load_details,
+    sample_details,
+    specimen_details,
+)
+from app.importers.import_spreadsheet import (
+    finish_upload,
+    load_owners,
+    load_runs,
+    load_samples,
+    load_specimens,
+    sheet_spikes,
+    specimen_key,
+    spike_suffixes,
+)
+from app.importers.validation import validate_sheet
+from app.logs import CustomLogger, ErrorBudgetExceeded, row_log
+from app.upload_models import (
+    ImportModel,
+    RunImport,
+    SamplesImport,
+    SpecimensImport,
+    StoragesImport,
+)
+from app.utils.utils import chunked
+
+Action = Literal["create", "update", "delete"]
+SpecimenKey = Tuple[str, date, Optional[str]]
+
+
+@dataclass(frozen=True)
+class FieldChange:
+    field: str
+    before: Any
+    after: Any
+
+
+@dataclass(frozen=True)
+class PlannedChange:
+    action: Action
+    table: str
+    key: Tuple[Any, ...]
+    sheet: str
+    row: int
+    fields: Tuple[FieldChange, ...] = ()
+    # the id of the row an update or delete writes
+    id: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "action": self.action,
+            "table": self.table,
+            "key": list(self.key),
+            "sheet": self.sheet,
+            "row": self.row,
+            "fields": [
+                {"field": f.field, "before": f.before, "after": f.after}
+                for f in self.fields
+            ],
+        }
+
+
+@dataclass
+class ImportPlan:
+    """The changes an import would make, at most one per table and key"""
+
+    changes: Dict[Tuple[str, Tuple[Any, ...]], PlannedChange] = field(
+        default_factory=dict
+    )
+    token: Optional[str] = None
+
+    def add(self, change: PlannedChange) -> None:
+        """Add a change, replacing any earlier change to the same row (last one wins)"""
+        self.changes[(change.table, change.key)] = change
+
+    def get(self, table: str, key: Tuple[Any, ...]) -> Optional[PlannedChange]:
+        return self.changes.get((table, key))
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Count the changes by table and action"""
+        counts: Dict[str, Dict[str, int]] = {}
+        for change in self.changes.values():
+            table_counts = counts.setdefault(change.table, {})
+            table_counts[change.action] = table_counts.get(change.action, 0) + 1
+        return counts
+
+    def to_dict(self, offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """The plan with one page of its changes, and the number of changes in all"""
+        end = None if limit is None else offset + limit
+        return {
+            "token": self.token,
+            "summary": self.summary(),
+            "changes": [
+                change.to_dict()
+                for change in islice(self.changes.values(), offset, end)
+            ],
+            "changeCount": len(self.changes),
+        }
+
+
+def values_differ(before: Any, after: Any) -> bool:
+    # array columns come back as [] where the sheet has nothing, and in any order
+    if isinstance(before, list) or isinstance(after, list):
+        return sorted(map(str, before or [])) != sorted(map(str, after or []))
+    return before != after
+
+
+def created_fields(
+    model: Type[models.GpasLocalModel], importmodel: ImportModel
+) -> List[FieldChange]:
+    """The fields update_from_importmodel would set on a new record"""
+    return [
+        FieldChange(name, None, importmodel[name])
+        for name in importmodel.model_fields
+        if hasattr(model, name) and importmodel[name] is not None
+    ]
+
+
+def updated_fields(
+    record: models.GpasLocalModel, importmodel: ImportModel
+) -> List[FieldChange]:
+    """The fields update_from_importmodel would change on an existing record"""
+    return [
+        FieldChange(name, record[name], importmodel[name])
+        for name in importmodel.model_fields
+        if hasattr(record, name) and values_differ(record[name], importmodel[name])
+    ]
+
+
+async def load_keys(
+    session: AsyncSession,
+    model: Type[models.GpasLocalModel],
+    ids: Sequence[int],
+    columns: Sequence[str],
+) -> Dict[int, Tuple[Any, ...]]:
+    """Fetch the natural key columns of the given records, keyed on id"""
+    keys: Dict[int, Tuple[Any, ...]] = {}
+    id_column = getattr(model, "id")
+    for chunk in chunked(sorted(set(ids)), LOOKUP_CHUNK_SIZE):
+        result = await session.execute(
+            select(id_column, *(getattr(model, column) for column in columns)).filter(
+                id_column.in_(chunk)
+            )
+        )
+        keys.update({id: tuple(key) for id, *key in result})
+    return keys
+
+
+# the tables a plan writes, in the order they are written so parents come first
+plan_tables: Dict[str, Type[models.GpasLocalModel]] = {
+    "owners": models.Owner,
+    "runs": models.Run,
+    "specimens": models.Specimen,
+    "specimen_details": models.SpecimenDetail,
+    "samples": models.Sample,
+    "sample_details": models.SampleDetail,
+    "spikes": models.Spike,
+    "storages": models.Storage,
+}
+
+# the columns that make up the key of each table named by its own columns
+key_columns: Dict[str, Tuple[str, ...]] = {
+    "owners": ("site", "user"),
+    "runs": ("code",),
+    "specimens": ("accession", "collection_date", "organism"),
+    "samples": ("guid",),
+    "storages": ("storage_qr_code",),
+}
+
+# the fields of a plan that name another row by its key, and the column they set
+link_fields: Dict[str, Tuple[str, str]] = {
+    "owner": ("owners", "owner_id"),
+    "run": ("runs", "run_id"),
+    "specimen": ("specimens", "specimen_id"),
+}
+
+detail_tables: Dict[str, DetailTable] = {
+    "specimen_details": specimen_details,
+    "sample_details": sample_details,
+}
+
+# the log code of each change to the rows of a sheet, as the importers log them
+applied_codes: Dict[Tuple[str, str], str] = {
+    ("owners", "create"): "owners.added",
+    ("runs", "create"): "runs.added",
+    ("runs", "update"): "runs.updated",
+    ("specimens", "create"): "specimens.added",
+    ("specimens", "update"): "specimens.updated",
+    ("samples", "create"): "samples.added",
+    ("samples", "update"): "samples.updated",
+    ("storages", "create"): "storage.added",
+    ("storages", "update"): "storage.updated",
+}
+applied_labels: Dict[str, str] = {
+    "create": "added",
+    "update": "updated",
+    "delete": "deleted",
+}
+
+
+def column_value(model: Type[models.GpasLocalModel], name: str, value: Any) -> Any:
+    """Read a column value back from the JSON a plan is stored as"""
+    columns = model.__table__.c  # type: ignore
+    if value is None or name not in columns:
+        return value
+    column_type = columns[name].type
+    if isinstance(column_type, ARRAY):
+        item_adapter = TypeAdapter(column_type.item_type.python_type)
+        return [item_adapter.validate_python(item) for item in value]
+    return TypeAdapter(column_type.python_type).validate_python(value)
+
+
+def decode_key(table: str, key: Sequence[Any]) -> Tuple[Any, ...]:
+    """Read the key of a planned change back from JSON"""
+    if table in detail_tables:
+        parent = "specimens" if table == "specimen_details" else "samples"
+        return (*decode_key(parent, key[:-1]), key[-1])
+    if table not in key_columns:
+        return tuple(key)
+    model = plan_tables[table]
+    return tuple(
+        column_value(model, column, value)
+        for column, value in zip(key_columns[table], key)
+    )
+
+
+def decode_change(values: Dict[str, Any]) -> PlannedChange:
+    """Read a stored change back, with its values typed as the planner made them"""
+    table = values["table"]
+    fields = []
+    for field_values in values["fields"]:
+        name, after = field_values["field"], field_values["after"]
+        if name in link_fields:
+            target = link_fields[name][0]
+            # a run is named by its code alone
+            after = after if target == "runs" else decode_key(target, after)
+        else:
+            after = column_value(plan_tables[table], name, after)
+        fields.append(FieldChange(name, field_values["before"], after))
+    return PlannedChange(
+        values["action"],
+        table,
+        decode_key(table, values["key"]),
+        values["sheet"],
+        values["row"],
+        tuple(fields),
+        values["id"],
+    )
+
+
+async def row_stamps(
+    session: AsyncSession,
+    table: str,
+    ids: Iterable[int],
+    lock: bool = False,
+) -> Dict[int, str]:
+    """Fetch the xmin of each of the given rows, which every write to a row changes.
+
+    Args:
+        session (AsyncSession): The database session.
+        table (str): The table of the rows.
+        ids (Iterable[int]): The ids of the rows.
+        lock (bool, optional): Lock the rows until the transaction ends.
+
+    Returns:
+        Dict[int, str]: The xmin of each row that still exists, by id.
+    """
+    id_column = getattr(plan_tables[table], "id")
+    stamps: Dict[int, str] = {}
+    for chunk in chunked(sorted(set(ids)), LOOKUP_CHUNK_SIZE):
+        query = select(id_column, literal_column("xmin::text")).filter(
+            id_column.in_(chunk)
+        )
+        if lock:
+            query = query.with_for_update()
+        result = await session.execute(query)
+        stamps.update({id: stamp for id, stamp in result})
+    return stamps
+
+
+async def stamp_rows(
+    session: AsyncSession, read: Dict[str, Set[int]]
+) -> Dict[str, Dict[str, str]]:
+    """Stamp every row the planner read, as the xmin of each id by table"""
+    return {
+        table: {
+            str(id): stamp
+            for id, stamp in (await row_stamps(session, table, ids)).items()
+        }
+        for table, ids in read.items()
+        if ids
+    }
+
+
+def plan_token(digest: "hashlib._Hash", stamps: Dict[str, Dict[str, str]]) -> str:
+    """Finish the hash of the uploaded rows with the stamps of the rows planned from"""
+    digest.update(json.dumps(stamps, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+async def store_plan(
+    session: AsyncSession,
+    token: str,
+    plan: ImportPlan,
+    stamps: Dict[str, Dict[str, str]],
+) -> None:
+    """Store a plan until PLAN_TTL_SECONDS, dropping expired plans.
+
+    The same upload planned again at the same database state has the same token, and
+    only renews the stored plan.
+
+    Args:
+        session (AsyncSession): The database session, which is committed.
+        token (str): The token of the plan, from plan_token.
+        plan (ImportPlan): The plan.
+        stamps (Dict[str, Dict[str, str]]): The stamps of the rows read, from stamp_rows.
+    """
+    StoredPlan = models.StoredPlan
+    await session.execute(
+        delete(StoredPlan).filter(StoredPlan.expires_at <= func.now())
+    )
+
+    changes = [
+        {
+            **jsonable_encoder(change.to_dict(), custom_encoder={Decimal: str}),
+            "id": change.id,
+        }
+        for change in plan.changes.values()
+    ]
+    insert_stmt = insert(StoredPlan).values(
+        token=token,
+        changes=changes,
+        stamps=stamps,
+        expires_at=func.now() + timedelta(seconds=config.PLAN_TTL_SECONDS),
+    )
+    await session.execute(
+        insert_stmt.on_conflict_do_update(
+            index_elements=[StoredPlan.token],
+            set_={
+                "changes": insert_stmt.excluded.changes,
+                "stamps": insert_stmt.excluded.stamps,
+                "expires_at": insert_stmt.excluded.expires_at,
+            },
+        )
+    )
+    await session.commit()
+
+
+async def take_plan(
+    session: AsyncSession, token: str
+) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Dict[str, str]]]]:
+    """Remove the changes and stamps of an unexpired plan, so it is only committed once.
+
+    The plan is removed in the session's transaction, so it is kept if the commit
+    fails and is rolled back.
+    """
+    StoredPlan = models.StoredPlan
+    result = await session.execute(
+        delete(StoredPlan)
+        .filter(StoredPlan.token == token, StoredPlan.expires_at > func.now())
+        .returning(StoredPlan.changes, StoredPlan.stamps)
+    )
+    stored = result.first()
+    return (stored.changes, stored.stamps) if stored else None
+
+
+async def stale_rows(session: AsyncSession, stamps: Dict[str, Dict[str, str]]) -> int:
+    """Count the rows read by the planner that have been written or deleted since.
+
+    The rows are locked until the transaction ends, so none can be written between
+    this check and the commit. Rows created since the plan need no stamp, as a new
+    row with a planned key fails the unique key of its table.
+    """
+    stale = 0
+    for table, planned in stamps.items():
+        current = await row_stamps(session, table, map(int, planned), lock=True)
+        stale += sum(current.get(int(id)) != stamp for id, stamp in planned.items())
+    return stale
+
+
+async def key_ids(
+    session: AsyncSession, table: str, keys: Iterable[Any]
+) -> Dict[Any, int]:
+    """The ids of the owners, runs, specimens or samples with the given keys"""
+    loaders: Dict[str, Any] = {
+        "owners": load_owners,
+        "runs": load_runs,
+        "specimens": load_specimens,
+        "samples": load_samples,
+    }
+    records = await loaders[table](session, keys)
+    return {key: record.id for key, record in records.items()}
+
+
+def parent_key(table: str, key: Tuple[Any, ...]) -> Tuple[str, Any]:
+    """The table and key of the specimen or sample a detail or spike row belongs to"""
+    if table == "specimen_details":
+        return "specimens", key[:-1]
+    return "samples", key[0]
+
+
+def new_row_values(
+    table: str, key: Tuple[Any, ...], ids: Dict[str, Dict[Any, int]]
+) -> Dict[str, Any]:
+    """The columns of a new detail or spike row that come from its key"""
+    if table not in detail_tables and table != "spikes":
+        return {}
+    parent, parent_id = parent_key(table, key)
+    if table == "spikes":
+        return {"sample_id": ids[parent][parent_id], "name": key[1]}
+    detail_table = detail_tables[table]
+    return {
+        detail_table.parent_column: ids[parent][parent_id],
+        detail_table.type_column: key[-1],
+    }
+
+
+async def apply_plan(
+    session: AsyncSession, changes: List[PlannedChange], logger: CustomLogger
+) -> None:
+    """Write exactly the planned changes, a table at a time with parents first.
+
+    Rows are written through the session, so sqlalchemy-continuum records their
+    versions as for any other upload.
+    """
+    by_table: Dict[str, List[PlannedChange]] = {}
+    for change in changes:
+        by_table.setdefault(change.table, []).append(change)
+
+    for table, model in plan_tables.items():
+        table_changes = by_table.get(table, [])
+        if not table_changes:
+            continue
+
+        # the rows these changes name, some of which earlier tables have just added
+        named: Dict[str, Set[Any]] = {}
+        for change in table_changes:
+            if table in detail_tables or table == "spikes":
+                parent, key = parent_key(table, change.key)
+                named.setdefault(parent, set()).add(key)
+            for field_change in change.fields:
+                if field_change.field in link_fields:
+                    target = link_fields[field_change.field][0]
+                    named.setdefault(target, set()).add(field_change.after)
+        ids = {
+            target: await key_ids(session, target, keys)
+            for target, keys in named.items()
+        }
+
+        id_column = getattr(model, "id")
+        records: Dict[int, Any] = {}
+        existing = [change.id for change in table_changes if change.id is not None]
+        for chunk in chunked(sorted(existing), LOOKUP_CHUNK_SIZE):
+            result = await session.scalars(select(model).filter(id_column.in_(chunk)))
+            records.update({record["id"]: record for record in result})
+
+        for change in table_changes:
+            if change.action == "delete":
+                await session.delete(records[change.id])  # type: ignore
+            else:
+                if change.action == "update":
+                    record = records[change.id]  # type: ignore
+                else:
+                    record = model(**new_row_values(table, change.key, ids))
+                    session.add(record)
+                for field_change in change.fields:
+                    if field_change.field in link_fields:
+                        target, column = link_fields[field_change.field]
+                        record[column] = ids[target][field_change.after]
+                    else:
+                        record[field_change.field] = field_change.after
+
+            code = applied_codes.get((table, change.action))
+            logger.info(
+                "%s Row %s: %s %s %s",
+                change.sheet,
+                change.row,
+                table,
+                ", ".join(map(str, change.key)),
+                applied_labels[change.action],
+                extra=row_log(code, change.sheet, change.row) if code else None,
+            )
+
+        await session.flush()
+
+
+class WorkbookPlanner:
+    """Plan the import of the sheets of a workbook, in the order they are imported"""
+
+    def __init__(self, session: AsyncSession, logger: CustomLogger):
+        self.session = session
+        self.logger = logger
+        self.plan = ImportPlan()
+        # the ids of the existing rows read, by table, stamped once planned
+        self.read: Dict[str, Set[int]] = {}
+
+    def saw(self, table: str, records: Iterable[Any]) -> None:
+        """Note the existing rows the plan was made from"""
+        self.read.setdefault(table, set()).update(record.id for record in records)
+
+    def saw_ids(self, table: str, ids: Iterable[int]) -> None:
+        self.read.setdefault(table, set()).update(ids)
+
+    async def plan_runs(self, run_imports: Dict[int, RunImport]) -> None:
+        run_records = await load_runs(
+            self.session, (run_import.code for run_import in run_imports.values())
+        )
+        self.saw("runs", run_records.values())
+
+        for index, run_import in run_imports.items():
+            key = (run_import.code,)
+            run_record = run_records.get(run_import.code)
+            if run_record or self.plan.get("runs", key):
+                self.logger.info(
+                    "Runs Sheet Row %s: Run %s already exists",
+                    index + 2,
+                    run_import.code,
+                    extra=row_log("runs.updated", "Runs Sheet", index + 2),
+                )
+            else:
+                self.logger.info(
+                    "Runs Sheet Row %s: Run %s does not exist",
+                    index + 2,
+                    run_import.code,
+                    extra=row_log("runs.added", "Runs Sheet", index + 2),
+                )
+
+            if run_record:
+                fields = updated_fields(run_record, run_import)
+                if fields:
+                    self.plan.add(
+                        PlannedChange(
+                            "update",
+                            "runs",
+                            key,
+                            "Runs Sheet",
+                            index + 2,
+                            tuple(fields),
+                            run_record.id,
+                        )
+                    )
+            else:
+                self.plan.add(
+                    PlannedChange(
+                        "create",
+                        "runs",
+                        key,
+                        "Runs Sheet",
+                        index + 2,
+                        tuple(created_fields(models.Run, run_import)),
+                    )
+                )
+
+    async def plan_specimens(
+        self, specimen_imports: Dict[int, SpecimensImport]
+    ) -> None:
+        catalogs = await get_catalogs(self.session)
+
+        owner_records = await load_owners(
+            self.session,
+            (
+                (specimen_import.owner_site, specimen_import.owner_user)
+                for specimen_import in specimen_imports.values()
+            ),
+        )
+        specimen_records = await load_specimens(
+            self.session,
+            (
+                specimen_key(specimen_import)
+                for specimen_import in specimen_imports.values()
+            ),
+        )
+        owner_keys = await load_keys(
+            self.session,
+            models.Owner,
+            [specimen_record.owner_id for specimen_record in specimen_records.values()],
+            ["site", "user"],
+        )
+        self.saw("owners", owner_records.values())
+        self.saw("specimens", specimen_records.values())
+        self.saw_ids("owners", owner_keys)
+
+        details: Dict[SpecimenKey, Tuple[int, Optional[int], ImportModel]] = {}
+        for index, specimen_import in specimen_imports.items():
+            owner = (specimen_import.owner_site, specimen_import.owner_user)
+            owner_record = owner_records.get(owner)
+            if not owner_record and not self.plan.get("owners", owner):
+                self.logger.info(
+                    "Specimens Sheet Row %s: Owner %s, %s does not exist",
+                    index + 2,
+                    owner[0],
+                    owner[1],
+                    extra=row_log("owners.added", "Specimens Sheet", index + 2),
+                )
+                self.plan.add(
+                    PlannedChange(
+                        "create",
+                        "owners",
+                        owner,
+                        "Specimens Sheet",
+                        index + 2,
+                        (
+                            FieldChange("site", None, owner[0]),
+                            FieldChange("user", None, owner[1]),
+                        ),
+                    )
+                )
+
+            key = specimen_key(specimen_import)
+            specimen_record = specimen_records.get(key)
+            if specimen_record or self.plan.get("specimens", key):
+                self.logger.info(
+                    "Specimens Sheet Row %s: Specimen %s, %s, %s already exists",
+                    index + 2,
+                    specimen_import.accession,
+                    specimen_import.collection_date,
+                    specimen_import.organism,
+                    extra=row_log("specimens.updated", "Specimens Sheet", index + 2),
+                )
+            else:
+                self.logger.info(
+                    "Specimens Sheet Row %s: Specimen %s, %s, %s does not exist",
+                    index + 2,
+                    specimen_import.accession,
+                    specimen_import.collection_date,
+                    specimen_import.organism,
+                    extra=row_log("specimens.added", "Specimens Sheet", index + 2),
+                )
+
+            if specimen_record:
+                fields = updated_fields(specimen_record, specimen_import)
+                before_owner = owner_keys.get(specimen_record.owner_id)
+                if before_owner != owner:
+                    fields.append(FieldChange("owner", before_owner, owner))
+                if fields:
+                    self.plan.add(
+                        PlannedChange(
+                            "update",
+                            "specimens",
+                            key,
+                            "Specimens Sheet",
+                            index + 2,
+                            tuple(fields),
+                            specimen_record.id,
+                        )
+                    )
+            else:
+                self.plan.add(
+                    PlannedChange(
+                        "create",
+                        "specimens",
+                        key,
+                        "Specimens Sheet",
+                        index + 2,
+                        tuple(
+                            created_fields(models.Specimen, specimen_import)
+                            + [FieldChange("owner", None, owner)]
+                        ),
+                    )
+                )
+
+            details[key] = (
+                index,
+                specimen_record.id if specimen_record else None,
+                specimen_import,
+            )
+
+        await self.plan_details(
+            specimen_details,
+            "Specimens Sheet",
+            details,
+            catalogs.specimen_detail_types,
+        )
+
+    async def plan_samples(self, sample_imports: Dict[int, SamplesImport]) -> None:
+        catalogs = await get_catalogs(self.session)
+        suffixes = spike_suffixes(sample_imports.values())
+
+        run_records = await load_runs(
+            self.session,
+            (sample_import.run_code for sample_import in sample_imports.values()),
+        )
+        specimen_records = await load_specimens(
+            self.session,
+            (specimen_key(sample_import) for sample_import in sample_imports.values()),
+        )
+        sample_records = await load_samples(
+            self.session,
+            (sample_import.guid for sample_import in sample_imports.values()),
+        )
+        run_codes = await load_keys(
+            self.session,
+            models.Run,
+            [sample_record.run_id for sample_record in sample_records.values()],
+            ["code"],
+        )
+        sample_specimen_keys = await load_keys(
+            self.session,
+            models.Specimen,
+            [sample_record.specimen_id for sample_record in sample_records.values()],
+            ["accession", "collection_date", "organism"],
+        )
+        self.saw("runs", run_records.values())
+        self.saw("specimens", specimen_records.values())
+        self.saw("samples", sample_records.values())
+        self.saw_ids("runs", run_codes)
+        self.saw_ids("specimens", sample_specimen_keys)
+
+        details: Dict[Tuple[str], Tuple[int, Optional[int], ImportModel]] = {}
+        spikes: Dict[Tuple[str], Tuple[int, Optional[int], SamplesImport]] = {}
+        for index, sample_import in sample_imports.items():
+            run_code = sample_import.run_code
+            if run_code not in run_records and not self.plan.get("runs", (run_code,)):
+                self.logger.error(
+                    "Samples Sheet Row %s : Run %s not found",
+                    index + 2,
+                    sample_import.run_code,
+                )
+                self.logger.check_error_budget()
+                continue
+            specimen = specimen_key(sample_import)
+            if specimen not in specimen_records and not self.plan.get(
+                "specimens", specimen
+            ):
+                self.logger.error(
+                    "Samples Sheet Row %s : Specimen %s, %s, %s not found",
+                    index + 2,
+                    sample_import.accession,
+                    sample_import.collection_date,
+                    sample_import.organism,
+                )
+                self.logger.check_error_budget()
+                continue
+
+            key = (sample_import.guid,)
+            sample_record = sample_records.get(sample_import.guid)
+            if sample_record or self.plan.get("samples", key):
+                self.logger.info(
+                    "Samples Sheet Row %s: Sample %s already exists",
+                    index + 2,
+                    sample_import.guid,
+                    extra=row_log("samples.updated", "Samples Sheet", index + 2),
+                )
+            else:
+                self.logger.info(
+                    "Samples Sheet Row %s: Sample %s does not exist",
+                    index + 2,
+                    sample_import.guid,
+                    extra=row_log("samples.added", "Samples Sheet", index + 2),
+                )
+
+            if sample_record:
+                fields = updated_fields(sample_record, sample_import)
+                before_run = run_codes.get(sample_record.run_id, (None,))[0]
+                if before_run != run_code:
+                    fields.append(FieldChange("run", before_run, run_code))
+                before_specimen = sample_specimen_keys.get(sample_record.specimen_id)
+                if before_specimen != specimen:
+                    fields.append(FieldChange("specimen", before_specimen, specimen))
+                if fields:
+                    self.plan.add(
+                        PlannedChange(
+                            "update",
+                            "samples",
+                            key,
+                            "Samples Sheet",
+                            index + 2,
+                            tuple(fields),
+                            sample_record.id,
+                        )
+                    )
+            else:
+                self.plan.add(
+                    PlannedChange(
+                        "create",
+                        "samples",
+                        key,
+                        "Samples Sheet",
+                        index + 2,
+                        tuple(
+                            created_fields(models.Sample, sample_import)
+                            + [
+                                FieldChange("run", None, run_code),
+                                FieldChange("specimen", None, specimen),
+                            ]
+                        ),
+                    )
+                )
+
+            parent = (index, sample_record.id if sample_record else None, sample_import)
+            details[key] = parent
+            spikes[key] = parent
+
+        await self.plan_details(
+            sample_details, "Samples Sheet", details, catalogs.sample_detail_types
+        )
+        await self.plan_spikes(spikes, suffixes)
+
+    async def plan_storage(self, storage_imports: Dict[int, StoragesImport]) -> None:
+        specimen_records = await load_specimens(
+            self.session,
+            (
+                specimen_key(storage_import)
+                for storage_import in storage_imports.values()
+            ),
+        )
+        storage_records: Dict[Any, models.Storage] = {}
+        qr_codes = sorted(
+            {
+                storage_import.storage_qr_code
+                for storage_import in storage_imports.values()
+            }
+        )
+        for chunk in chunked(qr_codes, LOOKUP_CHUNK_SIZE):
+            result = await self.session.scalars(
+                select(models.Storage).filter(models.Storage.storage_qr_code.in_(chunk))
+            )
+            storage_records.update(
+                {
+                    storage_record.storage_qr_code: storage_record
+                    for storage_record in result
+                }
+            )
+        storage_specimen_keys = await load_keys(
+            self.session,
+            models.Specimen,
+            [storage_record.specimen_id for storage_record in storage_records.values()],
+            ["accession", "collection_date", "organism"],
+        )
+        self.saw("specimens", specimen_records.values())
+        self.saw("storages", storage_records.values())
+        self.saw_ids("specimens", storage_specimen_keys)
+
+        for index, storage_import in storage_imports.items():
+            specimen = specimen_key(storage_import)
+            if specimen not in specimen_records and not self.plan.get(
+                "specimens", specimen
+            ):
+                self.logger.error(
+                    "Storage Sheet Row %s : Specimen %s, %s, %s not found",
+                    index + 2,
+                    storage_import.accession,
+                    storage_import.collection_date,
+                    storage_import.organism,
+                )
+                self.logger.check_error_budget()
+                continue
+
+            key = (storage_import.storage_qr_code,)
+            storage_record = storage_records.get(storage_import.storage_qr_code)
+            if storage_record or self.plan.get("storages", key):
+                self.logger.info(
+                    "Storage Sheet Row %s: Storage %s already exists",
+                    index + 2,
+                    storage_import.storage_qr_code,
+                    extra=row_log("storage.updated", "Storage Sheet", index + 2),
+                )
+            else:
+                self.logger.info(
+                    "Storage Sheet Row %s: Storage %s does not exist",
+                    index + 2,
+                    storage_import.storage_qr_code,
+                    extra=row_log("storage.added", "Storage Sheet", index + 2),
+                )
+
+            if storage_record:
+                fields = updated_fields(storage_record, storage_import)
+                before_specimen = storage_specimen_keys.get(storage_record.specimen_id)
+                if before_specimen != specimen:
+                    fields.append(FieldChange("specimen", before_specimen, specimen))
+                if fields:
+                    self.plan.add(
+                        PlannedChange(
+                            "update",
+                            "storages",
+                            key,
+                            "Storage Sheet",
+                            index + 2,
+                            tuple(fields),
+                            storage_record.id,
+                        )
+                    )
+            else:
+                self.plan.add(
+                    PlannedChange(
+                        "create",
+                        "storages",
+                        key,
+                        "Storage Sheet",
+                        index + 2,
+                        tuple(
+                            created_fields(models.Storage, storage_import)
+                            + [FieldChange("specimen", None, specimen)]
+                        ),
+                    )
+                )
+
+    async def plan_details(
+        self,
+        table: DetailTable,
+        sheet: str,
+        parents: Dict[Any, Tuple[int, Optional[int], ImportModel]],
+        detail_types: Sequence[DetailType],
+    ) -> None:
+        """Plan the detail rows of each parent, following the rules of sync_details.
+
+        Args:
+            table (DetailTable): The detail table.
+            sheet (str): The sheet the parents come from.
+            parents (Dict[Any, Tuple[int, Optional[int], ImportModel]]): The row index,
+                id (None for new parents) and import model of each parent, by its key.
+            detail_types (Sequence[DetailType]): The detail types to plan.
+        """
+        existing = await load_details(
+            self.session,
+            table,
+            (parent_id for _, parent_id, _ in parents.values() if parent_id),
+        )
+        tablename = table.model.__tablename__
+        self.saw(tablename, existing.values())
+
+        for parent_key, (index, parent_id, importmodel) in parents.items():
+            for detail_type in detail_types:
+                value = importmodel[detail_type.code]
+                value_column = "value_" + detail_type.value_type
+                record = (
+                    existing.get((parent_id, detail_type.code)) if parent_id else None
+                )
+                key = (*parent_key, detail_type.code)
+
+                if value is None:
+                    if record is not None:
+                        self.plan.add(
+                            PlannedChange(
+                                "delete",
+                                tablename,
+                                key,
+                                sheet,
+                                index + 2,
+                                (
+                                    FieldChange(
+                                        value_column, record[value_column], None
+                                    ),
+                                ),
+                                record.id,
+                            )
+                        )
+                elif record is None:
+                    self.plan.add(
+                        PlannedChange(
+                            "create",
+                            tablename,
+                            key,
+                            sheet,
+                            index + 2,
+                            (FieldChange(value_column, None, value),),
+                        )
+                    )
+                elif record[value_column] != value:
+                    self.plan.add(
+                        PlannedChange(
+                            "update",
+                            tablename,
+                            key,
+                            sheet,
+                            index + 2,
+                            (FieldChange(value_column, record[value_column], value),),
+                            record.id,
+                        )
+                    )
+
+    async def plan_spikes(
+        self,
+        samples: Dict[Tuple[str], Tuple[int, Optional[int], SamplesImport]],
+        suffixes: List[int],
+    ) -> None:
+        """Plan the spikes of each sample, following the rules of sync_spikes"""
+        if not suffixes or not samples:
+            return
+
+        sample_ids = [sample_id for _, sample_id, _ in samples.values() if sample_id]
+        existing: Dict[int, Dict[str, models.Spike]] = {}
+        for chunk in chunked(sorted(sample_ids), LOOKUP_CHUNK_SIZE):
+            result = await self.session.scalars(
+                select(models.Spike).filter(models.Spike.sample_id.in_(chunk))
+            )
+            for record in result:
+                existing.setdefault(record.sample_id, {})[record.name] = record
+                self.saw_ids("spikes", [record.id])
+
+        for (guid,), (index, sample_id, sample_import) in samples.items():
+            names, quantities = sheet_spikes(sample_import, suffixes)
+            sample_spikes = existing.get(sample_id, {}) if sample_id else {}
+
+            for spike_name, spike_quantity in quantities.items():
+                spike_record = sample_spikes.get(spike_name)
+                if spike_record is None:
+                    self.plan.add(
+                        PlannedChange(
+                            "create",
+                            "spikes",
+                            (guid, spike_name),
+                            "Samples Sheet",
+                            index + 2,
+                            (FieldChange("quantity", None, spike_quantity),),
+                        )
+                    )
+                elif spike_record.quantity != spike_quantity:
+                    self.plan.add(
+                        PlannedChange(
+                            "update",
+                            "spikes",
+                            (guid, spike_name),
+                            "Samples Sheet",
+                            index + 2,
+                            (
+                                FieldChange(
+                                    "quantity", spike_record.quantity, spike_quantity
+                                ),
+                            ),
+                            spike_record.id,
+                        )
+                    )
+
+            for spike_name, spike_record in sample_spikes.items():
+                if spike_name not in names:
+                    self.plan.add(
+                        PlannedChange(
+                            "delete",
+                            "spikes",
+                            (guid, spike_name),
+                            "Samples Sheet",
+                            index + 2,
+                            (FieldChange("quantity", spike_record.quantity, None),),
+                            spike_record.id,
+                        )
+                    )
+
+
+async def one_chunk(rows: List[Dict[str, Any]]) -> AsyncIterator[List[Dict[str, Any]]]:
+    yield rows
+
+
+async def plan_data(
+    session: AsyncSession,
+    Runs: List[Dict[str, Any]],
+    Specimens: List[Dict[str, Any]],
+    Samples: List[Dict[str, Any]],
+    Storage: List[Dict[str, Any]],
+    logger: CustomLogger,
+) -> Optional[ImportPlan]:
+    """Dry run a workbook, returning what importing it would change.
+
+    Args:
+        session (AsyncSession): The database session, only ever read from.
+        Runs (List[Dict[str, Any]]): The rows of the runs sheet.
+        Specimens (List[Dict[str, Any]]): The rows of the specimens sheet.
+        Samples (List[Dict[str, Any]]): The rows of the samples sheet.
+        Storage (List[Dict[str, Any]]): The rows of the storage sheet.
+        logger (CustomLogger): The request logger.
+
+    Returns:
+        Optional[ImportPlan]: The plan, or None if any error was logged.
+    """
+    logger.info(
+        "Verifying data against the database from Excel Workbook. Dry run enabled"
+    )
+    return await plan_sheets(
+        session,
+        [one_chunk(Runs), one_chunk(Specimens), one_chunk(Samples), one_chunk(Storage)],
+        logger,
+    )
+
+
+async def plan_files(
+    session: AsyncSession,
+    Runs: AsyncIterable[List[Dict[str, Any]]],
+    Specimens: AsyncIterable[List[Dict[str, Any]]],
+    Samples: AsyncIterable[List[Dict[str, Any]]],
+    Storage: AsyncIterable[List[Dict[str, Any]]],
+    logger: CustomLogger,
+) -> Optional[ImportPlan]:
+    """Dry run uploaded sheet files, a chunk of rows at a time, as import_files reads them.
+
+    Only one chunk of each sheet is held at once, though the plan holds every change.
+
+    Args:
+        session (AsyncSession): The database session, only ever read from.
+        Runs (AsyncIterable[List[Dict[str, Any]]]): Chunks of rows of the runs sheet.
+        Specimens (AsyncIterable[List[Dict[str, Any]]]): Chunks of rows of the specimens sheet.
+        Samples (AsyncIterable[List[Dict[str, Any]]]): Chunks of rows of the samples sheet.
+        Storage (AsyncIterable[List[Dict[str, Any]]]): Chunks of rows of the storage sheet.
+        logger (CustomLogger): The request logger.
+
+    Returns:
+        Optional[ImportPlan]: The plan, or None if any error was logged.
+    """
+    logger.info("Verifying data against the database from sheet files. Dry run enabled")
+    return await plan_sheets(session, [Runs, Specimens, Samples, Storage], logger)
+
+
+async def plan_sheets(
+    session: AsyncSession,
+    sheets: Sequence[AsyncIterable[List[Dict[str, Any]]]],
+    logger: CustomLogger,
+) -> Optional[ImportPlan]:
+    """Plan the chunks of the runs, specimens, samples and storage sheets, and store the plan"""
+    planner = WorkbookPlanner(session, logger)
+    steps: List[Tuple[Type[ImportModel], str, Any]] = [
+        (RunImport, "Runs Sheet", planner.plan_runs),
+        (SpecimensImport, "Specimens Sheet", planner.plan_specimens),
+        (SamplesImport, "Samples Sheet", planner.plan_samples),
+        (StoragesImport, "Storage Sheet", planner.plan_storage),
+    ]
+    stamps: Dict[str, Dict[str, str]] = {}
+    digest = hashlib.sha256()
+    try:
+        # every read sees the same snapshot, so each stamp is of the row planned from
+        await session.connection(
+            execution_options={"isolation_level": "REPEATABLE READ"}
+        )
+
+        for chunks, (import_model, sheet, plan_sheet) in zip(sheets, steps):
+            start = 0
+            async for data in chunks:
+                imports = await validate_sheet(
+                    import_model, data, logger, sheet, start=start
+                )
+                start += len(data)
+                for row in data:
+                    digest.update(
+                        json.dumps([sheet, row], sort_keys=True, default=str).encode(
+                            "utf-8"
+                        )
+                    )
+
+                # once a row has failed the rest are only validated
+                if not logger.error_occurred:  # type: ignore
+                    with session.no_autoflush:
+                        await plan_sheet(imports)
+
+        if not logger.error_occurred:  # type: ignore
+            stamps = await stamp_rows(session, planner.read)
+
+    except ErrorBudgetExceeded as err:
+        logger.error(str(err))
+
+    except Exception as e:
+        logger.error("Failed to plan upload: %s", e)
+
+    # nothing was written, this only ends the read transaction
+    await session.rollback()
+
+    # only a plan without errors can be committed
+    if not logger.error_occurred:  # type: ignore
+        try:
+            token = plan_token(digest, stamps)
+            await store_plan(session, token, planner.plan, stamps)
+            planner.plan.token = token
+        except Exception as e:
+            await session.rollback()
+            logger.error("Failed to store plan: %s", e)
+
+    if logger.error_occurred:  # type: ignore
+        logger.error("Upload failed, please see log messages for details")
+        return None
+
+    logger.info("Dry run mode, no data was uploaded")
+    return planner.plan
+
+
+async def page_plan(
+    session: AsyncSession, token: str, offset: int = 0, limit: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """One page of the changes of a stored plan, or None if it has been committed or expired"""
+    StoredPlan = models.StoredPlan
+    changes = await session.scalar(
+        select(StoredPlan.changes).filter(
+            StoredPlan.token == token, StoredPlan.expires_at > func.now()
+        )
+    )
+    if changes is None:
+        return None
+
+    plan = ImportPlan(token=token)
+    for values in changes:
+        plan.add(decode_change(values))
+    return plan.to_dict(offset, limit)
+
+
+async def commit_plan(session: AsyncSession, token: str, logger: CustomLogger) -> bool:
+    """Write the changes a dry run planned, without validating the sheets again.
+
+    The plan is refused if it has expired or if any row it was planned from has been
+    written since, in which case the dry run has to be repeated.
+
+    Args:
+        session (AsyncSession): The database session.
+        token (str): The token the dry run returned.
+        logger (CustomLogger): The request logger.
+
+    Returns:
+        bool: Whether the upload succeeded.
+    """
+    logger.info(
+        "Uploading planned data to database from Excel Workbook, plan %s", token
+    )
+
+    try:
+        stored = await take_plan(session, token)
+        if stored is None:
+            logger.error(
+                "Plan %s not found or expired, please run the dry run again", token
+            )
+        elif stale := await stale_rows(session, stored[1]):
+            logger.error(
+                "Plan %s is out of date, %s rows it was planned from have changed since the dry run, please run the dry run again",
+                token,
+                stale,
+            )
+        else:
+            await apply_plan(
+                session, [decode_change(values) for values in stored[0]], logger
+            )
+
+    except ErrorBudgetExceeded as err:
+        logger.error(str(err))
+
+    except Exception as e:
+        logger.error("Failed to upload data: %s", e)
+
+    finally:
+        return await finish_upload(session, logger, False)
@@ -0,0 +1,38 @@
+"""
+Client side primary key assignment.
+
+Reserving ids from a table's sequence up front lets the importers build whole
+batches of parent and child records, linked by id, without flushing after every
+row just to find out what id the database gave a new record.
+"""
+
+from typing import List, Type
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import GpasLocalModel
+
+
+async def reserve_ids(
+    session: AsyncSession, model: Type[GpasLocalModel], count: int
+) -> List[int]:
+    """Reserve count ids from the sequence behind model's id column in one round trip.
+
+    Args:
+        session (AsyncSession): The database session.
+        model (Type[GpasLocalModel]): The model whose ids to reserve.
+        count (int): The number of ids to reserve.
+
+    Returns:
+        List[int]: The reserved ids.
+    """
+    if count <= 0:
+        return []
+
+    result = await session.scalars(
+        select(
+            func.nextval(func.pg_get_serial_sequence(model.__tablename__, "id"))
+        ).select_from(func.generate_series(1, count))
+    )
+    return list(result)
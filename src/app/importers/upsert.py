@@ -0,0 +1,192 @@
+"""
+Set-based INSERT ... ON CONFLICT ... DO UPDATE helpers used by the bulk import path.
+
+Rows are sent as multi-row INSERT statements of at most batch_size rows, keyed on an
+existing unique constraint. Each statement returns the id of every affected row and
+whether it was inserted (xmax = 0) or updated, so the importers can still log one
+line per sheet row.
+
+Uploads of at least IMPORT_COPY_ROWS rows of a table (0 turns this off) skip the parameterised INSERTs:
+the rows are streamed into a temporary staging table with COPY, which asyncpg encodes
+in its binary format without any per-row statement handling, and upserted from there
+with a single INSERT ... SELECT ... ON CONFLICT. INSERT ... ON CONFLICT is used rather
+than MERGE as MERGE can not report which rows it inserted before Postgres 17.
+
+Please note these statements bypass the ORM unit of work, so sqlalchemy-continuum
+does not write version rows for anything written through them.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence, Tuple, Type, cast
+
+import asyncpg
+from sqlalchemy import Table, column, literal_column, select, table, text
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.util import identity_key
+
+from app.config import config
+from app.models import GpasLocalModel
+from app.upload_models import ImportModel
+from app.utils.utils import chunked
+
+# columns that are maintained by the database and never sent by the importers
+excluded_columns = {"id", "created_by", "created_at", "updated_by", "updated_at"}
+
+
+@dataclass(frozen=True)
+class UpsertResult:
+    id: int
+    inserted: bool
+
+
+def row_from_importmodel(
+    model: Type[GpasLocalModel], importmodel: ImportModel
+) -> Dict[str, Any]:
+    """Build the column values for model from importmodel, mirroring update_from_importmodel"""
+    return {
+        column.name: importmodel[column.name]
+        for column in model.__table__.columns
+        if column.name not in excluded_columns
+        and column.name in importmodel.model_fields
+    }
+
+
+async def upsert_rows(
+    session: AsyncSession,
+    model: Type[GpasLocalModel],
+    rows: List[Dict[str, Any]],
+    key_columns: Sequence[str],
+    constraint: str,
+    batch_size: int = config.IMPORT_BATCH_SIZE,
+) -> List[UpsertResult]:
+    """Insert or update rows, returning one result per row in the order given.
+
+    Rows sharing a key are collapsed into a single row (last one wins), as Postgres
+    refuses to update the same row twice in one statement. Only the first of those
+    rows reports inserted, matching the row by row importers.
+
+    Args:
+        session (AsyncSession): The database session.
+        model (Type[GpasLocalModel]): The model for the table being written.
+        rows (List[Dict[str, Any]]): Column values, every row must have the same keys.
+        key_columns (Sequence[str]): The columns of the unique constraint.
+        constraint (str): The name of the unique constraint to resolve conflicts on.
+        batch_size (int, optional): Maximum number of rows per statement.
+
+    Returns:
+        List[UpsertResult]: The id of each row and whether it was inserted.
+    """
+    target = cast(Table, model.__table__)
+
+    def key_of(row: Any) -> Tuple[Any, ...]:
+        return tuple(row[column] for column in key_columns)
+
+    unique_rows: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for row in rows:
+        unique_rows[key_of(row)] = row
+
+    results: Dict[Tuple[Any, ...], UpsertResult] = {}
+    if config.IMPORT_COPY_ROWS and len(unique_rows) >= config.IMPORT_COPY_ROWS:
+        statements = [
+            await copy_to_staging(session, target, list(unique_rows.values()))
+        ]
+    else:
+        statements = [
+            insert(target).values(batch)
+            for batch in chunked(unique_rows.values(), batch_size)
+        ]
+    for insert_stmt in statements:
+        upsert_stmt = insert_stmt.on_conflict_do_update(
+            constraint=constraint,
+            set_={
+                name: insert_stmt.excluded[name]
+                for name in next(iter(unique_rows.values()))
+                if name not in key_columns
+            },
+        ).returning(
+            target.c.id,
+            *(target.c[name] for name in key_columns),
+            literal_column("xmax = 0").label("inserted"),
+        )
+        for returned in await session.execute(upsert_stmt):
+            results[key_of(returned._mapping)] = UpsertResult(
+                returned.id, returned.inserted
+            )
+
+    # any instances already loaded into the session are now stale
+    for result in results.values():
+        instance = session.identity_map.get(identity_key(model, result.id))
+        if instance is not None:
+            session.expire(instance)
+
+    ordered_results: List[UpsertResult] = []
+    seen = set()
+    for row in rows:
+        key = key_of(row)
+        result = results[key]
+        ordered_results.append(
+            UpsertResult(result.id, result.inserted and key not in seen)
+        )
+        seen.add(key)
+    return ordered_results
+
+
+async def copy_to_staging(
+    session: AsyncSession, target: Table, rows: List[Dict[str, Any]]
+) -> Insert:
+    """COPY rows into a temporary staging table, returning the INSERT that reads them.
+
+    The staging table has just the columns of the rows, with the types of the target
+    table and none of its constraints, and is dropped at the end of the transaction.
+    Values are converted by the bind processors of the column types, as SQLAlchemy
+    does for an INSERT, so COPY sends exactly what the batched statements would.
+
+    Args:
+        session (AsyncSession): The database session.
+        target (Table): The table being written.
+        rows (List[Dict[str, Any]]): Column values, every row must have the same keys.
+
+    Raises:
+        DBAPIError: If Postgres rejects the rows.
+
+    Returns:
+        Insert: INSERT INTO target ... SELECT ... FROM the staging table.
+    """
+    conn = await session.connection()
+    dialect = conn.dialect
+    quote = dialect.identifier_preparer.quote
+    names = list(rows[0])
+    staging = f"staging_{target.name}"
+
+    await session.execute(text(f"DROP TABLE IF EXISTS {quote(staging)}"))
+    await session.execute(
+        text(
+            f"CREATE TEMPORARY TABLE {quote(staging)} ON COMMIT DROP AS "
+            f"SELECT {', '.join(quote(name) for name in names)} "
+            f"FROM {quote(target.name)} WITH NO DATA"
+        )
+    )
+
+    processors = [
+        target.c[name].type.dialect_impl(dialect).bind_processor(dialect)
+        for name in names
+    ]
+    records = [
+        tuple(
+            value if process is None or value is None else process(value)
+            for process, value in zip(processors, (row[name] for name in names))
+        )
+        for row in rows
+    ]
+    raw = await conn.get_raw_connection()
+    driver: Any = raw.driver_connection
+    try:
+        await driver.copy_records_to_table(staging, records=records, columns=names)
+    except (asyncpg.PostgresError, asyncpg.InterfaceError) as err:
+        # asyncpg raises its own errors for COPY, which SQLAlchemy has not wrapped
+        raise DBAPIError(f"COPY {staging}", None, err) from err
+
+    staged = table(staging, *(column(name) for name in names))
+    return insert(target).from_select(names, select(*staged.c))
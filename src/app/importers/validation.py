@@ -0,0 +1,147 @@
+"""
+Validation stage of the importers.
+
+Every row of a sheet is validated against its import model before any database work
+is done, so a sheet with a bad row near the end fails straight away and reports all
+of its errors at once. Large sheets are split across a pool of worker processes, as
+pydantic validation is CPU bound and would otherwise block the event loop.
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
+
+from pydantic import ValidationError
+
+from app.config import config
+from app.logs import CustomLogger, row_log
+from app.upload_models import ImportModel
+
+M = TypeVar("M", bound=ImportModel)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+@dataclass(frozen=True)
+class RowError:
+    index: int
+    loc: Tuple[Any, ...]
+    msg: str
+
+
+def validate_rows(
+    import_model: Type[M],
+    rows: Sequence[Dict[str, Any]],
+    start: int = 0,
+    indexes: Optional[Sequence[int]] = None,
+) -> Tuple[Dict[int, M], List[RowError]]:
+    """Validate rows against import_model, numbering them from start.
+
+    This runs in the worker processes, so it only takes and returns picklable values.
+
+    Args:
+        import_model (Type[M]): The import model to validate against.
+        rows (Sequence[Dict[str, Any]]): The rows to validate.
+        start (int, optional): The index of the first row in its sheet.
+        indexes (Optional[Sequence[int]], optional): The index of each row in its
+            sheet, instead of numbering them from start.
+
+    Returns:
+        Tuple[Dict[int, M], List[RowError]]: The valid rows by index and the errors.
+    """
+    valid: Dict[int, M] = {}
+    errors: List[RowError] = []
+    for index, row in zip(indexes or range(start, start + len(rows)), rows):
+        try:
+            valid[index] = import_model(**row)
+        except ValidationError as err:
+            errors.extend(
+                RowError(index, tuple(error["loc"]), error["msg"])
+                for error in err.errors()
+            )
+    return valid, errors
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn rather than fork, forking a process with a running event loop is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=config.VALIDATION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the validation worker processes, if they were started"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def validate_sheet(
+    import_model: Type[M],
+    data: Sequence[Dict[str, Any]],
+    logger: CustomLogger,
+    sheet: str,
+    start: int = 0,
+    parallel_rows: int = config.VALIDATION_PARALLEL_ROWS,
+    indexes: Optional[Sequence[int]] = None,
+) -> Dict[int, M]:
+    """Validate every row of a sheet, logging each error against its sheet row.
+
+    Sheets of at least parallel_rows rows are validated in the process pool, smaller
+    ones in this process where starting the workers would cost more than it saves.
+
+    Args:
+        import_model (Type[M]): The import model to validate against.
+        data (Sequence[Dict[str, Any]]): The rows of the sheet.
+        logger (CustomLogger): The logger to report the errors to.
+        sheet (str): The name of the sheet used in the log messages, e.g. "Runs Sheet".
+        start (int, optional): The index of the first row, when data is part of a sheet.
+        parallel_rows (int, optional): The smallest sheet to validate in parallel.
+        indexes (Optional[Sequence[int]], optional): The index of each row, when some
+            rows of the sheet were left out of data.
+
+    Returns:
+        Dict[int, M]: The validated rows, keyed on their index in the sheet.
+    """
+    workers = config.VALIDATION_WORKERS
+    if workers < 2 or len(data) < parallel_rows:
+        valid, errors = validate_rows(import_model, data, start, indexes)
+    else:
+        loop = asyncio.get_running_loop()
+        chunk_size = -(-len(data) // workers)
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    get_pool(),
+                    validate_rows,
+                    import_model,
+                    data[offset : offset + chunk_size],
+                    start + offset,
+                    indexes[offset : offset + chunk_size] if indexes else None,
+                )
+                for offset in range(0, len(data), chunk_size)
+            )
+        )
+        valid, errors = {}, []
+        for chunk_valid, chunk_errors in results:
+            valid.update(chunk_valid)
+            errors.extend(chunk_errors)
+
+    for error in errors:
+        logger.error(
+            "%s Row %s %s : %s",
+            sheet,
+            error.index + 2,
+            error.loc,
+            error.msg,
+            extra=row_log("validation.failed", sheet, error.index + 2),
+        )
+        logger.check_error_budget()
+    return valid
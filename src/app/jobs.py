@@ -0,0 +1,387 @@
+"""
+Background import jobs.
+
+The enqueue endpoints store the upload in the import_jobs table and return its id
+straight away, rather than importing it inside the request. Worker processes, started
+with
+
+    PYTHONPATH=src python -m app.jobs
+
+claim the oldest queued job with FOR UPDATE SKIP LOCKED, so any number of workers can
+poll the same table without ever claiming the same job, run the import and store its
+result and logs on the job for the status endpoint. Throughput scales by starting more
+workers, and the API processes never run an import themselves.
+
+While a job runs its latest progress event is stored on it, which the events endpoint
+streams to the client as Server-Sent Events. A spreadsheet dry run is planned rather
+than written and rolled back, and the first page of its plan is stored on the job.
+
+A worker holds a lease on the job it runs, renewing heartbeat_at every
+JOB_HEARTBEAT_SECONDS outside the import's transaction. A running job is only claimed
+again once its lease has not been renewed for JOB_LEASE_SECONDS, when the worker that
+claimed it has died, so a long import that is still running is never run twice. A
+worker whose job was claimed again all the same, e.g. after a long pause, finds so when
+it stores the result and rolls its import back rather than committing it.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app import models
+from app.config import config
+from app.constants import JobKind
+from app.db import dispose_engine, init_engine
+from app.importers.import_gpas import import_mutation, import_summary
+from app.importers.import_spreadsheet import import_data
+from app.importers.plan import ImportPlan, plan_data
+from app.importers.validation import shutdown_pool
+from app.logs import CustomLogger, LogEntry, format_entries, make_logger
+from app.progress import Listener, ProgressEvent
+
+logger = logging.getLogger(__name__)
+
+# what each kind of job is called in its result message
+job_labels: Dict[str, str] = {
+    "spreadsheet": "Excel",
+    "summary": "Summary",
+    "mutation": "Mutation",
+}
+
+
+async def enqueue_job(session: AsyncSession, kind: JobKind, payload: Dict) -> int:
+    """Queue an upload to be imported by a worker, returning the id of its job"""
+    result = await session.execute(
+        insert(models.ImportJob)
+        .values(kind=kind, payload=payload)
+        .returning(models.ImportJob.id)
+    )
+    job_id = result.scalar_one()
+    await session.commit()
+    return job_id
+
+
+async def get_job(session: AsyncSession, job_id: int) -> Optional[models.ImportJob]:
+    return await session.get(models.ImportJob, job_id)
+
+
+async def claim_job(
+    session: AsyncSession, worker: str
+) -> Optional[Tuple[int, str, Dict]]:
+    """Claim the oldest queued job, or one whose worker's lease has expired.
+
+    The job is selected and marked as running in a single statement, skipping any job
+    another worker has locked in the meantime, and committed straight away so the
+    status endpoint sees it running.
+
+    Args:
+        session (AsyncSession): The database session.
+        worker (str): The name of this worker, stored on the job.
+
+    Returns:
+        Optional[Tuple[int, str, Dict]]: The id, kind and payload of the job, or None.
+    """
+    ImportJob = models.ImportJob
+    expired = func.now() - timedelta(seconds=config.JOB_LEASE_SECONDS)
+    next_job = (
+        select(ImportJob.id)
+        .filter(
+            or_(
+                ImportJob.status == "queued",
+                (ImportJob.status == "running") & (ImportJob.heartbeat_at < expired),
+            )
+        )
+        .order_by(ImportJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        update(ImportJob)
+        .filter(ImportJob.id == next_job)
+        .values(
+            status="running",
+            started_at=func.now(),
+            heartbeat_at=func.now(),
+            worker=worker,
+        )
+        .returning(ImportJob.id, ImportJob.kind, ImportJob.payload)
+    )
+    job = result.first()
+    await session.commit()
+    return tuple(job) if job else None  # type: ignore
+
+
+async def get_job_state(
+    session: AsyncSession, job_id: int
+) -> Optional[Tuple[str, Optional[str], Optional[Dict]]]:
+    """Fetch the status, result message and latest progress event of a job"""
+    result = await session.execute(
+        select(
+            models.ImportJob.status, models.ImportJob.msg, models.ImportJob.progress
+        ).filter(models.ImportJob.id == job_id)
+    )
+    state = result.first()
+    return tuple(state) if state else None  # type: ignore
+
+
+async def renew_lease(engine: AsyncEngine, job_id: int, worker: str) -> None:
+    """Stamp the heartbeat of a job every JOB_HEARTBEAT_SECONDS until cancelled.
+
+    Each heartbeat is committed in its own session, outside the import's transaction,
+    and only renews the lease while the job is still claimed by this worker.
+    """
+    ImportJob = models.ImportJob
+    while True:
+        await asyncio.sleep(config.JOB_HEARTBEAT_SECONDS)
+        async with AsyncSession(engine) as session:
+            await session.execute(
+                update(ImportJob)
+                .filter(ImportJob.id == job_id, ImportJob.worker == worker)
+                .values(heartbeat_at=func.now())
+            )
+            await session.commit()
+
+
+def save_progress(engine: AsyncEngine, job_id: int) -> Listener:
+    """A progress listener that stores each event on the job, outside the import's transaction"""
+
+    async def listener(event: ProgressEvent) -> None:
+        async with AsyncSession(engine) as session:
+            await session.execute(
+                update(models.ImportJob)
+                .filter(models.ImportJob.id == job_id)
+                .values(progress=event.to_dict())
+            )
+            await session.commit()
+
+    return listener
+
+
+def job_logs(job_logger: CustomLogger) -> Dict[str, Any]:
+    """The collected logs of a job, stored unformatted so they can be paged later"""
+    collector = job_logger.json_handler
+    return {
+        "entries": [entry.to_json() for entry in collector.entries],
+        "summary": job_logger.log_summary(),
+        "count": job_logger.log_count,
+    }
+
+
+def page_job_logs(
+    logs: Optional[Dict[str, Any]], offset: int = 0, limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """Format one page of the stored logs of a job, as the upload endpoints return them"""
+    logs = logs or {}
+    entries = [LogEntry.from_json(values) for values in logs.get("entries", [])]
+    return {
+        "logs": format_entries(entries, offset, limit),
+        "logSummary": logs.get("summary", []),
+        "logCount": logs.get("count", 0),
+    }
+
+
+async def run_job(
+    session: AsyncSession, kind: str, payload: Dict, job_logger: CustomLogger
+) -> Optional[ImportPlan]:
+    """Run the import of a job with the arguments its upload endpoint was given.
+
+    Returns:
+        Optional[ImportPlan]: The plan of a spreadsheet dry run without errors.
+    """
+    job_logger.max_errors = payload.get("maxErrors")
+    dryrun = payload.get("dryRun", False)
+
+    if kind == "spreadsheet" and dryrun:
+        return await plan_data(
+            session=session,
+            Runs=payload["Runs"],
+            Specimens=payload["Specimens"],
+            Samples=payload["Samples"],
+            Storage=payload["Storage"],
+            logger=job_logger,
+        )
+    elif kind == "spreadsheet":
+        await import_data(
+            session=session,
+            Runs=payload["Runs"],
+            Specimens=payload["Specimens"],
+            Samples=payload["Samples"],
+            Storage=payload["Storage"],
+            logger=job_logger,
+            bulk=payload.get("bulk", False),
+        )
+    elif kind == "summary":
+        await import_summary(
+            session=session,
+            Summary=payload["Summary"],
+            Mapping=payload.get("Mapping"),
+            logger=job_logger,
+            dryrun=dryrun,
+            bulk=payload.get("bulk", False),
+        )
+    elif kind == "mutation":
+        await import_mutation(
+            session=session,
+            Mutation=payload["Mutation"],
+            Mapping=payload.get("Mapping"),
+            logger=job_logger,
+            dryrun=dryrun,
+            bulk=payload.get("bulk", False),
+        )
+    else:
+        job_logger.error("Unknown import job kind %s", kind)
+    return None
+
+
+async def finish_job(
+    session: AsyncSession,
+    job_id: int,
+    worker: str,
+    kind: str,
+    payload: Dict,
+    job_logger: CustomLogger,
+    plan: Optional[ImportPlan] = None,
+) -> bool:
+    """Store the result and logs of a job, in the same form the upload endpoints return.
+
+    The result is only stored while the job is still running under this worker. If its
+    lease expired and another worker claimed it, nothing is stored and the session is
+    rolled back.
+
+    Returns:
+        bool: Whether this worker still held the job.
+    """
+    ImportJob = models.ImportJob
+    label = job_labels.get(kind, kind)
+    if job_logger.error_occurred:
+        status, msg = "failed", f"{label} uploaded failed"
+    else:
+        status = "succeeded"
+        msg = f"{label} uploaded successfully" + (
+            " (dry run)" if payload.get("dryRun") else ""
+        )
+
+    result = await session.execute(
+        update(ImportJob)
+        .filter(
+            ImportJob.id == job_id,
+            ImportJob.worker == worker,
+            ImportJob.status == "running",
+        )
+        .values(
+            status=status,
+            msg=msg,
+            logs=job_logs(job_logger),
+            plan=(
+                jsonable_encoder(plan.to_dict(limit=config.PLAN_PAGE_SIZE))
+                if plan is not None
+                else None
+            ),
+            finished_at=func.now(),
+        )
+        .returning(ImportJob.id)
+    )
+    if result.first() is None:
+        await session.rollback()
+        logger.warning("%s no longer holds import job %s", worker, job_id)
+        return False
+    await session.commit()
+    return True
+
+
+async def run_and_finish(
+    engine: AsyncEngine,
+    job_id: int,
+    worker: str,
+    kind: str,
+    payload: Dict,
+    job_logger: CustomLogger,
+) -> bool:
+    """Run a claimed job and store its result, committing the import only with the job.
+
+    A dry run writes nothing but its plan, so runs in its own session. A real import
+    runs inside an outer transaction, where the importers' own commits and rollbacks
+    only end a savepoint, and that transaction is committed along with the job's result
+    only if finish_job finds this worker still holds the job. Otherwise the import is
+    rolled back, leaving the job to the worker that claimed it since.
+
+    Returns:
+        bool: Whether this worker still held the job.
+    """
+    if payload.get("dryRun"):
+        plan = None
+        try:
+            # the importers commit or roll back their own session
+            async with AsyncSession(engine) as session:
+                plan = await run_job(session, kind, payload, job_logger)
+        except Exception as e:
+            job_logger.error("Import job failed: %s", e)
+
+        async with AsyncSession(engine) as session:
+            return await finish_job(
+                session, job_id, worker, kind, payload, job_logger, plan
+            )
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        async with AsyncSession(
+            conn, join_transaction_mode="create_savepoint"
+        ) as session:
+            try:
+                await run_job(session, kind, payload, job_logger)
+            except Exception as e:
+                await session.rollback()
+                job_logger.error("Import job failed: %s", e)
+            held = await finish_job(session, job_id, worker, kind, payload, job_logger)
+
+        if held:
+            await transaction.commit()
+        else:
+            await transaction.rollback()
+        return held
+
+
+async def work(worker: str, once: bool = False) -> None:
+    """Claim and run jobs until cancelled, polling every JOB_POLL_SECONDS when idle.
+
+    Args:
+        worker (str): The name of this worker, stored on the jobs it claims.
+        once (bool, optional): Stop once there are no jobs left to claim.
+    """
+    engine = init_engine()
+    try:
+        while True:
+            async with AsyncSession(engine) as session:
+                job = await claim_job(session, worker)
+            if job is None:
+                if once:
+                    return
+                await asyncio.sleep(config.JOB_POLL_SECONDS)
+                continue
+
+            job_id, kind, payload = job
+            logger.info("%s running %s import job %s", worker, kind, job_id)
+            job_logger = make_logger(f"labbox-job{job_id}")
+            job_logger.progress.listeners.append(save_progress(engine, job_id))
+            lease = asyncio.create_task(renew_lease(engine, job_id, worker))
+            try:
+                await run_and_finish(engine, job_id, worker, kind, payload, job_logger)
+            finally:
+                lease.cancel()
+            job_logger.clear_logs()
+    finally:
+        await dispose_engine()
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(work(f"{socket.gethostname()}:{os.getpid()}"))
@@ -1,18 +1,34 @@
 import logging
 import sys
-from typing import Callable
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
 
 from fastapi import Request, Response
 
+from app.config import config
+from app.progress import Progress, Stage
+
+
+class ErrorBudgetExceeded(Exception):
+    """Raised to stop an upload once it has logged as many errors as it is allowed"""
+
+    def __init__(self, max_errors: int):
+        super().__init__(
+            f"Stopped after {max_errors} errors, the remaining rows were not checked"
+        )
+        self.max_errors = max_errors
+
 
 class ErrorCheckHandler(logging.StreamHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.error_occurred = False
+        self.error_count = 0
 
     def emit(self, record):
         if record.levelno == logging.ERROR:
             self.error_occurred = True
+            self.error_count += 1
         # we don't want to emit anything, as that is handle by the click handler,
         # so do not call super
         # super().emit(record)
@@ -21,8 +37,10 @@ class ErrorCheckHandler(logging.StreamHandler):
 class CustomLogger(logging.Logger):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.json_handler = JsonHandler()
+        self.json_handler = LogCollector()
         self.addHandler(self.json_handler)
+        self.max_errors: Optional[int] = None
+        self.progress = Progress(lambda: self.error_count)
 
     @property
     def error_occurred(self) -> bool:
@@ -32,37 +50,208 @@ class CustomLogger(logging.Logger):
             if isinstance(handler, ErrorCheckHandler)
         )
 
-    def get_logs(self):
-        return self.json_handler.get_logs()
+    @property
+    def error_count(self) -> int:
+        return sum(
+            handler.error_count
+            for handler in self.handlers
+            if isinstance(handler, ErrorCheckHandler)
+        )
+
+    def check_error_budget(self) -> None:
+        """Raise ErrorBudgetExceeded once max_errors errors have been logged"""
+        if self.max_errors is not None and self.error_count >= self.max_errors:
+            raise ErrorBudgetExceeded(self.max_errors)
+
+    async def stage(self, stage: Stage) -> None:
+        """Report that the import has moved on to stage"""
+        await self.progress.start(stage)
+
+    async def advance(self, rows: int) -> None:
+        """Report that rows more rows of the current stage have been processed"""
+        await self.progress.advance(rows)
+
+    async def finish_stages(self) -> None:
+        """Report that the import has finished"""
+        await self.progress.finish()
+
+    def get_logs(
+        self, offset: int = 0, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Format a page of the collected logs, as the upload endpoints return them"""
+        return self.json_handler.get_logs(offset, limit)
+
+    def log_summary(self) -> List[Dict[str, Any]]:
+        """Count the per row logs by level and code, e.g. 3,200 runs updated"""
+        return self.json_handler.summary()
+
+    @property
+    def log_count(self) -> int:
+        """The number of log records, including the INFO records dropped over the cap"""
+        return len(self.json_handler.entries) + self.json_handler.dropped
+
+    def log_response(self) -> Dict[str, Any]:
+        """The logs part of an upload response, the first page in full and the counts"""
+        return {
+            "logs": self.get_logs(limit=config.LOG_PAGE_SIZE),
+            "logSummary": self.log_summary(),
+            "logCount": self.log_count,
+        }
 
     def clear_logs(self):
         self.json_handler.clear_logs()
 
 
-class JsonHandler(logging.Handler):
+class LogEntry(NamedTuple):
+    """A compact log record, formatted only when a page of logs is requested"""
+
+    levelno: int
+    msg: Any
+    args: Any
+    code: Optional[str] = None
+    sheet: Optional[str] = None
+    row: Optional[int] = None
+
+    @property
+    def levelname(self) -> str:
+        return logging.getLevelName(self.levelno)
+
+    def message(self) -> str:
+        msg = str(self.msg)
+        return msg % self.args if self.args else msg
+
+    def to_json(self) -> List[Any]:
+        args = [
+            arg if isinstance(arg, (str, int, float, bool)) or arg is None else str(arg)
+            for arg in self.args or ()
+        ]
+        return [self.levelno, str(self.msg), args, self.code, self.sheet, self.row]
+
+    @classmethod
+    def from_json(cls, values: List[Any]) -> "LogEntry":
+        levelno, msg, args, code, sheet, row = values
+        return cls(levelno, msg, tuple(args), code, sheet, row)
+
+
+def row_log(code: str, sheet: str, row: int, count: int = 1) -> Dict[str, Any]:
+    """The extra fields of a per row log line, rolled up into a count per code.
+
+    For example logger.info(f"...", extra=row_log("runs.updated", "Runs Sheet", 2)).
+    A line reporting a whole batch of rows passes their count, starting at row.
+    """
+    return {"code": code, "sheet": sheet, "row": row, "count": count}
+
+
+# how the count of each code is reported, codes not listed read as "<count> <code>"
+summary_labels: Dict[str, str] = {
+    "runs.added": "runs added",
+    "runs.updated": "runs updated",
+    "owners.added": "owners added",
+    "specimens.added": "specimens added",
+    "specimens.updated": "specimens updated",
+    "samples.added": "samples added",
+    "samples.updated": "samples updated",
+    "storage.added": "storage entries added",
+    "storage.updated": "storage entries updated",
+    "analyses.added": "analyses added",
+    "speciations.added": "speciations added",
+    "speciations.updated": "speciations updated",
+    "speciations.missing": "rows without a speciation",
+    "drug_resistances.updated": "drug resistances updated",
+    "drug_resistances.missing": "rows without drug resistances",
+    "mutations.added": "mutations added",
+    "mutations.updated": "mutations updated",
+    "mutations.failed": "mutation rows that failed",
+    "samples.missing": "rows naming an unknown sample",
+    "validation.failed": "validation errors",
+    "mapping.duplicated": "duplicated sample mappings",
+    "mapping.unmatched": "rows without a sample mapping",
+}
+
+
+class LogCollector(logging.Handler):
+    """Collect the logs of one upload, bounded and rolled up by code.
+
+    Only a compact entry is kept for each record. Once LOG_MAX_ENTRIES have been kept
+    further INFO records are counted but dropped, while warnings and errors are always
+    kept. Records logged with a code (see row_log) are also counted per level and code
+    for the summary.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.log_records = []
+        self.clear_logs()
 
-    def emit(self, record):
-        self.log_records.append(record.__dict__)
+    def emit(self, record: logging.LogRecord) -> None:
+        code = getattr(record, "code", None)
+        if code is not None:
+            self.counts[(record.levelno, code)] += getattr(record, "count", 1)
 
-    def get_logs(self):
-        return self.log_records
+        if (
+            len(self.entries) < config.LOG_MAX_ENTRIES
+            or record.levelno >= logging.WARNING
+        ):
+            self.entries.append(
+                LogEntry(
+                    record.levelno,
+                    record.msg,
+                    record.args,
+                    code,
+                    getattr(record, "sheet", None),
+                    getattr(record, "row", None),
+                )
+            )
+        else:
+            self.dropped += 1
 
-    def clear_logs(self):
-        self.log_records = []
+    def get_logs(
+        self, offset: int = 0, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        return format_entries(self.entries, offset, limit)
 
+    def summary(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "level": logging.getLevelName(levelno),
+                "code": code,
+                "count": count,
+                "msg": f"{count:,} {summary_labels.get(code, code)}",
+            }
+            for (levelno, code), count in self.counts.items()
+        ]
 
-async def add_json_handler(request: Request, call_next: Callable) -> Response:
+    def clear_logs(self) -> None:
+        self.entries: List[LogEntry] = []
+        self.counts: Counter[Tuple[int, str]] = Counter()
+        self.dropped = 0
+
+
+def format_entries(
+    entries: Sequence[LogEntry], offset: int = 0, limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Format one page of log entries, numbering them from 1"""
+    end = None if limit is None else offset + limit
+    return [
+        {"id": offset + i + 1, "level": entry.levelname, "msg": entry.message()}
+        for i, entry in enumerate(entries[offset:end])
+    ]
+
+
+def make_logger(name: str) -> CustomLogger:
+    """Create a logger that collects the logs of one upload and counts its errors"""
     logging.setLoggerClass(CustomLogger)
-    logger = CustomLogger(f"labbox-logger{id(request)}")
+    logger = CustomLogger(name)
 
     error_check_handler = ErrorCheckHandler(stream=sys.stderr)
 
     logger.addHandler(error_check_handler)
     logger.setLevel(logging.INFO)
     logger.propagate = True
+    return logger
+
+
+async def add_json_handler(request: Request, call_next: Callable) -> Response:
+    logger = make_logger(f"labbox-logger{id(request)}")
 
     request.state.logger = logger
 
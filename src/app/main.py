@@ -1,4 +1,5 @@
 import logging
+from contextlib import asynccontextmanager
 from os import cpu_count
 from pathlib import Path
 
@@ -8,15 +9,34 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 
 from app.config import config
-from app.db import run_alembic_upgrade_to_head
+from app.db import dispose_engine, init_engine, pool_stats, run_alembic_upgrade_to_head
+from app.importers.validation import shutdown_pool
 from app.logs import add_json_handler
+from app.routes.job_routes import router as job_router
 from app.routes.mutation_routes import router as mutation_router
 from app.routes.schema_routes import router as schema_router
 from app.routes.spreadsheet_routes import router as spreadsheet_router
 from app.routes.summary_routes import router as summary_router
+from app.routes.view_routes import router as view_router
 from app.utils.auth import auth
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start up and shut down the resources shared by the requests of this worker
+
+    Args:
+        app (FastAPI): The application.
+    """
+    init_engine()
+    auth.jwks.start()
+    yield
+    await auth.jwks.stop()
+    await dispose_engine()
+    shutdown_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "https://labbox.ouh.mmmoxford.uk:3000",
@@ -35,6 +55,8 @@ app.include_router(spreadsheet_router, prefix="/spreadsheet", tags=["spreadsheet
 app.include_router(summary_router, prefix="/summary", tags=["summary"])
 app.include_router(mutation_router, prefix="/mutation", tags=["mutation"])
 app.include_router(schema_router, prefix="/schema", tags=["schema"])
+app.include_router(job_router, prefix="/jobs", tags=["jobs"])
+app.include_router(view_router, prefix="/views", tags=["views"])
 
 
 @app.get("/public")
@@ -81,6 +103,22 @@ async def private(auth_result: str = Security(auth.verify)) -> str:
     return auth_result
 
 
+@app.get("/pool")
+async def pool(auth_result: str = Security(auth.verify)) -> dict:
+    """Statistics of this worker's database connection pool
+
+    Each uvicorn worker has its own pool, so the database needs to allow pool size
+    plus max overflow connections for each of them.
+
+    Args:
+        auth_result (str, optional): Defaults to Security(auth.verify).
+
+    Returns:
+        dict: The pool statistics
+    """
+    return pool_stats()
+
+
 @app.get("/private-scoped")
 def private_scoped(
     auth_result: str = Security(auth.verify, scopes=["admin"]),
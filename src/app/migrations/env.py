@@ -31,6 +31,10 @@ ignored_views = [
     "flattened_sample_details_view",
     "flattened_specimen_details_view",
     "flattened_others_view",
+    # the tables behind the flattened views, rebuilt when the detail types change
+    "flattened_sample_details",
+    "flattened_specimen_details",
+    "flattened_others",
 ]
 
 
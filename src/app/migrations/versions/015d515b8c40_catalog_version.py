@@ -0,0 +1,74 @@
+"""catalog version
+
+Revision ID: 015d515b8c40
+Revises: 88c11dd071fc
+Create Date: 2026-10-17 17:28:21.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "015d515b8c40"
+down_revision: Union[str, None] = "88c11dd071fc"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# lookup tables cached in process by app.catalogs
+tables: Sequence[str] = [
+    "specimen_detail_types",
+    "sample_detail_types",
+    "other_types",
+    "drug_resistance_result_types",
+    "countries",
+]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "catalog_version",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_catalog_version")),
+    )
+
+    # the version is a microsecond timestamp, so it also differs between databases
+    op.execute(
+        """
+    CREATE OR REPLACE FUNCTION bump_catalog_version()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE catalog_version
+        SET version = GREATEST(
+            version + 1,
+            (EXTRACT(EPOCH FROM clock_timestamp()) * 1000000)::bigint
+        );
+        RETURN NULL;
+    END;
+    $$ language 'plpgsql';
+    """
+    )
+    op.execute(
+        """
+    INSERT INTO catalog_version (id, version)
+    VALUES (1, (EXTRACT(EPOCH FROM clock_timestamp()) * 1000000)::bigint);
+    """
+    )
+    for table in tables:
+        op.execute(
+            f"""
+        CREATE TRIGGER bump_catalog_version_trigger_{table}
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+        """
+        )
+
+
+def downgrade() -> None:
+    for table in tables:
+        op.execute(f"DROP TRIGGER bump_catalog_version_trigger_{table} ON {table};")
+    op.execute("DROP FUNCTION bump_catalog_version();")
+    op.drop_table("catalog_version")
@@ -0,0 +1,71 @@
+"""gpas sample mappings
+
+Revision ID: 3a8d6f0c2e71
+Revises: 6e2b9f41c0d8
+Create Date: 2026-10-17 22:41:09.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "3a8d6f0c2e71"
+down_revision: Union[str, None] = "6e2b9f41c0d8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "gpas_sample_mappings",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("remote_sample_name", sa.String(length=64), nullable=False),
+        sa.Column("sample_name", sa.String(length=64), nullable=False),
+        sa.Column(
+            "created_by",
+            sa.String(length=50),
+            server_default=sa.text("CURRENT_USER"),
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(precision=3),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_by",
+            sa.String(length=50),
+            server_default=sa.text("CURRENT_USER"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            postgresql.TIMESTAMP(precision=3),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_gpas_sample_mappings")),
+        sa.UniqueConstraint(
+            "remote_sample_name",
+            name=op.f("uq_gpas_sample_mappings_remote_sample_name"),
+        ),
+    )
+    op.execute(
+        """
+    CREATE TRIGGER before_update_trigger_gpas_sample_mappings
+    BEFORE UPDATE ON gpas_sample_mappings
+    FOR EACH ROW EXECUTE PROCEDURE update_change_columns();
+    """
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "DROP TRIGGER before_update_trigger_gpas_sample_mappings ON gpas_sample_mappings;"
+    )
+    op.drop_table("gpas_sample_mappings")
@@ -0,0 +1,27 @@
+"""import job plans
+
+Revision ID: 4b9e07c2d5a1
+Revises: d6a3f58c91e4
+Create Date: 2026-10-18 16:40:12.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "4b9e07c2d5a1"
+down_revision: Union[str, None] = "d6a3f58c91e4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("import_jobs", sa.Column("plan", postgresql.JSONB(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("import_jobs", "plan")
@@ -0,0 +1,223 @@
+"""materialize flattened details
+
+Revision ID: 6e2b9f41c0d8
+Revises: d41c8e2f6a57
+Create Date: 2026-10-17 20:14:36.000000
+
+"""
+
+from typing import Dict, Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "6e2b9f41c0d8"
+down_revision: Union[str, None] = "d41c8e2f6a57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The flattened views pivoted the detail tables with one LEFT JOIN per detail type on
+# every read. The pivot is now stored in a table per view, rebuilt in full when the
+# detail types change and kept up to date by statement triggers on the detail tables
+# for just the parents whose details changed. The views are kept, as a plain SELECT *
+# of their table, so samples_view, specimens_view and the API read them as before.
+flattened: Sequence[Dict[str, str]] = [
+    {
+        "name": "sample_details",
+        "view": "flattened_sample_details_view",
+        "parent": "samples",
+        "key": "sample_id",
+        "details": "sample_details",
+        "types": "sample_detail_types",
+        "type_column": "sample_detail_type_code",
+        "alias": "sd_",
+    },
+    {
+        "name": "specimen_details",
+        "view": "flattened_specimen_details_view",
+        "parent": "specimens",
+        "key": "specimen_id",
+        "details": "specimen_details",
+        "types": "specimen_detail_types",
+        "type_column": "specimen_detail_type_code",
+        "alias": "sd_",
+    },
+    {
+        "name": "others",
+        "view": "flattened_others_view",
+        "parent": "analyses",
+        "key": "analysis_id",
+        "details": "others",
+        "types": "other_types",
+        "type_column": "other_type_code",
+        "alias": "o_",
+    },
+]
+
+
+def rebuild(f: Dict[str, str]) -> None:
+    # statement triggers fire for no rows too, so this runs the existing trigger that
+    # drops the dependent view, calls create_flattened_..._view() and recreates it
+    op.execute(f"UPDATE {f['types']} SET code = code WHERE false;")
+
+
+def upgrade() -> None:
+    for f in flattened:
+        table = f"flattened_{f['name']}"
+        op.execute(
+            f"""
+        CREATE OR REPLACE FUNCTION {table}_select()
+        RETURNS text AS $$
+        DECLARE
+            type_record record;
+            sql_columns TEXT := '';
+            sql_joins TEXT := ' FROM {f['parent']} s';
+            column_alias TEXT;
+        BEGIN
+            -- one column per detail type, in a fixed order so rows can be refreshed
+            FOR type_record IN SELECT * FROM {f['types']} ORDER BY code LOOP
+                column_alias := '{f['alias']}' || type_record.code::text;
+
+                sql_joins := sql_joins || ' LEFT JOIN {f['details']} ' || column_alias || ' ON s.id = ' || column_alias || '.{f['key']} AND ' || column_alias || '.{f['type_column']} = ' || quote_literal(type_record.code);
+
+                sql_columns := sql_columns || ', ' || column_alias || '.value_' || type_record.value_type::text || ' AS ' || quote_ident(type_record.code);
+            END LOOP;
+
+            RETURN 'SELECT s.id AS {f['key']}' || sql_columns || sql_joins;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+        )
+        op.execute(
+            f"""
+        CREATE OR REPLACE FUNCTION create_{f['view']}()
+        RETURNS void AS $$
+        BEGIN
+            -- any view depending on this one has been dropped by the caller
+            DROP VIEW IF EXISTS {f['view']};
+            DROP TABLE IF EXISTS {table};
+            EXECUTE 'CREATE TABLE {table} AS ' || {table}_select();
+            ALTER TABLE {table} ADD PRIMARY KEY ({f['key']});
+            ALTER TABLE {table} ADD FOREIGN KEY ({f['key']})
+                REFERENCES {f['parent']} (id) ON DELETE CASCADE;
+            CREATE VIEW {f['view']} AS SELECT * FROM {table};
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+        )
+        op.execute(
+            f"""
+        CREATE OR REPLACE FUNCTION refresh_{table}(ids integer[])
+        RETURNS void AS $$
+        BEGIN
+            -- serialise refreshes of the same parent, so each one reads the details
+            -- committed by the one before it
+            PERFORM pg_advisory_xact_lock(hashtext('{table}'), id)
+            FROM unnest(ids) AS id ORDER BY id;
+
+            DELETE FROM {table} WHERE {f['key']} = ANY(ids);
+            EXECUTE 'INSERT INTO {table} ' || {table}_select() || ' WHERE s.id = ANY($1)'
+            USING ids;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+        )
+        op.execute(
+            f"""
+        CREATE OR REPLACE FUNCTION {table}_changed()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            ids integer[] := '{{}}';
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                ids := ids || ARRAY(SELECT {f['key']} FROM new_rows);
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                ids := ids || ARRAY(SELECT {f['key']} FROM old_rows);
+            END IF;
+            PERFORM refresh_{table}(ARRAY(SELECT DISTINCT unnest(ids)));
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+        """
+        )
+        op.execute(
+            f"""
+        CREATE OR REPLACE FUNCTION {table}_parents_added()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            -- a new parent has no details yet
+            INSERT INTO {table} ({f['key']}) SELECT id FROM new_rows;
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+        """
+        )
+
+        rebuild(f)
+
+        # asyncpg runs one statement at a time, so one trigger per execute
+        for trigger, event, transition_tables in [
+            ("insert", "INSERT", "NEW TABLE AS new_rows"),
+            ("update", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+            ("delete", "DELETE", "OLD TABLE AS old_rows"),
+        ]:
+            op.execute(
+                f"""
+            CREATE TRIGGER {table}_{trigger}_trigger
+            AFTER {event} ON {f['details']}
+            REFERENCING {transition_tables}
+            FOR EACH STATEMENT EXECUTE FUNCTION {table}_changed();
+            """
+            )
+        op.execute(
+            f"""
+        CREATE TRIGGER {table}_parents_trigger
+        AFTER INSERT ON {f['parent']}
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {table}_parents_added();
+        """
+        )
+
+
+def downgrade() -> None:
+    for f in flattened:
+        table = f"flattened_{f['name']}"
+        for trigger in ("insert", "update", "delete"):
+            op.execute(f"DROP TRIGGER {table}_{trigger}_trigger ON {f['details']};")
+        op.execute(f"DROP TRIGGER {table}_parents_trigger ON {f['parent']};")
+        op.execute(f"DROP FUNCTION {table}_changed();")
+        op.execute(f"DROP FUNCTION {table}_parents_added();")
+        op.execute(f"DROP FUNCTION refresh_{table}(integer[]);")
+
+        # the view pivoting the details on every read, as it was before
+        op.execute(
+            f"""
+        CREATE OR REPLACE FUNCTION create_{f['view']}()
+        RETURNS void AS $$
+        DECLARE
+            type_record record;
+            -- can not use replace view here as it complains about columns being dropped
+            sql_start TEXT := 'DROP VIEW IF EXISTS {f['view']}; CREATE VIEW {f['view']} AS SELECT s.id as {f['key']}';
+            sql_columns TEXT := '';
+            sql_joins TEXT := ' FROM {f['parent']} s';
+            column_alias TEXT;
+            value_field TEXT;
+        BEGIN
+            FOR type_record IN SELECT * FROM {f['types']} LOOP
+                column_alias := '{f['alias']}' || type_record.code::text;
+                value_field := type_record.value_type::text;
+
+                sql_joins := sql_joins || ' LEFT JOIN {f['details']} ' || column_alias || ' ON s.id = ' || column_alias || '.{f['key']} AND ' || column_alias || '.{f['type_column']} = ' || quote_literal(type_record.code);
+
+                sql_columns := sql_columns || ', ' || column_alias || '.value_' || value_field || ' AS ' || quote_ident(type_record.code);
+            END LOOP;
+
+            EXECUTE sql_start || sql_columns || sql_joins;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+        )
+        rebuild(f)
+        op.execute(f"DROP TABLE {table};")
+        op.execute(f"DROP FUNCTION {table}_select();")
@@ -0,0 +1,34 @@
+"""import job leases
+
+Revision ID: 8f41d2b6a7e3
+Revises: c52e9a17d3b8
+Create Date: 2026-10-18 11:26:03.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "8f41d2b6a7e3"
+down_revision: Union[str, None] = "c52e9a17d3b8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "import_jobs",
+        sa.Column("heartbeat_at", postgresql.TIMESTAMP(precision=3), nullable=True),
+    )
+    # jobs already running hold a lease from when they started
+    op.execute(
+        "UPDATE import_jobs SET heartbeat_at = started_at WHERE status = 'running'"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("import_jobs", "heartbeat_at")
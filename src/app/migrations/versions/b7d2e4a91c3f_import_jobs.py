@@ -0,0 +1,61 @@
+"""import jobs
+
+Revision ID: b7d2e4a91c3f
+Revises: 015d515b8c40
+Create Date: 2026-10-17 18:05:44.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "b7d2e4a91c3f"
+down_revision: Union[str, None] = "015d515b8c40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "import_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column(
+            "status", sa.String(length=20), server_default="queued", nullable=False
+        ),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.Column("msg", sa.Text(), nullable=True),
+        sa.Column("logs", postgresql.JSONB(), nullable=True),
+        sa.Column("worker", sa.String(length=100), nullable=True),
+        sa.Column(
+            "created_by",
+            sa.String(length=50),
+            server_default=sa.text("CURRENT_USER"),
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(precision=3),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.Column("started_at", postgresql.TIMESTAMP(precision=3), nullable=True),
+        sa.Column("finished_at", postgresql.TIMESTAMP(precision=3), nullable=True),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_import_jobs")),
+    )
+    # the workers only ever look for the oldest unfinished jobs
+    op.create_index(
+        "ix_import_jobs_unfinished",
+        "import_jobs",
+        ["id"],
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_import_jobs_unfinished", table_name="import_jobs")
+    op.drop_table("import_jobs")
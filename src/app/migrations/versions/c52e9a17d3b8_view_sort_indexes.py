@@ -0,0 +1,38 @@
+"""view sort indexes
+
+Revision ID: c52e9a17d3b8
+Revises: 3a8d6f0c2e71
+Create Date: 2026-10-18 09:12:40.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c52e9a17d3b8"
+down_revision: Union[str, None] = "3a8d6f0c2e71"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the views are paged by seeking past the (sort column, id) of the last row, which
+# only avoids sorting the whole view when an index on those columns can be read
+sort_indexes = {
+    "runs": ["code", "run_date"],
+    "samples": ["guid", "sample_category"],
+    "specimens": ["accession", "collection_date", "organism"],
+    "storages": ["storage_qr_code", "date_into_storage"],
+}
+
+
+def upgrade() -> None:
+    for table, columns in sort_indexes.items():
+        for column in columns:
+            op.create_index(f"ix_{table}_{column}_id", table, [column, "id"])
+
+
+def downgrade() -> None:
+    for table, columns in sort_indexes.items():
+        for column in columns:
+            op.drop_index(f"ix_{table}_{column}_id", table_name=table)
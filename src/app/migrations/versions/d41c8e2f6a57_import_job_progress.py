@@ -0,0 +1,29 @@
+"""import job progress
+
+Revision ID: d41c8e2f6a57
+Revises: b7d2e4a91c3f
+Create Date: 2026-10-17 18:52:10.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "d41c8e2f6a57"
+down_revision: Union[str, None] = "b7d2e4a91c3f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("import_jobs", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("progress", postgresql.JSONB(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("import_jobs", schema=None) as batch_op:
+        batch_op.drop_column("progress")
@@ -0,0 +1,49 @@
+"""import plans
+
+Revision ID: d6a3f58c91e4
+Revises: 8f41d2b6a7e3
+Create Date: 2026-10-18 14:02:37.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "d6a3f58c91e4"
+down_revision: Union[str, None] = "8f41d2b6a7e3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "import_plans",
+        sa.Column("token", sa.String(length=64), nullable=False),
+        sa.Column("changes", postgresql.JSONB(), nullable=False),
+        sa.Column("expires_at", postgresql.TIMESTAMP(precision=3), nullable=False),
+        sa.Column(
+            "created_by",
+            sa.String(length=50),
+            server_default=sa.text("CURRENT_USER"),
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            postgresql.TIMESTAMP(precision=3),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("token", name=op.f("pk_import_plans")),
+    )
+    op.create_index(
+        op.f("ix_import_plans_expires_at"), "import_plans", ["expires_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_import_plans_expires_at"), table_name="import_plans")
+    op.drop_table("import_plans")
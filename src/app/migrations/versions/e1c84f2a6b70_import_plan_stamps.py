@@ -0,0 +1,36 @@
+"""import plan stamps
+
+Revision ID: e1c84f2a6b70
+Revises: 4b9e07c2d5a1
+Create Date: 2026-10-19 10:15:48.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "e1c84f2a6b70"
+down_revision: Union[str, None] = "4b9e07c2d5a1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the xmin of every row a plan was made from, by table and id
+    op.add_column(
+        "import_plans",
+        sa.Column(
+            "stamps",
+            postgresql.JSONB(),
+            server_default=sa.text("'{}'::jsonb"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("import_plans", "stamps")
@@ -22,13 +22,16 @@ from typing import Dict, List, Optional, get_args
 
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Enum,
     ForeignKey,
+    Index,
     String,
     Text,
     UniqueConstraint,
+    text,
 )
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TIMESTAMP
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.mutable import MutableList
 from sqlalchemy.orm import (
@@ -124,6 +127,10 @@ class Specimen(GpasLocalModel):
             postgresql_nulls_not_distinct=True,
             name="ux_specimen",
         ),
+        # the columns specimens_view can be sorted by, see app.view_query
+        Index("ix_specimens_accession_id", "accession", "id"),
+        Index("ix_specimens_collection_date_id", "collection_date", "id"),
+        Index("ix_specimens_organism_id", "organism", "id"),
     )
 
 
@@ -189,6 +196,11 @@ class Country(GpasLocalModel):
 class Run(GpasLocalModel):
     __versioned__: Dict = {}
     __tablename__ = "runs"
+    __table_args__ = (
+        # the columns runs_view can be sorted by, see app.view_query
+        Index("ix_runs_code_id", "code", "id"),
+        Index("ix_runs_run_date_id", "run_date", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     code: Mapped[str] = mapped_column(String(20), nullable=False, unique=True)
@@ -208,6 +220,11 @@ class Run(GpasLocalModel):
 class Sample(GpasLocalModel):
     __versioned__: Dict = {}
     __tablename__ = "samples"
+    __table_args__ = (
+        # the columns samples_view can be sorted by, see app.view_query
+        Index("ix_samples_guid_id", "guid", "id"),
+        Index("ix_samples_sample_category_id", "sample_category", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     specimen_id: Mapped[int] = mapped_column(ForeignKey("specimens.id"))
@@ -431,6 +448,11 @@ class DrugResistanceResultType(GpasLocalModel):
 class Storage(GpasLocalModel):
     __versioned__: Dict = {}
     __tablename__ = "storages"
+    __table_args__ = (
+        # the columns storages_view can be sorted by, see app.view_query
+        Index("ix_storages_storage_qr_code_id", "storage_qr_code", "id"),
+        Index("ix_storages_date_into_storage_id", "date_into_storage", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     specimen_id: Mapped[int] = mapped_column(ForeignKey("specimens.id"))
@@ -472,4 +494,77 @@ class Mutations(GpasLocalModel):
     UniqueConstraint(analysis_id, species, drug, gene, mutation)
 
 
+class GpasSampleMapping(GpasLocalModel):
+    """The sample guid a GPAS Sample ID maps to, kept from the uploaded mappings, see app.sample_mappings"""
+
+    __tablename__ = "gpas_sample_mappings"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    remote_sample_name: Mapped[str] = mapped_column(String(64), unique=True)
+    sample_name: Mapped[str] = mapped_column(String(64), nullable=False)
+
+
+class CatalogVersion(Model):
+    """Single row bumped by triggers whenever a lookup table cached by app.catalogs changes"""
+
+    __tablename__ = "catalog_version"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class ImportJob(Model):
+    """An upload queued to be imported by a worker process, see app.jobs"""
+
+    __tablename__ = "import_jobs"
+    __table_args__ = (
+        # the workers only ever look for the oldest unfinished jobs
+        Index(
+            "ix_import_jobs_unfinished",
+            "id",
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(20), server_default="queued", nullable=False
+    )
+    payload: Mapped[Dict] = mapped_column(JSONB, nullable=False)
+    msg: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    logs: Mapped[Optional[Dict]] = mapped_column(JSONB, nullable=True)
+    progress: Mapped[Optional[Dict]] = mapped_column(JSONB, nullable=True)
+    plan: Mapped[Optional[Dict]] = mapped_column(JSONB, nullable=True)
+    worker: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    created_by: Mapped[db_user]
+    created_at: Mapped[db_timestamp]
+    started_at: Mapped[Optional[datetime]] = mapped_column(
+        TIMESTAMP(precision=3), nullable=True
+    )
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(
+        TIMESTAMP(precision=3), nullable=True
+    )
+    finished_at: Mapped[Optional[datetime]] = mapped_column(
+        TIMESTAMP(precision=3), nullable=True
+    )
+
+
+class StoredPlan(Model):
+    """The changes a dry run planned, kept until committed or expired, see app.importers.plan"""
+
+    __tablename__ = "import_plans"
+
+    token: Mapped[str] = mapped_column(String(64), primary_key=True)
+    changes: Mapped[List[Dict]] = mapped_column(JSONB, nullable=False)
+    stamps: Mapped[Dict] = mapped_column(
+        JSONB, server_default=text("'{}'::jsonb"), nullable=False
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(precision=3), index=True, nullable=False
+    )
+    created_by: Mapped[db_user]
+    created_at: Mapped[db_timestamp]
+
+
 configure_mappers()
@@ -0,0 +1,130 @@
+"""
+Progress of an import, stage by stage.
+
+The importers tell their logger which stage they have moved on to and how many rows
+they have processed, see CustomLogger.stage and CustomLogger.advance. Progress keeps
+the rows and time spent in each stage, adding to them if a stage is entered again, as
+it is for every chunk of a file upload. Listeners, such as the job worker storing the
+progress of its job, are sent a ProgressEvent whenever the stage changes and at most
+every PROGRESS_INTERVAL_SECONDS in between. The time spent in each stage is logged to
+the server log once the import has finished, to find the slow stages in production.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional
+
+from app.config import config
+
+Stage = Literal[
+    "validate",
+    "runs",
+    "specimens",
+    "samples",
+    "storage",
+    "summary",
+    "drugs",
+    "mutations",
+]
+
+server_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    stage: Optional[str]
+    rows: int
+    seconds: float
+    errors: int
+    done: bool = False
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stage": self.stage,
+            "rows": self.rows,
+            "rowsPerSec": round(self.rows_per_sec, 1),
+            "seconds": round(self.seconds, 3),
+            "errors": self.errors,
+            "done": self.done,
+        }
+
+
+Listener = Callable[[ProgressEvent], Awaitable[None]]
+
+
+@dataclass
+class StageTotals:
+    rows: int = 0
+    seconds: float = 0.0
+
+
+class Progress:
+    def __init__(self, errors: Callable[[], int]):
+        """Track the progress of one import.
+
+        Args:
+            errors (Callable[[], int]): Returns the number of errors logged so far.
+        """
+        self.errors = errors
+        self.listeners: List[Listener] = []
+        self.stages: Dict[str, StageTotals] = {}
+        self.current: Optional[str] = None
+        self.started = 0.0
+        self.published = 0.0
+
+    def event(self, done: bool = False) -> ProgressEvent:
+        if self.current is None:
+            return ProgressEvent(None, 0, 0.0, self.errors(), done)
+        totals = self.stages[self.current]
+        return ProgressEvent(
+            self.current,
+            totals.rows,
+            totals.seconds + time.monotonic() - self.started,
+            self.errors(),
+            done,
+        )
+
+    async def publish(self, done: bool = False) -> None:
+        self.published = time.monotonic()
+        if self.listeners:
+            event = self.event(done)
+            for listener in self.listeners:
+                await listener(event)
+
+    def stop(self) -> None:
+        """Add the time since the current stage started to its totals"""
+        if self.current is not None:
+            self.stages[self.current].seconds += time.monotonic() - self.started
+            self.current = None
+
+    async def start(self, stage: Stage) -> None:
+        if stage == self.current:
+            return
+        self.stop()
+        self.stages.setdefault(stage, StageTotals())
+        self.current = stage
+        self.started = time.monotonic()
+        await self.publish()
+
+    async def advance(self, rows: int) -> None:
+        if self.current is None:
+            return
+        self.stages[self.current].rows += rows
+        if time.monotonic() - self.published >= config.PROGRESS_INTERVAL_SECONDS:
+            await self.publish()
+
+    async def finish(self) -> None:
+        """Send the final event and log the time spent in each stage"""
+        await self.publish(done=True)
+        self.stop()
+        for stage, totals in self.stages.items():
+            event = ProgressEvent(stage, totals.rows, totals.seconds, self.errors())
+            server_logger.info(
+                f"Import stage {stage}: {event.rows} rows in {event.seconds:.2f}s ({event.rows_per_sec:.0f} rows/sec)"
+            )
+        self.stages.clear()
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from typing import AsyncIterator, Optional
+
+from app.config import config
+from app.db import get_session
+from app.jobs import get_job, get_job_state, page_job_logs
+from app.utils.auth import auth
+from fastapi import APIRouter, HTTPException, Query, Request, Security
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+
+router = APIRouter()
+
+
+@router.get("/{job_id}")
+async def status(
+    job_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(config.LOG_PAGE_SIZE, ge=1),
+    auth_result: str = Security(auth.verify),
+):
+    """Return the status of an import job, then its result and a page of its logs"""
+    async with get_session() as session:
+        job = await get_job(session, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+        content = {
+            "jobId": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "createdAt": job.created_at,
+            "startedAt": job.started_at,
+            "finishedAt": job.finished_at,
+            "msg": job.msg,
+            # the first page of a dry run's plan, see /spreadsheet/plan/{token}
+            "plan": job.plan,
+            **page_job_logs(job.logs, offset, limit),
+        }
+
+    return JSONResponse(status_code=200, content=jsonable_encoder(content))
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/{job_id}/events")
+async def events(
+    request: Request,
+    job_id: int,
+    auth_result: str = Security(auth.verify),
+):
+    """Stream the progress of an import job as Server-Sent Events.
+
+    A progress event is sent each time the job's progress changes, with its stage,
+    rows processed, rows/sec and errors so far, and a final done event with its
+    status and result message once it has finished.
+    """
+    async with get_session() as session:
+        if await get_job_state(session, job_id) is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    async def stream() -> AsyncIterator[str]:
+        last: Optional[dict] = None
+        async with get_session() as session:
+            while not await request.is_disconnected():
+                state = await get_job_state(session, job_id)
+                # end the read transaction, so the next poll sees new progress
+                await session.rollback()
+                if state is None:
+                    return
+                status, msg, progress = state
+
+                if progress is not None and progress != last:
+                    last = progress
+                    yield sse("progress", progress)
+                if status in ("succeeded", "failed"):
+                    yield sse("done", {"status": status, "msg": msg})
+                    return
+
+                await asyncio.sleep(config.PROGRESS_INTERVAL_SECONDS)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,10 +1,29 @@
+"""
+JSON Schemas of the views the frontend renders as grids.
+
+The schemas of all allowed_view_names are built once per worker and kept until the
+catalog_version row changes. The flattened detail views are rebuilt by triggers on
+the detail type tables, which bump catalog_version too, so each request only reads
+that one row. Responses carry an ETag, and a request whose If-None-Match matches it
+gets an empty 304 response.
+"""
+
 import asyncio
-from typing import Any, Dict, List
+import hashlib
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional
 
+from fastapi import APIRouter, Request, Response, Security
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.expression import func
+
+from app import models
 from app.db import get_session
 from app.utils.auth import auth
-from fastapi import APIRouter, Security
-from sqlalchemy.sql.expression import func
 
 router = APIRouter()
 
@@ -28,52 +47,139 @@ allowed_view_names = [
 ]
 
 
-async def get_view_columns(view_name: str) -> List[Dict[str, Any]]:
-    async with get_session() as session:
-        rows = await session.execute(func.public.get_view_columns(view_name))
-    columns = [dict(row) for row in rows]
-    return [
-        {
-            key: type_mapping.get(
-                value,
-                next(
-                    (v for k, v in type_mapping.items() if value.startswith(k)),
-                    value,
-                ),
-            )
-            for key, value in column.items()
-        }
-        for column in columns
-    ]
-
-
-async def get_view_schema(view_name: str) -> Dict[str, Any]:
-    columns = await get_view_columns(view_name)
+@dataclass(frozen=True)
+class ViewSchema:
+    schema: Dict[str, Any]
+    etag: str
+    # the Postgres type of each column, as format_type gives it
+    columns: Dict[str, str]
+
+
+@dataclass(frozen=True)
+class ViewSchemas:
+    version: int
+    views: Dict[str, ViewSchema]
+
+
+_schemas: Optional[ViewSchemas] = None
+_lock = asyncio.Lock()
+
+
+@lru_cache(maxsize=None)
+def json_type(data_type: str) -> str:
+    """The JSON Schema type of a Postgres type, or the Postgres type if it has none"""
+    if data_type in type_mapping:
+        return type_mapping[data_type]
+    return next(
+        (v for k, v in type_mapping.items() if data_type.startswith(k)), data_type
+    )
+
+
+async def get_view_columns(session: AsyncSession, view_name: str) -> Dict[str, str]:
+    # each row is a single (column_name, data_type) record
+    rows = await session.execute(func.public.get_view_columns(view_name))
+    return {column_name: data_type for column_name, data_type in rows.scalars()}
+
+
+def property_schema(pg_type: str) -> Dict[str, str]:
+    data_type = json_type(pg_type)
+    if data_type == "date":
+        return {"type": "string", "format": "date"}
+    return {"type": data_type}
+
+
+def view_schema(columns: Dict[str, str]) -> Dict[str, Any]:
     schema = {
         "$schema": "http://json-schema.org/draft-07/schema#",
         "type": "object",
         "properties": {
-            column_name: {"type": "string", "format": "date"}
-            if data_type == "date"
-            else {"type": data_type}
-            for column in columns
-            for column_name, data_type in column.items()
+            column_name: property_schema(pg_type)
+            for column_name, pg_type in columns.items()
         },
     }
     return schema
 
 
+async def get_view_schema(session: AsyncSession, view_name: str) -> Dict[str, Any]:
+    return view_schema(await get_view_columns(session, view_name))
+
+
+def schema_etag(schema: Dict[str, Any]) -> str:
+    body = json.dumps(schema, sort_keys=True).encode("utf-8")
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+async def load_view_schemas(session: AsyncSession, version: int) -> ViewSchemas:
+    views = {}
+    for view_name in allowed_view_names:
+        columns = await get_view_columns(session, view_name)
+        schema = view_schema(columns)
+        views[view_name] = ViewSchema(schema, schema_etag(schema), columns)
+    return ViewSchemas(version, views)
+
+
+async def get_view_schemas(session: AsyncSession) -> ViewSchemas:
+    """Return the cached view schemas, rebuilding them if the views may have changed.
+
+    Args:
+        session (AsyncSession): The database session.
+
+    Returns:
+        ViewSchemas: The schemas of all allowed_view_names.
+    """
+    global _schemas
+
+    version = await session.scalar(select(models.CatalogVersion.version))
+    if _schemas is not None and _schemas.version == version:
+        return _schemas
+
+    async with _lock:
+        if _schemas is None or _schemas.version != version:
+            _schemas = await load_view_schemas(session, version or 0)
+    return _schemas
+
+
+def invalidate_schemas() -> None:
+    """Drop the cached schemas so the next request rebuilds them"""
+    global _schemas
+    _schemas = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    return "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]
+
+
 @router.get("/{view_name}")
 async def get_schema(
     view_name: str,
+    request: Request,
     auth_result: str = Security(auth.verify),
 ):
     if view_name not in allowed_view_names:
         return {"error": "Invalid view name"}
-    return await get_view_schema(view_name)
+
+    async with get_session() as session:
+        view = (await get_view_schemas(session)).views[view_name]
+
+    # the browser revalidates every time, which costs it an empty 304
+    headers = {"ETag": view.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), view.etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(view.schema, headers=headers)
 
 
 # for testing
 if __name__ == "__main__":
-    data = asyncio.run(get_view_schema("samples_view"))
-    print(data)
+    from app.db import dispose_engine, init_engine
+
+    async def main() -> None:
+        init_engine()
+        async with get_session() as session:
+            print(await get_view_schema(session, "samples_view"))
+        await dispose_engine()
+
+    asyncio.run(main())
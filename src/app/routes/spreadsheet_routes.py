@@ -1,9 +1,24 @@
 import json
+from typing import Optional
 
+from app.config import config
 from app.db import get_session
-from app.importers.import_spreadsheet import import_data
+from app.importers.import_spreadsheet import import_data, import_files
+from app.importers.plan import commit_plan, page_plan, plan_data, plan_files
+from app.jobs import enqueue_job
 from app.utils.auth import auth
-from fastapi import APIRouter, Form, Request, Security
+from app.utils.uploads import iter_chunks
+from fastapi import (
+    APIRouter,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    Security,
+    UploadFile,
+)
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 
 router = APIRouter()
@@ -17,6 +32,8 @@ async def upload(
     Samples: str = Form(...),
     Storage: str = Form(...),
     dryRun: bool = Form(False),
+    maxErrors: Optional[int] = Form(None, ge=1),
+    bulk: bool = Form(False),
     auth_result: str = Security(auth.verify),
 ):
     runs = json.loads(Runs)
@@ -24,22 +41,127 @@ async def upload(
     samples = json.loads(Samples)
     storage = json.loads(Storage)
     logger = request.state.logger
+    # stop the import once this many errors have been found
+    logger.max_errors = maxErrors
 
+    plan = None
     async with get_session() as session:
-        await import_data(
-            session=session,
-            Runs=runs,
-            Specimens=specimens,
-            Samples=samples,
-            Storage=storage,
-            dryrun=dryRun,
-            logger=logger,
-        )
+        if dryRun:
+            # plan the import in memory rather than writing it and rolling it back
+            plan = await plan_data(
+                session=session,
+                Runs=runs,
+                Specimens=specimens,
+                Samples=samples,
+                Storage=storage,
+                logger=logger,
+            )
+        else:
+            await import_data(
+                session=session,
+                Runs=runs,
+                Specimens=specimens,
+                Samples=samples,
+                Storage=storage,
+                logger=logger,
+                bulk=bulk,
+            )
+
+    msg = (
+        "Excel uploaded failed"
+        if logger.error_occurred
+        else "Excel uploaded successfully" + (" (dry run)" if dryRun else "")
+    )
+
+    content = {"msg": msg, **logger.log_response()}
+    if plan is not None:
+        # the first page of changes, see /plan/{token} for the rest
+        content["plan"] = jsonable_encoder(plan.to_dict(limit=config.PLAN_PAGE_SIZE))
+
+    return JSONResponse(
+        status_code=200,
+        content=content,
+    )
+
+
+@router.get("/plan/{token}")
+async def plan_changes(
+    token: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(config.PLAN_PAGE_SIZE, ge=1),
+    auth_result: str = Security(auth.verify),
+):
+    """Return a page of the changes of a dry run plan that has not been committed"""
+    async with get_session() as session:
+        content = await page_plan(session, token, offset, limit)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"Plan {token} not found")
+
+    return JSONResponse(status_code=200, content=jsonable_encoder(content))
+
+
+@router.post("/commit")
+async def commit(
+    request: Request,
+    planToken: str = Form(...),
+    auth_result: str = Security(auth.verify),
+):
+    logger = request.state.logger
+
+    async with get_session() as session:
+        await commit_plan(session=session, token=planToken, logger=logger)
+
+    msg = (
+        "Excel uploaded failed"
+        if logger.error_occurred
+        else "Excel uploaded successfully"
+    )
+
+    return JSONResponse(
+        status_code=200,
+        content={"msg": msg, **logger.log_response()},
+    )
+
+
+@router.post("/upload-files")
+async def upload_files(
+    request: Request,
+    Runs: UploadFile = File(...),
+    Specimens: UploadFile = File(...),
+    Samples: UploadFile = File(...),
+    Storage: UploadFile = File(...),
+    dryRun: bool = Form(False),
+    bulk: bool = Form(False),
+    maxErrors: Optional[int] = Form(None, ge=1),
+    auth_result: str = Security(auth.verify),
+):
+    """Upload the sheets as NDJSON or CSV files, optionally gzipped, read in chunks"""
+    logger = request.state.logger
+    # stop the import once this many errors have been found
+    logger.max_errors = maxErrors
 
-    logs = [
-        {"id": i + 1, "level": log["levelname"], "msg": log["msg"]}
-        for i, log in enumerate(logger.get_logs())
-    ]
+    plan = None
+    async with get_session() as session:
+        if dryRun:
+            # plan the import in memory rather than writing it and rolling it back
+            plan = await plan_files(
+                session=session,
+                Runs=iter_chunks(Runs),
+                Specimens=iter_chunks(Specimens),
+                Samples=iter_chunks(Samples),
+                Storage=iter_chunks(Storage),
+                logger=logger,
+            )
+        else:
+            await import_files(
+                session=session,
+                Runs=iter_chunks(Runs),
+                Specimens=iter_chunks(Specimens),
+                Samples=iter_chunks(Samples),
+                Storage=iter_chunks(Storage),
+                logger=logger,
+                bulk=bulk,
+            )
 
     msg = (
         "Excel uploaded failed"
@@ -47,7 +169,42 @@ async def upload(
         else "Excel uploaded successfully" + (" (dry run)" if dryRun else "")
     )
 
+    content = {"msg": msg, **logger.log_response()}
+    if plan is not None:
+        # the first page of changes, see /plan/{token} for the rest
+        content["plan"] = jsonable_encoder(plan.to_dict(limit=config.PLAN_PAGE_SIZE))
+
     return JSONResponse(
         status_code=200,
-        content={"msg": msg, "logs": logs},
+        content=content,
     )
+
+
+@router.post("/enqueue")
+async def enqueue(
+    Runs: str = Form(...),
+    Specimens: str = Form(...),
+    Samples: str = Form(...),
+    Storage: str = Form(...),
+    dryRun: bool = Form(False),
+    maxErrors: Optional[int] = Form(None, ge=1),
+    bulk: bool = Form(False),
+    auth_result: str = Security(auth.verify),
+):
+    """Queue the upload to be imported by a worker, see /jobs for its progress"""
+    async with get_session() as session:
+        job_id = await enqueue_job(
+            session,
+            "spreadsheet",
+            {
+                "Runs": json.loads(Runs),
+                "Specimens": json.loads(Specimens),
+                "Samples": json.loads(Samples),
+                "Storage": json.loads(Storage),
+                "dryRun": dryRun,
+                "maxErrors": maxErrors,
+                "bulk": bulk,
+            },
+        )
+
+    return JSONResponse(status_code=202, content={"jobId": job_id})
@@ -1,9 +1,12 @@
 import json
+from typing import Optional
 
 from app.db import get_session
-from app.importers.import_gpas import import_summary
+from app.importers.import_gpas import import_summary, import_summary_file
+from app.jobs import enqueue_job
 from app.utils.auth import auth
-from fastapi import APIRouter, Form, Request, Security
+from app.utils.uploads import iter_chunks, read_all
+from fastapi import APIRouter, File, Form, Request, Security, UploadFile
 from fastapi.responses import JSONResponse
 
 router = APIRouter()
@@ -13,13 +16,17 @@ router = APIRouter()
 async def upload(
     request: Request,
     Summary: str = Form(...),
-    Mapping: str = Form(...),
+    Mapping: Optional[str] = Form(None),
     dryRun: bool = Form(False),
+    maxErrors: Optional[int] = Form(None, ge=1),
+    bulk: bool = Form(False),
     auth_result: str = Security(auth.verify),
 ):
     summary = json.loads(Summary)
-    mapping = json.loads(Mapping)
+    mapping = json.loads(Mapping) if Mapping else None
     logger = request.state.logger
+    # stop the import once this many errors have been found
+    logger.max_errors = maxErrors
 
     async with get_session() as session:
         await import_summary(
@@ -28,13 +35,45 @@ async def upload(
             Mapping=mapping,
             logger=logger,
             dryrun=dryRun,
+            bulk=bulk,
         )
 
-    logs = [
-        {"id": i + 1, "level": log["levelname"], "msg": log["msg"]}
-        for i, log in enumerate(logger.get_logs())
-    ]
-    print(f"logs: {logs}")
+    msg = (
+        "Summary uploaded failed"
+        if logger.error_occurred
+        else "Summary uploaded successfully" + (" (dry run)" if dryRun else "")
+    )
+
+    return JSONResponse(
+        status_code=200,
+        content={"msg": msg, **logger.log_response()},
+    )
+
+
+@router.post("/upload-file")
+async def upload_file(
+    request: Request,
+    Summary: UploadFile = File(...),
+    Mapping: Optional[UploadFile] = File(None),
+    dryRun: bool = Form(False),
+    maxErrors: Optional[int] = Form(None, ge=1),
+    bulk: bool = Form(False),
+    auth_result: str = Security(auth.verify),
+):
+    """Upload the summary, and any new mappings, as NDJSON or CSV files, optionally gzipped"""
+    logger = request.state.logger
+    # stop the import once this many errors have been found
+    logger.max_errors = maxErrors
+
+    async with get_session() as session:
+        await import_summary_file(
+            session=session,
+            Summary=iter_chunks(Summary),
+            Mapping=await read_all(Mapping) if Mapping else None,
+            logger=logger,
+            dryrun=dryRun,
+            bulk=bulk,
+        )
 
     msg = (
         "Summary uploaded failed"
@@ -44,5 +83,31 @@ async def upload(
 
     return JSONResponse(
         status_code=200,
-        content={"msg": msg, "logs": logs},
+        content={"msg": msg, **logger.log_response()},
     )
+
+
+@router.post("/enqueue")
+async def enqueue(
+    Summary: str = Form(...),
+    Mapping: Optional[str] = Form(None),
+    dryRun: bool = Form(False),
+    maxErrors: Optional[int] = Form(None, ge=1),
+    bulk: bool = Form(False),
+    auth_result: str = Security(auth.verify),
+):
+    """Queue the upload to be imported by a worker, see /jobs for its progress"""
+    async with get_session() as session:
+        job_id = await enqueue_job(
+            session,
+            "summary",
+            {
+                "Summary": json.loads(Summary),
+                "Mapping": json.loads(Mapping) if Mapping else None,
+                "dryRun": dryRun,
+                "maxErrors": maxErrors,
+                "bulk": bulk,
+            },
+        )
+
+    return JSONResponse(status_code=202, content={"jobId": job_id})
@@ -0,0 +1,95 @@
+from typing import List, Literal, Optional
+
+from app.config import config
+from app.db import get_session
+from app.exports import ExportFormat, export_filename, export_view, media_types
+from app.routes.schema_routes import allowed_view_names, get_view_schemas
+from app.utils.auth import auth
+from app.view_query import QueryError, ViewQuery, make_query, query_view
+from fastapi import APIRouter, HTTPException, Query, Security
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+
+router = APIRouter()
+
+columns_query = Query(
+    None, description="Comma separated columns to return, all by default"
+)
+filter_query = Query(
+    [],
+    description="Filters of the form column:op:value, where op is one of eq, ne, "
+    "lt, le, gt, ge, in, like, null or contains",
+)
+sort_query = Query(None, description="The column to sort by, id by default")
+
+
+async def view_query(
+    view_name: str,
+    columns: Optional[str],
+    filter: List[str],
+    sort: Optional[str],
+    order: str,
+    limit: int = config.VIEW_PAGE_SIZE,
+    after: Optional[str] = None,
+) -> ViewQuery:
+    """Validate the query parameters against the cached schema of the view"""
+    if view_name not in allowed_view_names:
+        raise HTTPException(status_code=404, detail="Invalid view name")
+
+    async with get_session() as session:
+        view = (await get_view_schemas(session)).views[view_name]
+    try:
+        return make_query(
+            view_name,
+            view.columns,
+            select=columns.split(",") if columns else None,
+            filters=filter,
+            sort=sort,
+            descending=order == "desc",
+            limit=limit,
+            after=after,
+        )
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{view_name}")
+async def query(
+    view_name: str,
+    columns: Optional[str] = columns_query,
+    filter: List[str] = filter_query,
+    sort: Optional[str] = sort_query,
+    order: Literal["asc", "desc"] = "asc",
+    limit: int = Query(config.VIEW_PAGE_SIZE, ge=1, le=config.VIEW_MAX_PAGE_SIZE),
+    after: Optional[str] = Query(
+        None, description="The next cursor of the previous page"
+    ),
+    auth_result: str = Security(auth.verify),
+):
+    """Return a page of the rows of a view, with a cursor for the next page"""
+    validated = await view_query(view_name, columns, filter, sort, order, limit, after)
+    async with get_session() as session:
+        content = await query_view(session, validated)
+
+    return JSONResponse(status_code=200, content=jsonable_encoder(content))
+
+
+@router.get("/{view_name}/export")
+async def export(
+    view_name: str,
+    format: ExportFormat = "csv",
+    gzip: bool = True,
+    columns: Optional[str] = columns_query,
+    filter: List[str] = filter_query,
+    sort: Optional[str] = sort_query,
+    order: Literal["asc", "desc"] = "asc",
+    auth_result: str = Security(auth.verify),
+):
+    """Download every row of a view, streamed from the database as CSV or NDJSON"""
+    validated = await view_query(view_name, columns, filter, sort, order)
+    filename = export_filename(view_name, format, gzip)
+    return StreamingResponse(
+        export_view(validated, format, gzip),
+        media_type="application/gzip" if gzip else media_types[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,144 @@
+"""
+The sample each GPAS Sample ID maps to.
+
+A summary or mutation upload names its samples by their GPAS Sample ID, the
+remote_sample_name, which a mapping translates to our sample guid. The mappings that
+come with uploads are kept in the gpas_sample_mappings table, upserted so only new
+or changed mappings are written, and any Sample ID an upload has no
+mapping for is looked up there. An upload then only needs to carry the mappings of
+samples that are new to GPAS, or none at all.
+
+Lookups are cached in process, up to SAMPLE_MAPPING_CACHE_SIZE names, each for
+SAMPLE_MAPPING_TTL_SECONDS, as an upload to another worker may change a mapping.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import config
+from app.constants import LOOKUP_CHUNK_SIZE
+from app.utils.utils import chunked
+
+
+class MappingCache:
+    """LRU of the sample guid of each remote sample name, for ttl seconds"""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.names: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+
+    def get(self, remote_sample_name: str) -> Optional[str]:
+        cached = self.names.get(remote_sample_name)
+        if cached is None:
+            return None
+        sample_name, expires = cached
+        if expires <= time.monotonic():
+            del self.names[remote_sample_name]
+            return None
+        self.names.move_to_end(remote_sample_name)
+        return sample_name
+
+    def put(self, remote_sample_name: str, sample_name: str) -> None:
+        if self.size < 1:
+            return
+        self.names[remote_sample_name] = (sample_name, time.monotonic() + self.ttl)
+        self.names.move_to_end(remote_sample_name)
+        while len(self.names) > self.size:
+            self.names.popitem(last=False)
+
+    def discard(self, remote_sample_name: str) -> None:
+        self.names.pop(remote_sample_name, None)
+
+    def clear(self) -> None:
+        self.names.clear()
+
+
+_cache = MappingCache(
+    config.SAMPLE_MAPPING_CACHE_SIZE, config.SAMPLE_MAPPING_TTL_SECONDS
+)
+
+
+def invalidate_mappings() -> None:
+    """Empty the cache so the next lookups read the table"""
+    _cache.clear()
+
+
+async def lookup_mappings(
+    session: AsyncSession, remote_sample_names: Iterable[str]
+) -> Dict[str, str]:
+    """Find the sample guid of each remote sample name that has a stored mapping.
+
+    Args:
+        session (AsyncSession): The database session.
+        remote_sample_names (Iterable[str]): The GPAS Sample IDs to look up.
+
+    Returns:
+        Dict[str, str]: The sample guid by remote sample name, for those mapped.
+    """
+    mappings: Dict[str, str] = {}
+    missing: List[str] = []
+    for name in set(remote_sample_names):
+        sample_name = _cache.get(name)
+        if sample_name is None:
+            missing.append(name)
+        else:
+            mappings[name] = sample_name
+
+    GpasSampleMapping = models.GpasSampleMapping
+    for chunk in chunked(sorted(missing), LOOKUP_CHUNK_SIZE):
+        result = await session.execute(
+            select(
+                GpasSampleMapping.remote_sample_name, GpasSampleMapping.sample_name
+            ).filter(GpasSampleMapping.remote_sample_name.in_(chunk))
+        )
+        for name, sample_name in result:
+            mappings[name] = sample_name
+            _cache.put(name, sample_name)
+    return mappings
+
+
+async def save_mappings(session: AsyncSession, Mapping: List[Dict[str, Any]]) -> None:
+    """Store the new or changed mappings of an upload, in its transaction.
+
+    Rows without both a remote_sample_name and a sample_name are ignored. A name
+    mapped more than once only reaches here as exact duplicates, since mapping_join
+    logs conflicting ones as errors, which fail the upload before anything is stored.
+    Which mappings have changed is decided by the table rather than the cache, which
+    may be stale, so a mapping that has not changed is not rewritten.
+
+    Args:
+        session (AsyncSession): The database session.
+        Mapping (List[Dict[str, Any]]): The uploaded mapping rows.
+    """
+    uploaded = {
+        str(row["remote_sample_name"]): str(row["sample_name"])
+        for row in Mapping
+        if row.get("remote_sample_name") and row.get("sample_name")
+    }
+
+    GpasSampleMapping = models.GpasSampleMapping
+    for chunk in chunked(uploaded.items(), config.IMPORT_BATCH_SIZE):
+        insert_stmt = insert(GpasSampleMapping).values(
+            [
+                {"remote_sample_name": name, "sample_name": sample_name}
+                for name, sample_name in chunk
+            ]
+        )
+        await session.execute(
+            insert_stmt.on_conflict_do_update(
+                constraint="uq_gpas_sample_mappings_remote_sample_name",
+                set_={"sample_name": insert_stmt.excluded.sample_name},
+                where=GpasSampleMapping.sample_name != insert_stmt.excluded.sample_name,
+            )
+        )
+
+    # not cached until read back, as the upload may yet be rolled back
+    for name in uploaded:
+        _cache.discard(name)
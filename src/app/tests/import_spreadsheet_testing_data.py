@@ -174,4 +174,45 @@ specimen_data_details: List[Dict[str, Any]] = [
     },
 ]
 
-sample_data: List[Dict[str, Any]] = []
+sample_data: List[Dict[str, Any]] = [
+    {
+        "run_code": "Run1",
+        "accession": "adfs1",
+        "collection_date": "2024-01-01",
+        "organism": "sponge bob",
+        "guid": "sample1",
+        "sample_category": "culture",
+        "nucleic_acid_type": "DNA",
+        "extraction_method": "method1",
+        "extraction_protocol": "protocol1",
+        "extraction_user": "user1",
+        "spike_name_1": "spike a",
+        "spike_quantity_1": "10",
+        "spike_name_2": "spike b",
+        "spike_quantity_2": 20,
+    },
+    {
+        "run_code": "Run1",
+        "accession": "adfs2",
+        "collection_date": "2024-01-01",
+        "organism": "square pants",
+        "guid": "sample2",
+        "sample_category": "culture",
+        "nucleic_acid_type": "DNA, RNA",
+        "extraction_method": "method1",
+        "extraction_protocol": "protocol1",
+        "extraction_user": "user1",
+        "spike_name_1": "spike a",
+        "spike_quantity_1": "5",
+    },
+]
+
+# spike b is removed from sample1 and spike a changes quantity
+sample_data2: List[Dict[str, Any]] = [
+    {
+        **sample_data[0],
+        "spike_quantity_1": "15",
+        "spike_name_2": None,
+        "spike_quantity_2": None,
+    },
+]
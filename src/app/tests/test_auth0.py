@@ -0,0 +1,73 @@
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials, SecurityScopes
+
+from app.config import config
+from app.utils.auth0 import UnauthorizedException
+from app.utils.jwks_stub import StubJwks
+
+
+def bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.fixture
+def stub(monkeypatch) -> StubJwks:
+    monkeypatch.setattr(config, "AUTH0_API_AUDIENCE", "https://labbox.test")
+    monkeypatch.setattr(config, "AUTH0_ISSUER", "https://stub.invalid/")
+    return StubJwks()
+
+
+@pytest.mark.asyncio
+async def test_verify_caches_keys_and_tokens(stub: StubJwks):
+    """Test that the JWKS is fetched once and a verified token is not decoded again.
+
+    Two tokens are verified twice each against the stub JWKS. The keys should be
+    fetched on the first verification only, a repeated token should come from the
+    token cache, and scopes should still be checked on a cached token.
+    """
+    verifier = stub.verifier()
+    token = stub.token(permissions=["read"])
+    other = stub.token(sub="stub|other")
+
+    payload = await verifier.verify(SecurityScopes(["read"]), bearer(token))
+    assert payload["permissions"] == ["read"]
+    await verifier.verify(SecurityScopes(), bearer(other))
+    assert await verifier.verify(SecurityScopes(), bearer(token)) == payload
+    assert stub.requests == 1
+    assert len(verifier.tokens.payloads) == 2
+
+    with pytest.raises(UnauthorizedException):
+        await verifier.verify(SecurityScopes(["admin"]), bearer(token))
+
+
+@pytest.mark.asyncio
+async def test_verify_rejects_bad_tokens(stub: StubJwks, monkeypatch):
+    """Test that expired, unknown-key and tampered tokens are rejected and not cached.
+
+    A token signed by a key the JWKS does not have should refetch the keys once, and
+    not again within JWKS_MIN_REFRESH_SECONDS.
+    """
+    verifier = stub.verifier()
+    await verifier.verify(SecurityScopes(), bearer(stub.token()))
+
+    with pytest.raises(UnauthorizedException):
+        await verifier.verify(SecurityScopes(), bearer(stub.token(expires_in=-60)))
+
+    rotated = StubJwks(kid="rotated-key")
+    for _ in range(2):
+        with pytest.raises(UnauthorizedException):
+            await verifier.verify(SecurityScopes(), bearer(rotated.token()))
+    assert stub.requests == 1
+
+    monkeypatch.setattr(config, "JWKS_MIN_REFRESH_SECONDS", 0)
+    with pytest.raises(UnauthorizedException):
+        await verifier.verify(SecurityScopes(), bearer(rotated.token()))
+    assert stub.requests == 2
+
+    header, body, signature = stub.token().split(".")
+    forged = rotated.token(sub="stub|forged").split(".")[1]
+    with pytest.raises(UnauthorizedException):
+        await verifier.verify(
+            SecurityScopes(), bearer(f"{header}.{forged}.{signature}")
+        )
+    assert len(verifier.tokens.payloads) == 1
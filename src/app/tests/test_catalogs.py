@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.catalogs import get_catalogs, invalidate_catalogs
+from app.models import OtherType
+
+
+@pytest.mark.asyncio
+async def test_catalogs_reload_on_change(db_session: AsyncSession):
+    """Test that the cached catalogs are reused until a lookup table changes.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    invalidate_catalogs()
+
+    catalogs = await get_catalogs(db_session)
+    assert "null_calls" in [other_type.code for other_type in catalogs.other_types]
+    assert "GBR" in catalogs.countries
+
+    # nothing has changed, so the same catalogs are returned
+    assert await get_catalogs(db_session) is catalogs
+
+    # changing a lookup table bumps the catalog version
+    await db_session.execute(delete(OtherType).filter(OtherType.code == "null_calls"))
+
+    reloaded = await get_catalogs(db_session)
+    assert reloaded is not catalogs
+    assert reloaded.version > catalogs.version
+    assert "null_calls" not in [other_type.code for other_type in reloaded.other_types]
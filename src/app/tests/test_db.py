@@ -0,0 +1,30 @@
+import pytest
+
+from app import db
+from app.config import config
+
+
+@pytest.mark.asyncio
+async def test_shared_engine(monkeypatch):
+    """Test that every session shares one engine, with the configured pool.
+
+    No connection is opened, so this only checks the pool settings and that the
+    engine is created once and dropped again by dispose_engine.
+    """
+    monkeypatch.setattr(config, "DATABASE_POOL_SIZE", 7)
+    monkeypatch.setattr(config, "DATABASE_MAX_OVERFLOW", 3)
+    monkeypatch.setattr(db, "_engine", None)
+    monkeypatch.setattr(db, "_sessionmaker", None)
+
+    engine = db.init_engine()
+    try:
+        assert db.init_engine() is engine
+        assert db.get_sessionmaker()().bind is engine
+
+        stats = db.pool_stats()
+        assert stats["size"] == 7 and stats["maxOverflow"] == 3
+        assert stats["checkedOut"] == 0
+    finally:
+        await db.dispose_engine()
+
+    assert db.pool_stats() == {"initialised": False}
@@ -0,0 +1,74 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.exports import export_view, gzip_chunks
+from app.importers.import_spreadsheet import import_runs
+from app.importers.validation import validate_rows
+from app.routes.schema_routes import get_view_schemas
+from app.tests.import_spreadsheet_testing_data import run_data
+from app.upload_models import RunImport
+from app.view_query import make_query
+
+
+@pytest.mark.asyncio
+async def test_export_view_csv_and_ndjson(db_session: AsyncSession, logger_mock):
+    """Test that a filtered export streams the same rows as CSV and gzipped NDJSON.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    await import_runs(db_session, validate_rows(RunImport, run_data)[0], logger_mock)
+    await db_session.commit()
+
+    columns = (await get_view_schemas(db_session)).views["runs_view"].columns
+    query = make_query(
+        "runs_view",
+        columns,
+        select=["code", "run_date", "passed_qc"],
+        filters=["site:in:SiteA,SiteB"],
+        sort="code",
+        descending=True,
+    )
+    engine: AsyncEngine = db_session.bind  # type: ignore
+
+    content = b"".join(
+        [chunk async for chunk in export_view(query, "csv", engine=engine)]
+    )
+    rows = list(csv.DictReader(io.StringIO(content.decode("utf-8"))))
+    assert rows == [
+        {"code": "Run2", "run_date": "2024-01-01", "passed_qc": "f"},
+        {"code": "Run1", "run_date": "2024-01-01", "passed_qc": "t"},
+    ]
+
+    content = b"".join(
+        [
+            chunk
+            async for chunk in export_view(query, "ndjson", gzip=True, engine=engine)
+        ]
+    )
+    lines = gzip.decompress(content).decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"code": "Run2", "run_date": "2024-01-01", "passed_qc": False},
+        {"code": "Run1", "run_date": "2024-01-01", "passed_qc": True},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_gzip_chunks():
+    """Test that chunks compressed on the fly decompress to the whole export."""
+
+    async def chunks():
+        for i in range(1000):
+            yield f"{i},row {i}\n".encode()
+
+    compressed = b"".join([chunk async for chunk in gzip_chunks(chunks())])
+
+    assert gzip.decompress(compressed) == b"".join(
+        f"{i},row {i}\n".encode() for i in range(1000)
+    )
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.importers.import_spreadsheet import import_specimens
+from app.importers.validation import validate_rows
+from app.models import Specimen, SpecimenDetail
+from app.tests.import_spreadsheet_testing_data import specimen_data
+from app.upload_models import SpecimensImport
+
+
+async def flattened_host(db_session: AsyncSession, accession: str):
+    result = await db_session.execute(
+        text(
+            "SELECT details.host FROM flattened_specimen_details details"
+            " JOIN specimens ON specimens.id = details.specimen_id"
+            " WHERE specimens.accession = :accession"
+        ),
+        {"accession": accession},
+    )
+    return result.scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_flattened_details_follow_changes(db_session: AsyncSession, logger_mock):
+    """Test that the materialized flattened details follow their detail rows.
+
+    The imported specimens should each have a row in flattened_specimen_details, which
+    changes when one of their details is updated or deleted, without touching the row
+    of the other specimen, and specimens_view should read the stored values.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    await import_specimens(
+        db_session, validate_rows(SpecimensImport, specimen_data)[0], logger_mock
+    )
+    await db_session.flush()
+
+    assert await flattened_host(db_session, "adfs1") == specimen_data[0]["host"]
+    other_host = await flattened_host(db_session, "adfs2")
+
+    specimen_id = await db_session.scalar(
+        select(Specimen.id).filter(Specimen.accession == "adfs1")
+    )
+    host = (SpecimenDetail.specimen_id == specimen_id) & (
+        SpecimenDetail.specimen_detail_type_code == "host"
+    )
+    await db_session.execute(
+        update(SpecimenDetail).filter(host).values(value_str="cat")
+    )
+    assert await flattened_host(db_session, "adfs1") == "cat"
+
+    await db_session.execute(delete(SpecimenDetail).filter(host))
+    assert await flattened_host(db_session, "adfs1") is None
+    assert await flattened_host(db_session, "adfs2") == other_host
+
+    view_host = await db_session.scalar(
+        text("SELECT host FROM specimens_view WHERE accession = 'adfs2'")
+    )
+    assert view_host == other_host
@@ -0,0 +1,138 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.importers.import_gpas import upsert_mutations, upsert_summaries
+from app.importers.import_spreadsheet import (
+    import_runs,
+    import_samples,
+    import_specimens,
+)
+from app.importers.validation import validate_rows
+from app.models import Analysis, DrugResistance, Mutations, Speciation
+from app.tests.import_spreadsheet_testing_data import (
+    run_data,
+    sample_data,
+    specimen_data,
+)
+from app.upload_models import (
+    GpasSummary,
+    Mutations as MutationImport,
+    RunImport,
+    SamplesImport,
+    SpecimensImport,
+)
+
+
+def summary_rows(prediction: str):
+    return [
+        {
+            "sample_name": guid,
+            "Batch": "batch1",
+            "Main Species": "Mycobacterium tuberculosis_lineage 4",
+            "Resistance Prediction": prediction,
+            "Null calls": 3,
+        }
+        for guid in ("sample1", "sample2")
+    ]
+
+
+def mutation_rows(prediction: str):
+    return [
+        {
+            "sample_name": guid,
+            "Batch": "batch1",
+            "Species": "Mycobacterium tuberculosis",
+            "Drug": "INH",
+            "Gene": gene,
+            "Mutation": "S315T",
+            "Position": 315,
+            "Ref": "agc",
+            "Alt": "acc",
+            "Coverage": "50",
+            "Prediction": prediction,
+            "Evidence": "{}",
+        }
+        for guid in ("sample1", "sample2")
+        for gene in ("katG", "inhA")
+    ]
+
+
+@pytest.mark.asyncio
+async def test_upsert_summaries(db_session: AsyncSession, logger_mock):
+    """Test that the bulk summary path inserts once and then updates in place.
+
+    Uploading the same two summaries twice, with a different resistance prediction
+    the second time, should leave one analysis, one speciation and eight drug
+    resistances per sample, with the second prediction.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    await import_runs(db_session, validate_rows(RunImport, run_data)[0], logger_mock)
+    await import_specimens(
+        db_session, validate_rows(SpecimensImport, specimen_data)[0], logger_mock
+    )
+    await import_samples(
+        db_session, validate_rows(SamplesImport, sample_data)[0], logger_mock
+    )
+    await db_session.flush()
+
+    for prediction in ("SSSS SS SS", "RRSS SS SS"):
+        gpas_summaries = validate_rows(GpasSummary, summary_rows(prediction))[0]
+        await upsert_summaries(db_session, gpas_summaries, logger_mock, dryrun=False)
+    await db_session.flush()
+
+    assert await db_session.scalar(select(func.count()).select_from(Analysis)) == 2
+    assert await db_session.scalar(select(func.count()).select_from(Speciation)) == 2
+    results = await db_session.execute(
+        select(DrugResistance.drug_resistance_result_type_code, func.count()).group_by(
+            DrugResistance.drug_resistance_result_type_code
+        )
+    )
+    assert dict(results.tuples().all()) == {"R": 4, "S": 12}
+
+    species = await db_session.scalars(select(Speciation.sub_species))
+    assert set(species) == {"lineage 4"}
+    logger_mock.error.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_upsert_mutations(db_session: AsyncSession, logger_mock):
+    """Test that the bulk mutation path inserts once and then updates in place.
+
+    Uploading the same four mutations twice, with a different prediction the second
+    time, should leave one analysis per sample and four mutations with the second
+    prediction, logged as one count per batch rather than a line per mutation.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    await import_runs(db_session, validate_rows(RunImport, run_data)[0], logger_mock)
+    await import_specimens(
+        db_session, validate_rows(SpecimensImport, specimen_data)[0], logger_mock
+    )
+    await import_samples(
+        db_session, validate_rows(SamplesImport, sample_data)[0], logger_mock
+    )
+    await db_session.flush()
+    logger_mock.reset_mock()
+
+    for prediction in ("S", "R"):
+        mutations = validate_rows(MutationImport, mutation_rows(prediction))[0]
+        await upsert_mutations(db_session, mutations, logger_mock, dryrun=False)
+    await db_session.flush()
+
+    assert await db_session.scalar(select(func.count()).select_from(Analysis)) == 2
+    predictions = await db_session.scalars(select(Mutations.prediction))
+    assert list(predictions) == ["R"] * 4
+
+    counts = [
+        (call.kwargs["extra"]["code"], call.kwargs["extra"]["count"])
+        for call in logger_mock.info.call_args_list
+        if call.kwargs["extra"]["code"].startswith("mutations.")
+    ]
+    assert counts == [("mutations.added", 4), ("mutations.updated", 4)]
+    logger_mock.error.assert_not_called()
@@ -7,6 +7,7 @@ from app.models import Owner
 from app.upload_models import SpecimensImport
 
 from app.tests.import_spreadsheet_testing_data import specimen_data
+from app.tests.test_import_spreadsheet_runs import message
 
 
 @pytest.mark.asyncio
@@ -44,6 +45,6 @@ async def test_import_owners(db_session: AsyncSession, logger_mock):
     # Check the log messages from the import
     assert logger_mock.mock_calls[0][0] == "info"
     assert (
-        logger_mock.mock_calls[0][1][0]
+        message(logger_mock.mock_calls[0])
         == "Specimens Sheet Row 2: Owner blah owner, blah site does not exist, adding"
     )
@@ -0,0 +1,240 @@
+from datetime import date
+from typing import List
+
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.importers.import_spreadsheet import (
+    import_runs,
+    import_specimens,
+    upsert_runs,
+)
+from app.importers.plan import (
+    FieldChange,
+    ImportPlan,
+    PlannedChange,
+    WorkbookPlanner,
+    commit_plan,
+    plan_data,
+)
+from app.importers.validation import validate_rows
+from app.logs import make_logger
+from app.models import Run
+from app.upload_models import RunImport, SpecimensImport
+from app.tests.import_spreadsheet_testing_data import (
+    run_data,
+    run_data2,
+    specimen_data,
+    specimen_data2,
+)
+
+
+@pytest.mark.asyncio
+async def test_plan_runs_no_writes(db_session: AsyncSession, logger_mock):
+    """Test that planning runs reports the changes without writing anything.
+
+    This test imports run_data, then plans run_data2 against it while recording every
+    statement sent to the database. Run2 should be planned as an update of run_date
+    and sequencing_method, Run3 as a create, and no statement should write.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    await import_runs(db_session, validate_rows(RunImport, run_data)[0], logger_mock)
+    await db_session.commit()
+
+    statements: List[str] = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    planner = WorkbookPlanner(db_session, logger_mock)
+    sync_engine = db_session.bind.sync_engine  # type: ignore
+    event.listen(sync_engine, "before_cursor_execute", record_statement)
+    try:
+        await planner.plan_runs(validate_rows(RunImport, run_data2)[0])
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", record_statement)
+
+    assert statements
+    assert not [
+        statement
+        for statement in statements
+        if statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE"))
+    ]
+    assert not db_session.new and not db_session.dirty
+
+    update = planner.plan.get("runs", ("Run2",))
+    assert update is not None and update.action == "update"
+    assert set(update.fields) == {
+        FieldChange("run_date", date(2024, 1, 1), date(2024, 1, 2)),
+        FieldChange("sequencing_method", "ont", "pacbio"),
+    }
+    create = planner.plan.get("runs", ("Run3",))
+    assert create is not None and create.action == "create" and create.row == 3
+    assert planner.plan.summary() == {"runs": {"update": 1, "create": 1}}
+
+    count = await db_session.scalar(select(func.count()).select_from(Run))
+    assert count == len(run_data)
+
+
+@pytest.mark.asyncio
+async def test_plan_specimens_new_owner(db_session: AsyncSession, logger_mock):
+    """Test that planning specimens plans new owners and specimens once each.
+
+    specimen_data2 has one specimen already imported from specimen_data and one new
+    one, both for an existing owner. Planning it for a new owner should create that
+    owner once and move the existing specimen to it.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    await import_specimens(
+        db_session, validate_rows(SpecimensImport, specimen_data)[0], logger_mock
+    )
+    await db_session.commit()
+
+    new_owner_data = [
+        {**specimen, "owner_site": "new site", "owner_user": "new user"}
+        for specimen in specimen_data2
+    ]
+    planner = WorkbookPlanner(db_session, logger_mock)
+    await planner.plan_specimens(validate_rows(SpecimensImport, new_owner_data)[0])
+
+    owner = planner.plan.get("owners", ("new site", "new user"))
+    assert owner is not None and owner.action == "create" and owner.row == 2
+
+    key = ("adfs2", date(2024, 1, 1), "square pants")
+    update = planner.plan.get("specimens", key)
+    assert update is not None and update.action == "update"
+    assert (
+        FieldChange("owner", ("blah owner", "blah site"), ("new site", "new user"))
+        in update.fields
+    )
+    assert FieldChange("specimen_type", "test", "test2") in update.fields
+    assert planner.plan.summary()["specimens"] == {"update": 1, "create": 1}
+    assert not db_session.new and not db_session.dirty
+
+
+@pytest.mark.asyncio
+async def test_commit_plan(db_session: AsyncSession):
+    """Test that committing a plan writes the planned changes, once.
+
+    run_data2 is planned against run_data and committed through its token, which
+    should update Run2 and add Run3 as planned. The plan is removed by the commit, so
+    its token cannot be committed again.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    await import_runs(
+        db_session, validate_rows(RunImport, run_data)[0], make_logger("test-import")
+    )
+    await db_session.commit()
+
+    planned = await plan_data(
+        db_session, run_data2, [], [], [], make_logger("test-plan")
+    )
+    assert planned is not None and planned.token is not None
+    assert planned.summary() == {"runs": {"update": 1, "create": 1}}
+
+    commit_logger = make_logger("test-commit")
+    assert await commit_plan(db_session, planned.token, commit_logger)
+    assert not commit_logger.error_occurred
+
+    result = await db_session.execute(select(Run).order_by(Run.code))
+    runs = {run.code: run for run in result.scalars()}
+    assert sorted(runs) == ["Run1", "Run2", "Run3"]
+    assert runs["Run2"].run_date == date(2024, 1, 2)
+    assert runs["Run2"].sequencing_method == "pacbio"
+
+    again_logger = make_logger("test-again")
+    assert not await commit_plan(db_session, planned.token, again_logger)
+    assert again_logger.error_occurred
+
+
+@pytest.mark.asyncio
+async def test_commit_plan_stale(db_session: AsyncSession):
+    """Test that a plan is refused once a row it updates has been written.
+
+    After run_data2 is planned, Run2 is changed through the set based upsert, which
+    sqlalchemy-continuum does not version. The commit should still see that Run2 has
+    changed, refuse the plan and write nothing.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    await import_runs(
+        db_session, validate_rows(RunImport, run_data)[0], make_logger("test-import")
+    )
+    await db_session.commit()
+
+    planned = await plan_data(
+        db_session, run_data2, [], [], [], make_logger("test-plan")
+    )
+    assert planned is not None and planned.token is not None
+
+    changed = [{**run_data[1], "comment": "changed after the plan"}]
+    await upsert_runs(
+        db_session, validate_rows(RunImport, changed)[0], make_logger("test-upsert")
+    )
+    await db_session.commit()
+
+    commit_logger = make_logger("test-commit")
+    assert not await commit_plan(db_session, planned.token, commit_logger)
+    assert commit_logger.error_occurred
+
+    count = await db_session.scalar(select(func.count()).select_from(Run))
+    assert count == len(run_data)
+    run2 = await db_session.scalar(select(Run).filter(Run.code == "Run2"))
+    assert run2 is not None and run2.run_date == date(2024, 1, 1)
+
+
+def test_plan_to_dict_pages():
+    """Test that a plan lists one page of its changes, with the count of them all"""
+    planned = ImportPlan(token="token")
+    for code in ("Run1", "Run2", "Run3"):
+        planned.add(PlannedChange("create", "runs", (code,), "Runs Sheet", 2))
+
+    page = planned.to_dict(offset=1, limit=1)
+    assert page["token"] == "token"
+    assert page["summary"] == {"runs": {"create": 3}}
+    assert page["changeCount"] == 3
+    assert [change["key"] for change in page["changes"]] == [["Run2"]]
+    assert len(planned.to_dict()["changes"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_commit_plan_stale_unchanged_row(db_session: AsyncSession):
+    """Test that a plan is refused once a row it left unchanged has been written.
+
+    run_data is planned against itself, so the plan changes nothing, and planning it
+    again at the same state gives the same token. Once Run1 is changed the plan
+    should be refused, though it has no change to Run1.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    await import_runs(
+        db_session, validate_rows(RunImport, run_data)[0], make_logger("test-import")
+    )
+    await db_session.commit()
+
+    planned = await plan_data(db_session, run_data, [], [], [], make_logger("plan"))
+    assert planned is not None and planned.token is not None
+    assert planned.summary() == {}
+    again = await plan_data(db_session, run_data, [], [], [], make_logger("again"))
+    assert again is not None and again.token == planned.token
+
+    changed = [{**run_data[0], "comment": "changed after the plan"}]
+    await upsert_runs(
+        db_session, validate_rows(RunImport, changed)[0], make_logger("test-upsert")
+    )
+    await db_session.commit()
+
+    commit_logger = make_logger("test-commit")
+    assert not await commit_plan(db_session, planned.token, commit_logger)
+    assert commit_logger.error_occurred
@@ -1,10 +1,12 @@
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List
 import pytest
-from sqlalchemy import asc, select
+from sqlalchemy import asc, event, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.importers.import_spreadsheet import import_runs
+from app.importers.validation import validate_rows, validate_sheet
+from app.upload_models import RunImport
 from app.models import Run
 from app.tests.import_spreadsheet_testing_data import (
     bad_run_data,
@@ -14,6 +16,11 @@ from app.tests.import_spreadsheet_testing_data import (
 )
 
 
+def message(call) -> str:
+    """The message a mock logger call would log, with its arguments merged"""
+    return call[1][0] % call[1][1:]
+
+
 def assert_run_record_matches(run_record: Run, run_entry: Dict[str, Any]):
     assert run_record.code == run_entry["code"]
     assert (
@@ -48,7 +55,9 @@ async def test_import_runs_update_insert(
         logger_mock (CustomLogger): The mock logger fixture.
     """
     # intial import
-    await import_runs(db_session, run_data, logger_mock, dryrun=True)
+    await import_runs(
+        db_session, validate_rows(RunImport, run_data)[0], logger_mock, dryrun=True
+    )
 
     result = await db_session.execute(select(Run).order_by(asc(Run.code)))
     run_records = result.scalars().all()
@@ -63,7 +72,9 @@ async def test_import_runs_update_insert(
         assert_run_record_matches(run_record, run_entry)
 
     # second import
-    await import_runs(db_session, run_data2, logger_mock, dryrun=True)
+    await import_runs(
+        db_session, validate_rows(RunImport, run_data2)[0], logger_mock, dryrun=True
+    )
 
     result = await db_session.execute(select(Run).order_by(asc(Run.code)))
     run_records = result.scalars().all()
@@ -83,21 +94,25 @@ async def test_import_runs_update_insert(
     # Check the log messages from the first import
     assert logger_mock.mock_calls[0][0] == "info"
     assert (
-        logger_mock.mock_calls[0][1][0] == "Runs Sheet Row 2: Run Run1 does not exist"
+        message(logger_mock.mock_calls[0])
+        == "Runs Sheet Row 2: Run Run1 does not exist"
     )
     assert logger_mock.mock_calls[1][0] == "info"
     assert (
-        logger_mock.mock_calls[1][1][0] == "Runs Sheet Row 3: Run Run2 does not exist"
+        message(logger_mock.mock_calls[1])
+        == "Runs Sheet Row 3: Run Run2 does not exist"
     )
 
     # Check the log messages from the second import
     assert logger_mock.mock_calls[2][0] == "info"
     assert (
-        logger_mock.mock_calls[2][1][0] == "Runs Sheet Row 2: Run Run2 already exists"
+        message(logger_mock.mock_calls[2])
+        == "Runs Sheet Row 2: Run Run2 already exists"
     )
     assert logger_mock.mock_calls[3][0] == "info"
     assert (
-        logger_mock.mock_calls[3][1][0] == "Runs Sheet Row 3: Run Run3 does not exist"
+        message(logger_mock.mock_calls[3])
+        == "Runs Sheet Row 3: Run Run3 does not exist"
     )
 
 
@@ -107,56 +122,115 @@ async def test_import_bad_run(
     logger_mock,
 ):
     """
-    Test the import_runs function with bad run_data.
+    Test the validation of the runs sheet with bad run_data.
 
-    This test ensures that the import_runs function correctly logs the errors
-    when importing bad run_data into the database.
+    This test ensures that validate_sheet correctly logs the errors in bad run_data
+    before anything is imported into the database.
 
     Args:
         db_session (AsyncSession): The database session fixture.
         logger_mock (CustomLogger): The mock logger fixture.
     """
-    await import_runs(db_session, bad_run_data, logger_mock, dryrun=True)
+    await validate_sheet(RunImport, bad_run_data, logger_mock, "Runs Sheet")
 
     # check the number of error log messages
     assert len(logger_mock.mock_calls) == 8
     assert logger_mock.mock_calls[0][0] == "error"
     assert (
-        logger_mock.mock_calls[0][1][0]
+        message(logger_mock.mock_calls[0])
         == "Runs Sheet Row 2 ('code',) : String should have at most 20 characters"
     )
     assert logger_mock.mock_calls[1][0] == "error"
     assert (
-        logger_mock.mock_calls[1][1][0]
+        message(logger_mock.mock_calls[1])
         == "Runs Sheet Row 2 ('run_date',) : Input should be a valid date or datetime, month value is outside expected range of 1-12"
     )
     assert logger_mock.mock_calls[2][0] == "error"
     assert (
-        logger_mock.mock_calls[2][1][0]
+        message(logger_mock.mock_calls[2])
         == "Runs Sheet Row 2 ('site',) : String should have at most 20 characters"
     )
     assert logger_mock.mock_calls[3][0] == "error"
     assert (
-        logger_mock.mock_calls[3][1][0]
+        message(logger_mock.mock_calls[3])
         == "Runs Sheet Row 2 ('sequencing_method',) : Input should be 'illumina', 'ont' or 'pacbio'"
     )
     assert logger_mock.mock_calls[4][0] == "error"
     assert (
-        logger_mock.mock_calls[4][1][0]
+        message(logger_mock.mock_calls[4])
         == "Runs Sheet Row 2 ('machine',) : String should have at most 20 characters"
     )
     assert logger_mock.mock_calls[5][0] == "error"
     assert (
-        logger_mock.mock_calls[5][1][0]
+        message(logger_mock.mock_calls[5])
         == "Runs Sheet Row 2 ('user',) : Value should have at most 5 items after validation, not 9"
     )
     assert logger_mock.mock_calls[6][0] == "error"
     assert (
-        logger_mock.mock_calls[6][1][0]
+        message(logger_mock.mock_calls[6])
         == "Runs Sheet Row 2 ('number_samples',) : Input should be greater than 0"
     )
     assert logger_mock.mock_calls[7][0] == "error"
     assert (
-        logger_mock.mock_calls[7][1][0]
+        message(logger_mock.mock_calls[7])
         == "Runs Sheet Row 2 ('flowcell',) : Value should have at most 20 items after validation, not 28"
     )
+
+
+@pytest.mark.asyncio
+async def test_import_runs_query_count(
+    db_session: AsyncSession,
+    logger_mock,
+):
+    """
+    Test that import_runs looks up the existing runs once per sheet rather than once per row.
+
+    This test imports a sheet of runs twice, once when none of the runs exist and once
+    when all of them exist, and counts the SELECT statements issued against the runs
+    table for each import.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    many_run_data = [{**run_data[0], "code": f"Run{i}"} for i in range(50)]
+
+    statements: List[str] = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def run_selects() -> List[str]:
+        return [
+            statement
+            for statement in statements
+            if statement.lstrip().upper().startswith("SELECT")
+            and "FROM runs" in statement
+        ]
+
+    sync_engine = db_session.bind.sync_engine  # type: ignore
+    event.listen(sync_engine, "before_cursor_execute", record_statement)
+    try:
+        await import_runs(
+            db_session, validate_rows(RunImport, many_run_data)[0], logger_mock
+        )
+        assert len(run_selects()) == 1
+
+        await db_session.flush()
+        statements.clear()
+
+        await import_runs(
+            db_session, validate_rows(RunImport, many_run_data)[0], logger_mock
+        )
+        assert len(run_selects()) == 1
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", record_statement)
+
+    result = await db_session.execute(select(Run))
+    assert len(result.scalars().all()) == len(many_run_data)
+
+    # the second import should have found every run
+    assert (
+        message(logger_mock.mock_calls[-1])
+        == "Runs Sheet Row 51: Run Run49 already exists, updating"
+    )
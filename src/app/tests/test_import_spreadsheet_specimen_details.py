@@ -5,6 +5,8 @@ from sqlalchemy.orm import joinedload
 from typing import Optional
 
 from app.importers.import_spreadsheet import import_specimens
+from app.importers.validation import validate_rows
+from app.upload_models import SpecimensImport
 from app.models import Specimen, SpecimenDetail
 
 from app.tests.import_spreadsheet_testing_data import (
@@ -32,7 +34,9 @@ def find_detail_by_code(details, code: str) -> Optional[SpecimenDetail]:
 @pytest.mark.asyncio
 async def test_import_specimens_details(db_session: AsyncSession, logger_mock):
     # Import the first set of specimen data
-    await import_specimens(db_session, specimen_data, logger_mock)
+    await import_specimens(
+        db_session, validate_rows(SpecimensImport, specimen_data)[0], logger_mock
+    )
 
     # Check that the specimen data is imported correctly for accession "adfs1"
     specimen_record: Optional[Specimen] = await db_session.scalar(
@@ -93,7 +97,12 @@ async def test_import_specimens_details(db_session: AsyncSession, logger_mock):
     # Update the specimen data with the specimen details for Specimen accession "asdf1"
     # Need to use flush and expire_all here to make the delete on the details to make the
     # session aware of the changes. Could also use a commit here but that would write to the db
-    await import_specimens(db_session, specimen_data_details, logger_mock, dryrun=True)
+    await import_specimens(
+        db_session,
+        validate_rows(SpecimensImport, specimen_data_details)[0],
+        logger_mock,
+        dryrun=True,
+    )
     await db_session.flush()
     db_session.expire_all()
 
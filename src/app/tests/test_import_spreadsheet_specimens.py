@@ -1,10 +1,12 @@
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List
 import pytest
-from sqlalchemy import asc, select
+from sqlalchemy import asc, event, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.importers.import_spreadsheet import import_specimens
+from app.importers.validation import validate_rows, validate_sheet
+from app.upload_models import SpecimensImport
 from app.models import Specimen
 from app.tests.import_spreadsheet_testing_data import (
     specimen_data,
@@ -12,6 +14,7 @@ from app.tests.import_spreadsheet_testing_data import (
     combined_specimen_data,
     bad_specimen_data,
 )
+from app.tests.test_import_spreadsheet_runs import message
 
 
 def assert_specimen_record_matches(
@@ -54,7 +57,12 @@ async def test_import_specimens_update_insert(db_session: AsyncSession, logger_m
         logger_mock (_type_): The mock logger fixture.
     """
     # Import the first set of specimen data
-    await import_specimens(db_session, specimen_data, logger_mock, dryrun=True)
+    await import_specimens(
+        db_session,
+        validate_rows(SpecimensImport, specimen_data)[0],
+        logger_mock,
+        dryrun=True,
+    )
 
     result = await db_session.execute(
         select(Specimen).order_by(asc(Specimen.accession))
@@ -71,7 +79,12 @@ async def test_import_specimens_update_insert(db_session: AsyncSession, logger_m
         assert_specimen_record_matches(specimen_record, specimen_entry)
 
     # Import the second set of specimen data
-    await import_specimens(db_session, specimen_data2, logger_mock, dryrun=True)
+    await import_specimens(
+        db_session,
+        validate_rows(SpecimensImport, specimen_data2)[0],
+        logger_mock,
+        dryrun=True,
+    )
 
     result = await db_session.execute(
         select(Specimen).order_by(asc(Specimen.accession))
@@ -95,29 +108,29 @@ async def test_import_specimens_update_insert(db_session: AsyncSession, logger_m
     # Check the log messages from the first import
     assert logger_mock.mock_calls[0][0] == "info"
     assert (
-        logger_mock.mock_calls[0][1][0]
+        message(logger_mock.mock_calls[0])
         == "Specimens Sheet Row 2: Owner blah owner, blah site does not exist"
     )
     assert logger_mock.mock_calls[1][0] == "info"
     assert (
-        logger_mock.mock_calls[1][1][0]
+        message(logger_mock.mock_calls[1])
         == "Specimens Sheet Row 2: Specimen adfs1, 2024-01-01, sponge bob does not exist"
     )
     assert logger_mock.mock_calls[2][0] == "info"
     assert (
-        logger_mock.mock_calls[2][1][0]
+        message(logger_mock.mock_calls[2])
         == "Specimens Sheet Row 3: Specimen adfs2, 2024-01-01, square pants does not exist"
     )
 
     # Check the log messages from the second import
     assert logger_mock.mock_calls[3][0] == "info"
     assert (
-        logger_mock.mock_calls[3][1][0]
+        message(logger_mock.mock_calls[3])
         == "Specimens Sheet Row 2: Specimen adfs2, 2024-01-01, square pants already exists"
     )
     assert logger_mock.mock_calls[4][0] == "info"
     assert (
-        logger_mock.mock_calls[4][1][0]
+        message(logger_mock.mock_calls[4])
         == "Specimens Sheet Row 3: Specimen adfs3, 2024-03-01, krusty krab does not exist"
     )
 
@@ -127,9 +140,9 @@ async def test_import_bad_specimen(
     db_session: AsyncSession,
     logger_mock,
 ):
-    """Test the import_specimens function with bad specimen data.
+    """Test the validation of the specimens sheet with bad specimen data.
 
-    This test ensures that the import_specimens function correctly handles bad specimen data
+    This test ensures that validate_sheet correctly handles bad specimen data
     and does not import any records into the database. It also checks that the logger is called
     with the expected messages.
 
@@ -137,7 +150,9 @@ async def test_import_bad_specimen(
         db_session (AsyncSession): The database session fixture.
         logger_mock (_type_): The mock logger fixture.
     """
-    await import_specimens(db_session, bad_specimen_data, logger_mock, dryrun=True)
+    await validate_sheet(
+        SpecimensImport, bad_specimen_data, logger_mock, "Specimens Sheet"
+    )
 
     result = await db_session.execute(
         select(Specimen).order_by(asc(Specimen.accession))
@@ -155,18 +170,66 @@ async def test_import_bad_specimen(
     # Check the log messages from the import
     assert logger_mock.mock_calls[0][0] == "error"
     assert (
-        logger_mock.mock_calls[0][1][0]
+        message(logger_mock.mock_calls[0])
         == "Specimens Sheet Row 2 ('accession',) : String should have at most 20 characters"
     )
 
     assert logger_mock.mock_calls[1][0] == "error"
     assert (
-        logger_mock.mock_calls[1][1][0]
+        message(logger_mock.mock_calls[1])
         == "Specimens Sheet Row 2 ('collection_date',) : Input should be a valid date or datetime, month value is outside expected range of 1-12"
     )
 
     assert logger_mock.mock_calls[2][0] == "error"
     assert (
-        logger_mock.mock_calls[2][1][0]
+        message(logger_mock.mock_calls[2])
         == "Specimens Sheet Row 2 ('country_sample_taken_code',) : String should have at least 3 characters"
     )
+
+
+@pytest.mark.asyncio
+async def test_import_specimens_single_flush(db_session: AsyncSession, logger_mock):
+    """Test that import_specimens writes a whole sheet of new specimens in one flush.
+
+    The specimen ids are reserved from the sequence up front, so import_specimens no
+    longer flushes after every row and all the new specimens are sent in a single
+    INSERT statement.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    many_specimen_data = [
+        {**specimen_data[0], "accession": f"adfs{i}"} for i in range(50)
+    ]
+
+    statements: List[str] = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sync_engine = db_session.bind.sync_engine  # type: ignore
+    event.listen(sync_engine, "before_cursor_execute", record_statement)
+    try:
+        await import_specimens(
+            db_session,
+            validate_rows(SpecimensImport, many_specimen_data)[0],
+            logger_mock,
+        )
+        await db_session.flush()
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", record_statement)
+
+    specimen_inserts = [
+        statement
+        for statement in statements
+        if statement.lstrip().upper().startswith("INSERT INTO SPECIMENS ")
+    ]
+    assert len(specimen_inserts) == 1
+
+    result = await db_session.execute(select(Specimen))
+    specimen_records = result.scalars().all()
+    assert len(specimen_records) == len(many_specimen_data)
+    assert len({specimen_record.id for specimen_record in specimen_records}) == len(
+        many_specimen_data
+    )
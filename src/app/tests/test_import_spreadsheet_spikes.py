@@ -0,0 +1,71 @@
+from typing import Dict
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.importers.import_spreadsheet import (
+    import_runs,
+    import_samples,
+    import_specimens,
+)
+from app.importers.validation import validate_rows
+from app.upload_models import RunImport, SamplesImport, SpecimensImport
+from app.models import Sample, Spike
+from app.tests.import_spreadsheet_testing_data import (
+    run_data,
+    sample_data,
+    sample_data2,
+    specimen_data,
+)
+
+
+async def spikes_by_guid(db_session: AsyncSession) -> Dict[str, Dict[str, str]]:
+    """Helper function to get the spike quantities of each sample by name.
+
+    Args:
+        db_session (AsyncSession): The database session.
+
+    Returns:
+        Dict[str, Dict[str, str]]: Spike quantities by spike name, by sample guid.
+    """
+    result = await db_session.execute(
+        select(Sample.guid, Spike.name, Spike.quantity).join(Spike.sample)
+    )
+    spikes: Dict[str, Dict[str, str]] = {}
+    for guid, name, quantity in result:
+        spikes.setdefault(guid, {})[name] = quantity
+    return spikes
+
+
+@pytest.mark.asyncio
+async def test_import_samples_spikes(db_session: AsyncSession, logger_mock):
+    """Test that import_samples adds, updates and removes the spikes of each sample.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (_type_): The mock logger fixture.
+    """
+    await import_runs(db_session, validate_rows(RunImport, run_data)[0], logger_mock)
+    await import_specimens(
+        db_session, validate_rows(SpecimensImport, specimen_data)[0], logger_mock
+    )
+    await import_samples(
+        db_session, validate_rows(SamplesImport, sample_data)[0], logger_mock
+    )
+
+    assert await spikes_by_guid(db_session) == {
+        "sample1": {"spike a": "10", "spike b": "20"},
+        "sample2": {"spike a": "5"},
+    }
+
+    await import_samples(
+        db_session, validate_rows(SamplesImport, sample_data2)[0], logger_mock
+    )
+
+    assert await spikes_by_guid(db_session) == {
+        "sample1": {"spike a": "15"},
+        "sample2": {"spike a": "5"},
+    }
+
+    logger_mock.error.assert_not_called()
@@ -0,0 +1,125 @@
+import pytest
+from sqlalchemy import asc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import config
+from app.importers.import_spreadsheet import upsert_runs, upsert_samples
+from app.importers.validation import validate_rows
+from app.upload_models import RunImport, SamplesImport
+from app.models import Run
+from app.tests.import_spreadsheet_testing_data import (
+    run_combined_run_data,
+    run_data,
+    run_data2,
+    sample_data,
+)
+from app.tests.test_import_spreadsheet_runs import (
+    assert_run_record_matches,
+    message,
+)
+
+
+@pytest.mark.asyncio
+async def test_upsert_runs_update_insert(
+    db_session: AsyncSession,
+    logger_mock,
+):
+    """
+    Test the upsert_runs function with updated run_data.
+
+    This test ensures that the bulk upsert path inserts and updates the same records
+    as import_runs, in batches smaller than the sheet, and logs the same messages.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    await upsert_runs(
+        db_session,
+        validate_rows(RunImport, run_data)[0],
+        logger_mock,
+        dryrun=True,
+        batch_size=1,
+    )
+    await upsert_runs(
+        db_session,
+        validate_rows(RunImport, run_data2)[0],
+        logger_mock,
+        dryrun=True,
+        batch_size=1,
+    )
+
+    result = await db_session.execute(select(Run).order_by(asc(Run.code)))
+    run_records = result.scalars().all()
+
+    # Check the record count
+    assert len(run_records) == len(run_combined_run_data), (
+        f"Expected {len(run_combined_run_data)} records, but found {len(run_records)}"
+    )
+
+    # Compare the retrieved records to run_data
+    for run_record, run_entry in zip(run_records, run_combined_run_data):
+        assert_run_record_matches(run_record, run_entry)
+
+    assert [message(call) for call in logger_mock.mock_calls] == [
+        "Runs Sheet Row 2: Run Run1 does not exist",
+        "Runs Sheet Row 3: Run Run2 does not exist",
+        "Runs Sheet Row 2: Run Run2 already exists",
+        "Runs Sheet Row 3: Run Run3 does not exist",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_upsert_runs_copy(db_session: AsyncSession, logger_mock, monkeypatch):
+    """
+    Test the upsert_runs function loading through a COPY staging table.
+
+    With IMPORT_COPY_ROWS lowered below the size of the sheets, the rows are copied
+    into a staging table and upserted from it, and should give the same records and
+    messages as the batched statements, including for a second upload in the same
+    transaction.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+        monkeypatch (MonkeyPatch): The monkeypatch fixture.
+    """
+    monkeypatch.setattr(config, "IMPORT_COPY_ROWS", 1)
+    for data in (run_data, run_data2):
+        await upsert_runs(
+            db_session, validate_rows(RunImport, data)[0], logger_mock, dryrun=True
+        )
+
+    result = await db_session.execute(select(Run).order_by(asc(Run.code)))
+    run_records = result.scalars().all()
+    assert len(run_records) == len(run_combined_run_data)
+    for run_record, run_entry in zip(run_records, run_combined_run_data):
+        assert_run_record_matches(run_record, run_entry)
+
+    assert [message(call) for call in logger_mock.mock_calls] == [
+        "Runs Sheet Row 2: Run Run1 does not exist",
+        "Runs Sheet Row 3: Run Run2 does not exist",
+        "Runs Sheet Row 2: Run Run2 already exists",
+        "Runs Sheet Row 3: Run Run3 does not exist",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_upsert_samples_keeps_imports(db_session: AsyncSession, logger_mock):
+    """
+    Test that upsert_samples leaves the validated rows it was given as they are.
+
+    None of the sample runs exist, so every row is logged as an error and skipped,
+    but the caller's dict of validated rows should still hold all of them.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    sample_imports = validate_rows(SamplesImport, sample_data)[0]
+    indexes = list(sample_imports)
+
+    await upsert_samples(db_session, sample_imports, logger_mock, dryrun=True)
+
+    assert list(sample_imports) == indexes
+    assert logger_mock.error.call_count == len(indexes)
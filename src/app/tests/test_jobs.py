@@ -0,0 +1,157 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.jobs import (
+    claim_job,
+    enqueue_job,
+    finish_job,
+    get_job,
+    page_job_logs,
+    run_and_finish,
+    run_job,
+)
+from app.logs import make_logger
+from app.models import ImportJob, Run
+from app.tests.import_spreadsheet_testing_data import run_data
+
+
+@pytest.mark.asyncio
+async def test_claim_job_skip_locked(db_session: AsyncSession):
+    """Test that a worker skips a job another worker has locked.
+
+    Two jobs are queued. While one connection holds a row lock on the first, a claim
+    should skip it and take the second. Once the lock is released the first can be
+    claimed, and after that there is nothing left to claim.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    first = await enqueue_job(db_session, "summary", {"Summary": [], "Mapping": []})
+    second = await enqueue_job(db_session, "mutation", {"Mutation": [], "Mapping": []})
+
+    new_session = async_sessionmaker(db_session.bind)
+    async with new_session() as locker, new_session() as worker:
+        await locker.execute(
+            select(ImportJob).filter(ImportJob.id == first).with_for_update()
+        )
+        claimed = await claim_job(worker, "worker")
+        assert claimed == (second, "mutation", {"Mutation": [], "Mapping": []})
+        await locker.rollback()
+
+        claimed = await claim_job(worker, "worker")
+        assert claimed is not None and claimed[0] == first
+        assert await claim_job(worker, "worker") is None
+
+    job_logger = make_logger("test-job")
+    job_logger.info("Data uploaded successfully")
+    assert await finish_job(
+        db_session, first, "worker", "summary", {"dryRun": True}, job_logger
+    )
+
+    job = await get_job(db_session, first)
+    assert job is not None
+    assert job.status == "succeeded" and job.worker == "worker"
+    assert job.msg == "Summary uploaded successfully (dry run)"
+    assert page_job_logs(job.logs)["logs"] == [
+        {"id": 1, "level": "INFO", "msg": "Data uploaded successfully"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_claim_job_expired_lease(db_session: AsyncSession):
+    """Test that a running job is only claimed again once its lease has expired.
+
+    A claimed job whose heartbeat is recent, however long ago it started, should be
+    left to its worker. Once its heartbeat is older than JOB_LEASE_SECONDS another
+    worker should claim it.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    job_id = await enqueue_job(db_session, "summary", {"Summary": [], "Mapping": []})
+    assert await claim_job(db_session, "first") is not None
+
+    long_ago = func.now() - timedelta(days=1)
+    await db_session.execute(
+        update(ImportJob).filter(ImportJob.id == job_id).values(started_at=long_ago)
+    )
+    await db_session.commit()
+    assert await claim_job(db_session, "second") is None
+
+    await db_session.execute(
+        update(ImportJob).filter(ImportJob.id == job_id).values(heartbeat_at=long_ago)
+    )
+    await db_session.commit()
+    claimed = await claim_job(db_session, "second")
+    assert claimed is not None and claimed[0] == job_id
+
+    job = await get_job(db_session, job_id)
+    assert job is not None and job.worker == "second"
+
+
+@pytest.mark.asyncio
+async def test_run_and_finish_lost_lease(db_session: AsyncSession):
+    """Test that an import is only committed while its worker still holds the job.
+
+    Once the job has been claimed again by a second worker, the first worker's import
+    should be rolled back and its result not stored. The second worker's own run should
+    then be committed along with its result.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    engine = db_session.bind
+    assert isinstance(engine, AsyncEngine)
+    payload = {"Runs": run_data, "Specimens": [], "Samples": [], "Storage": []}
+    job_id = await enqueue_job(db_session, "spreadsheet", payload)
+    assert await claim_job(db_session, "first") is not None
+
+    await db_session.execute(
+        update(ImportJob).filter(ImportJob.id == job_id).values(worker="second")
+    )
+    await db_session.commit()
+
+    held = await run_and_finish(
+        engine, job_id, "first", "spreadsheet", payload, make_logger("first")
+    )
+    assert not held
+    assert await db_session.scalar(select(func.count()).select_from(Run)) == 0
+    job = await get_job(db_session, job_id)
+    assert job is not None and job.status == "running" and job.worker == "second"
+
+    held = await run_and_finish(
+        engine, job_id, "second", "spreadsheet", payload, make_logger("second")
+    )
+    assert held
+    assert await db_session.scalar(select(func.count()).select_from(Run)) == len(
+        run_data
+    )
+    await db_session.refresh(job)
+    assert job.status == "succeeded" and job.worker == "second"
+
+
+@pytest.mark.asyncio
+async def test_run_job_dry_run_plans(db_session: AsyncSession):
+    """Test that a spreadsheet dry run job is planned, not written and rolled back.
+
+    The job should return the plan of its runs, stored under a token the commit
+    endpoint accepts, and no run should be written.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    payload = {
+        "Runs": run_data,
+        "Specimens": [],
+        "Samples": [],
+        "Storage": [],
+        "dryRun": True,
+    }
+    planned = await run_job(db_session, "spreadsheet", payload, make_logger("job"))
+
+    assert planned is not None and planned.token is not None
+    assert planned.summary() == {"runs": {"create": len(run_data)}}
+    assert await db_session.scalar(select(func.count()).select_from(Run)) == 0
@@ -0,0 +1,39 @@
+from app.config import config
+from app.logs import LogEntry, make_logger, row_log
+
+
+def test_log_collector_rollup_and_cap(monkeypatch):
+    """Test that the log collector counts per code and caps its INFO detail.
+
+    Five runs are logged as updated with the cap at three entries, then an error.
+    The summary should count all five, the detail should keep the first three INFO
+    lines and the error, and the count should include the two dropped lines.
+    """
+    monkeypatch.setattr(config, "LOG_MAX_ENTRIES", 3)
+    logger = make_logger("test-log-collector")
+
+    for row in range(2, 7):
+        logger.info(
+            "Runs Sheet Row %s: Run %s already exists",
+            row,
+            f"Run{row}",
+            extra=row_log("runs.updated", "Runs Sheet", row),
+        )
+    logger.error("Upload failed, please see log messages for details")
+
+    assert logger.log_summary() == [
+        {"level": "INFO", "code": "runs.updated", "count": 5, "msg": "5 runs updated"}
+    ]
+    assert logger.log_count == 6
+    assert logger.get_logs(offset=2) == [
+        {"id": 3, "level": "INFO", "msg": "Runs Sheet Row 4: Run Run4 already exists"},
+        {
+            "id": 4,
+            "level": "ERROR",
+            "msg": "Upload failed, please see log messages for details",
+        },
+    ]
+
+    entry = logger.json_handler.entries[0]
+    assert entry.sheet == "Runs Sheet" and entry.row == 2
+    assert LogEntry.from_json(entry.to_json()).message() == entry.message()
@@ -0,0 +1,51 @@
+import logging
+import sys
+
+import pytest
+
+from app.config import config
+from app.logs import CustomLogger, ErrorCheckHandler
+from app.progress import ProgressEvent
+
+
+@pytest.mark.asyncio
+async def test_progress_stages(monkeypatch):
+    """Test that progress events follow the stages and add up re-entered stages.
+
+    The import alternates between validating and writing runs, as a chunked file
+    upload does, so the rows of each stage should add up across its visits. With the
+    interval at zero every advance is published, and the last event is marked done.
+    """
+    monkeypatch.setattr(config, "PROGRESS_INTERVAL_SECONDS", 0)
+    logger = CustomLogger("test-progress")
+    logger.addHandler(ErrorCheckHandler(stream=sys.stderr))
+    logger.setLevel(logging.INFO)
+
+    events: list[ProgressEvent] = []
+
+    async def listener(event: ProgressEvent) -> None:
+        events.append(event)
+
+    logger.progress.listeners.append(listener)
+
+    for _ in range(2):
+        await logger.stage("validate")
+        await logger.advance(3)
+        await logger.stage("runs")
+        logger.error("Runs Sheet Row 2 : bad row")
+        await logger.advance(2)
+    await logger.finish_stages()
+
+    assert [(event.stage, event.rows, event.errors) for event in events] == [
+        ("validate", 0, 0),
+        ("validate", 3, 0),
+        ("runs", 0, 0),
+        ("runs", 2, 1),
+        ("validate", 3, 1),
+        ("validate", 6, 1),
+        ("runs", 2, 1),
+        ("runs", 4, 2),
+        ("runs", 4, 2),
+    ]
+    assert [event.done for event in events] == [False] * 8 + [True]
+    assert events[-1].to_dict()["rows"] == 4
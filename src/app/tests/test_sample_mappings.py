@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import GpasSampleMapping
+from app.sample_mappings import (
+    MappingCache,
+    invalidate_mappings,
+    lookup_mappings,
+    save_mappings,
+)
+
+
+def test_mapping_cache(monkeypatch):
+    """Test that the mapping cache evicts the least recently used name and expires entries.
+
+    Args:
+        monkeypatch (MonkeyPatch): The pytest monkeypatch fixture.
+    """
+    now = [100.0]
+    monkeypatch.setattr("app.sample_mappings.time.monotonic", lambda: now[0])
+    cache = MappingCache(size=2, ttl=10)
+    cache.put("remote1", "sample1")
+    cache.put("remote2", "sample2")
+    assert cache.get("remote1") == "sample1"
+    cache.put("remote3", "sample3")
+
+    assert cache.get("remote2") is None
+    assert cache.get("remote1") == "sample1"
+    now[0] = 110.0
+    assert cache.get("remote3") is None
+
+
+@pytest.mark.asyncio
+async def test_save_mappings(db_session: AsyncSession):
+    """Test that uploaded mappings are stored incrementally and looked up later.
+
+    A second upload should only change the mapping it gives a new sample for, leaving
+    the other stored mapping alone, and the lookups should see the change rather
+    than the cached mapping. A mapping changed by another worker since it was cached
+    should still be written back when an upload maps it as the cache does.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    invalidate_mappings()
+    await save_mappings(
+        db_session,
+        [
+            {"remote_sample_name": "remote1", "sample_name": "sample1"},
+            {"remote_sample_name": "remote2", "sample_name": "sample2"},
+        ],
+    )
+    assert await lookup_mappings(db_session, ["remote1", "remote2", "x"]) == {
+        "remote1": "sample1",
+        "remote2": "sample2",
+    }
+
+    await save_mappings(
+        db_session, [{"remote_sample_name": "remote2", "sample_name": "sample3"}]
+    )
+    assert await lookup_mappings(db_session, ["remote1", "remote2"]) == {
+        "remote1": "sample1",
+        "remote2": "sample3",
+    }
+
+    result = await db_session.execute(
+        select(
+            GpasSampleMapping.remote_sample_name, GpasSampleMapping.sample_name
+        ).order_by(GpasSampleMapping.remote_sample_name)
+    )
+    assert result.tuples().all() == [("remote1", "sample1"), ("remote2", "sample3")]
+
+    # another worker remaps remote1, leaving this worker's cache stale
+    await db_session.execute(
+        update(GpasSampleMapping)
+        .filter(GpasSampleMapping.remote_sample_name == "remote1")
+        .values(sample_name="sample4")
+    )
+    await save_mappings(
+        db_session, [{"remote_sample_name": "remote1", "sample_name": "sample1"}]
+    )
+    stored = await db_session.scalar(
+        select(GpasSampleMapping.sample_name).filter(
+            GpasSampleMapping.remote_sample_name == "remote1"
+        )
+    )
+    assert stored == "sample1"
+    invalidate_mappings()
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import OtherType
+from app.routes.schema_routes import (
+    etag_matches,
+    get_view_schemas,
+    invalidate_schemas,
+    json_type,
+)
+
+
+@pytest.mark.asyncio
+async def test_view_schemas_rebuilt_with_views(db_session: AsyncSession):
+    """Test that the cached schemas are reused until the flattened views are rebuilt.
+
+    Deleting an other type rebuilds flattened_others_view without its column, so the
+    schema and ETag of that view should change while the others stay the same.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+    """
+    invalidate_schemas()
+
+    schemas = await get_view_schemas(db_session)
+    others = schemas.views["flattened_others_view"]
+    assert "null_calls" in others.schema["properties"]
+    assert await get_view_schemas(db_session) is schemas
+
+    await db_session.execute(delete(OtherType).filter(OtherType.code == "null_calls"))
+
+    rebuilt = await get_view_schemas(db_session)
+    assert rebuilt is not schemas
+    assert (
+        "null_calls" not in rebuilt.views["flattened_others_view"].schema["properties"]
+    )
+    assert rebuilt.views["flattened_others_view"].etag != others.etag
+    assert rebuilt.views["runs_view"].etag == schemas.views["runs_view"].etag
+
+
+def test_json_type_and_etag_matches():
+    """Test the type mapping of parameterised types and If-None-Match comparison."""
+    assert json_type("character varying(255)") == "string"
+    assert json_type("double precision") == "number"
+    assert json_type("uuid") == "uuid"
+
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"old", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"old"', '"abc"')
+    assert not etag_matches(None, '"abc"')
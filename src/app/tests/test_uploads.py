@@ -0,0 +1,46 @@
+import gzip
+import io
+import json
+
+import pytest
+from fastapi import UploadFile
+
+from app.tests.import_spreadsheet_testing_data import run_data
+from app.utils.uploads import iter_chunks, read_rows
+
+
+@pytest.mark.asyncio
+async def test_iter_chunks_ndjson_gzip():
+    """Test that a gzipped NDJSON upload is read back as the same rows, in chunks.
+
+    The upload holds five copies of run_data, which should come back in chunks of at
+    most four rows with every row intact.
+    """
+    rows = run_data * 5
+    content = gzip.compress("".join(json.dumps(row) + "\n" for row in rows).encode())
+    upload = UploadFile(io.BytesIO(content), filename="runs.ndjson.gz")
+
+    chunks = [chunk async for chunk in iter_chunks(upload, chunk_size=4)]
+
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert [row for chunk in chunks for row in chunk] == rows
+
+
+def test_read_rows_csv():
+    """Test that CSV rows are read with empty cells as None and quoted newlines kept."""
+    content = (
+        b'\xef\xbb\xbfcode,comment,flowcell\r\nRun1,"two\r\nlines",\r\nRun2,,FC2\r\n'
+    )
+
+    rows = list(read_rows(io.BytesIO(content), "Runs.CSV"))
+
+    assert rows == [
+        {"code": "Run1", "comment": "two\r\nlines", "flowcell": None},
+        {"code": "Run2", "comment": None, "flowcell": "FC2"},
+    ]
+
+
+def test_read_rows_unsupported():
+    """Test that a file that is neither CSV nor NDJSON is rejected."""
+    with pytest.raises(ValueError):
+        list(read_rows(io.BytesIO(b""), "runs.xlsx"))
@@ -0,0 +1,29 @@
+from app.utils.utils import IndexedJoin
+
+mapping = [
+    {"remote_sample_name": "remote1", "sample_name": "sample1"},
+    {"remote_sample_name": "remote2", "sample_name": "sample2"},
+    {"remote_sample_name": "remote2", "sample_name": "sample2"},
+    {"remote_sample_name": "remote3", "sample_name": "sample3"},
+    {"remote_sample_name": "remote3", "sample_name": "sample4"},
+]
+
+
+def test_indexed_join():
+    """Test that IndexedJoin merges lazily and records the rows it could not join.
+
+    Rows without a mapping should be left out with their index recorded, the others
+    keep their index numbered from start, and only the mapping rows that repeat a
+    name with different values count as duplicates, the last of them being joined.
+    """
+    rows = [{"Sample ID": name, "Batch": "b1"} for name in ("remote3", "x", "remote1")]
+    join = IndexedJoin(mapping, "remote_sample_name")
+    assert join.duplicates == {"remote3": [3, 4]}
+
+    joined = join.join(iter(rows), "Sample ID", start=10)
+    assert join.unmatched == []
+    assert list(joined) == [
+        (10, rows[0] | mapping[4]),
+        (12, rows[2] | mapping[0]),
+    ]
+    assert join.unmatched == [11]
@@ -0,0 +1,83 @@
+import logging
+import sys
+
+import pytest
+
+from app.config import config
+from app.importers.validation import shutdown_pool, validate_sheet
+from app.logs import CustomLogger, ErrorBudgetExceeded, ErrorCheckHandler
+from app.tests.import_spreadsheet_testing_data import bad_run_data, run_data
+from app.tests.test_import_spreadsheet_runs import message
+from app.upload_models import RunImport
+
+
+@pytest.mark.asyncio
+async def test_validate_sheet_parallel(logger_mock, monkeypatch):
+    """Test that validating a sheet in the process pool matches validating it in process.
+
+    This test validates a sheet with a bad row in the middle once in this process and
+    once split across the worker processes, and checks that both return the same
+    models keyed on the same rows and log the same errors in row order.
+
+    Args:
+        logger_mock (CustomLogger): The mock logger fixture.
+        monkeypatch (MonkeyPatch): The pytest monkeypatch fixture.
+    """
+    data = run_data * 5 + bad_run_data + run_data * 5
+
+    serial = await validate_sheet(RunImport, data, logger_mock, "Runs Sheet")
+    serial_calls = list(logger_mock.mock_calls)
+    logger_mock.reset_mock()
+
+    monkeypatch.setattr(config, "VALIDATION_WORKERS", 3)
+    try:
+        parallel = await validate_sheet(
+            RunImport, data, logger_mock, "Runs Sheet", parallel_rows=1
+        )
+    finally:
+        shutdown_pool()
+
+    assert parallel == serial
+    assert list(parallel) == [index for index in range(len(data)) if index != 10]
+    assert logger_mock.mock_calls == serial_calls
+    assert message(logger_mock.mock_calls[0]).startswith(
+        "Runs Sheet Row 12 ('code',)"
+    )
+
+
+@pytest.mark.asyncio
+async def test_validate_sheet_error_budget():
+    """Test that validate_sheet stops once the logger has used up its error budget.
+
+    The bad run data has several errors per row, so with a budget of two errors
+    validation should stop part way through the first bad row.
+    """
+    logger = CustomLogger("test-error-budget")
+    logger.addHandler(ErrorCheckHandler(stream=sys.stderr))
+    logger.setLevel(logging.INFO)
+    logger.max_errors = 2
+
+    with pytest.raises(ErrorBudgetExceeded):
+        await validate_sheet(RunImport, bad_run_data * 3, logger, "Runs Sheet")
+
+    assert logger.error_count == 2
+    assert [log["level"] for log in logger.get_logs()] == ["ERROR", "ERROR"]
+
+
+@pytest.mark.asyncio
+async def test_validate_sheet_indexes(logger_mock):
+    """Test that validate_sheet keys and logs rows on the indexes it is given.
+
+    When some rows of a sheet have been left out, e.g. for having no mapping, the
+    rest should keep their own row numbers rather than being numbered from start.
+
+    Args:
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    data = run_data + bad_run_data
+    valid = await validate_sheet(
+        RunImport, data, logger_mock, "Runs Sheet", indexes=[3, 5, 8]
+    )
+
+    assert list(valid) == [3, 5]
+    assert logger_mock.error.call_args_list[0][0][1:3] == ("Runs Sheet", 10)
@@ -0,0 +1,137 @@
+from dataclasses import replace
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.importers.import_spreadsheet import import_runs
+from app.importers.validation import validate_rows
+from app.routes.schema_routes import get_view_schemas
+from app.tests.import_spreadsheet_testing_data import run_data, run_data2
+from app.upload_models import RunImport
+from app.view_query import (
+    QueryError,
+    build_statement,
+    decode_cursor,
+    encode_cursor,
+    make_query,
+    query_view,
+)
+
+samples_columns = {
+    "id": "integer",
+    "guid": "character varying(255)",
+    "run_date": "date",
+    "nucleic_acid_type": "character varying[]",
+    "quantity": "numeric",
+}
+
+
+@pytest.mark.asyncio
+async def test_query_view_pages(db_session: AsyncSession, logger_mock):
+    """Test that a view is paged through by cursor with every row returned once.
+
+    Three runs are imported, Run1 and Run3 on the same date, and runs_view is paged
+    one row at a time sorted by run_date descending, so the cursor has to break the
+    tie on the date by id.
+
+    Args:
+        db_session (AsyncSession): The database session fixture.
+        logger_mock (CustomLogger): The mock logger fixture.
+    """
+    runs = [run_data[0], {**run_data[1], "run_date": "2024-01-02"}, run_data2[1]]
+    await import_runs(db_session, validate_rows(RunImport, runs)[0], logger_mock)
+    await db_session.commit()
+
+    columns = (await get_view_schemas(db_session)).views["runs_view"].columns
+    pages = []
+    after = None
+    while True:
+        query = make_query(
+            "runs_view",
+            columns,
+            select=["code", "run_date"],
+            sort="run_date",
+            descending=True,
+            limit=1,
+            after=after,
+        )
+        page = await query_view(db_session, query)
+        pages.append(page["rows"])
+        after = page["next"]
+        if after is None:
+            break
+
+    assert [len(rows) for rows in pages] == [1, 1, 1]
+    assert [rows[0]["code"] for rows in pages] == ["Run2", "Run3", "Run1"]
+    assert pages[0][0]["run_date"] == date(2024, 1, 2)
+
+    query = make_query("runs_view", columns, filters=["site:in:SiteA,SiteB"])
+    page = await query_view(db_session, query)
+    assert {row["code"] for row in page["rows"]} == {"Run1", "Run2"}
+
+
+def test_make_query_filters_and_seek():
+    """Test that filters are typed by the view's columns and pages seek by cursor."""
+    query = make_query(
+        "samples_view",
+        samples_columns,
+        select=["guid"],
+        filters=["nucleic_acid_type:contains:DNA,RNA", "run_date:ge:2024-01-01"],
+        sort="guid",
+        limit=10,
+    )
+    assert query.key == "id"
+    assert query.filters[1].value == date(2024, 1, 1)
+
+    cursor = encode_cursor(query, {"guid": "sample2", "id": 7})
+    query = make_query(
+        "samples_view",
+        samples_columns,
+        sort="guid",
+        limit=10,
+        after=cursor,
+    )
+    assert query.after == ("sample2", 7)
+
+    quantity = Decimal("0.10000000000000000001")
+    numeric_query = replace(query, sort="quantity")
+    numeric_cursor = encode_cursor(numeric_query, {"quantity": quantity, "id": 7})
+    assert decode_cursor(samples_columns, "quantity", "id", False, numeric_cursor) == (
+        quantity,
+        7,
+    )
+
+    sql = str(build_statement(query).compile(dialect=postgresql.dialect()))
+    assert "(samples_view.guid, samples_view.id) >" in sql
+    assert "ORDER BY samples_view.guid ASC, samples_view.id ASC" in sql
+    assert "OFFSET" not in sql
+
+    sql = str(
+        build_statement(
+            make_query(
+                "samples_view",
+                samples_columns,
+                filters=["nucleic_acid_type:contains:DNA"],
+            )
+        ).compile(dialect=postgresql.dialect())
+    )
+    assert "samples_view.nucleic_acid_type @>" in sql
+
+    for filters, sort, after in [
+        (["missing:eq:1"], None, None),
+        (["run_date:eq:not a date"], None, None),
+        (["guid:contains:x"], None, None),
+        (["nucleic_acid_type:eq:DNA"], None, None),
+        ([], "nucleic_acid_type", None),
+        ([], "id", cursor),
+        ([], "run_date", None),
+        ([], "quantity", None),
+        ([], None, "not a cursor"),
+    ]:
+        with pytest.raises(QueryError):
+            make_query(
+                "samples_view", samples_columns, filters=filters, sort=sort, after=after
+            )
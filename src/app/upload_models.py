@@ -18,14 +18,17 @@ from app.constants import ExcelStr, NucleicAcidType, SampleCategory, SequencingM
 
 class ImportModel(BaseModel):
     def __getitem__(self, item):
-        return self.__dict__[item] if item in self.__dict__ else None
+        return self.get(item)
 
     def __setitem__(self, key, value):
         if key in self.__dict__:
             self.__dict__[key] = value
 
     def get(self, key, default=None):
-        return self.__dict__.get(key, default)
+        # extra fields, such as the spike columns, are not stored in __dict__
+        if key in self.__dict__:
+            return self.__dict__[key]
+        return (self.model_extra or {}).get(key, default)
 
 
 class RunImport(ImportModel):
@@ -1,11 +1,19 @@
-from typing import Optional
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
 
+import httpx
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, SecurityScopes
 
 from app.config import config
 
+logger = logging.getLogger(__name__)
+
 
 class UnauthorizedException(HTTPException):
     def __init__(self, detail: str, **kwargs):
@@ -20,16 +28,142 @@ class UnauthenticatedException(HTTPException):
         )
 
 
+class JwksCache:
+    """The signing keys of a JWKS endpoint, fetched without blocking the event loop.
+
+    start() fetches the keys in a background task and refetches them every
+    JWKS_REFRESH_SECONDS, so requests normally find the key they need already in
+    memory. A token signed with a key that is not known yet, as after a key rotation,
+    triggers a refetch, but at most once every JWKS_MIN_REFRESH_SECONDS.
+    """
+
+    def __init__(self, url: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url
+        # the stub JWKS passes its own transport to work offline
+        self.transport = transport
+        self.keys: Dict[str, jwt.PyJWK] = {}
+        self.fetched: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def age(self) -> float:
+        if self.fetched is None:
+            return float("inf")
+        return time.monotonic() - self.fetched
+
+    async def fetch(self) -> None:
+        try:
+            async with httpx.AsyncClient(
+                transport=self.transport, timeout=10
+            ) as client:
+                response = await client.get(self.url)
+                response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+        except (httpx.HTTPError, ValueError, jwt.exceptions.PyJWKSetError) as error:
+            raise jwt.exceptions.PyJWKClientError(
+                f"Fail to fetch data from the url, err: {error}"
+            )
+        self.keys = {key.key_id: key for key in jwk_set.keys if key.key_id}
+        self.fetched = time.monotonic()
+
+    async def refresh(self, min_age: float) -> None:
+        """Refetch the keys unless another request has done so in the last min_age seconds"""
+        async with self._lock:
+            if self.age() >= min_age:
+                await self.fetch()
+
+    async def get_signing_key(self, kid: str) -> jwt.PyJWK:
+        if self.age() >= config.JWKS_REFRESH_SECONDS * 2:
+            # the background refresh is not running or keeps failing
+            await self.refresh(config.JWKS_REFRESH_SECONDS)
+
+        key = self.keys.get(kid)
+        if key is None:
+            await self.refresh(config.JWKS_MIN_REFRESH_SECONDS)
+            key = self.keys.get(kid)
+        if key is None:
+            raise jwt.exceptions.PyJWKClientError(
+                f'Unable to find a signing key that matches: "{kid}"'
+            )
+        return key
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh(0)
+                delay = config.JWKS_REFRESH_SECONDS
+            except jwt.exceptions.PyJWKClientError as error:
+                logger.error(f"Failed to refresh JWKS from {self.url}: {error}")
+                delay = config.JWKS_MIN_REFRESH_SECONDS
+            await asyncio.sleep(delay)
+
+    def start(self) -> None:
+        """Start refreshing the keys in the background, called from the lifespan handler"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class TokenCache:
+    """LRU of verified token payloads, keyed by a hash of the token, until it expires"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.payloads: OrderedDict[bytes, Tuple[Dict[str, Any], float]] = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self.key(token)
+        cached = self.payloads.get(key)
+        if cached is None:
+            return None
+        payload, exp = cached
+        if exp <= time.time():
+            del self.payloads[key]
+            return None
+        self.payloads.move_to_end(key)
+        return payload
+
+    def put(self, token: str, payload: Dict[str, Any]) -> None:
+        exp = payload.get("exp")
+        # a token without an expiry is verified every time
+        if not isinstance(exp, (int, float)) or self.size < 1:
+            return
+        key = self.key(token)
+        self.payloads[key] = (payload, exp)
+        self.payloads.move_to_end(key)
+        while len(self.payloads) > self.size:
+            self.payloads.popitem(last=False)
+
+
 class VerifyToken:
     """Does all the token verification using PyJWT"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        jwks_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
         self.config = config
 
         # This gets the JWKS from a given URL and does processing so you can
         # use any of the keys available
-        jwks_url = f"https://{self.config.AUTH0_DOMAIN}/.well-known/jwks.json"
-        self.jwks_client = jwt.PyJWKClient(jwks_url)
+        jwks_url = (
+            jwks_url or f"https://{self.config.AUTH0_DOMAIN}/.well-known/jwks.json"
+        )
+        self.jwks = JwksCache(jwks_url, transport)
+        self.tokens = TokenCache(self.config.TOKEN_CACHE_SIZE)
 
     async def verify(
         self,
@@ -39,19 +173,33 @@ class VerifyToken:
         if token is None:
             raise UnauthenticatedException
 
+        # a token seen before skips the signature check until it expires
+        payload = self.tokens.get(token.credentials)
+        if payload is None:
+            payload = await self.decode(token.credentials)
+            self.tokens.put(token.credentials, payload)
+
+        token_permissions = payload.get("permissions", [])
+        for permission in security_scopes.scopes:
+            if permission not in token_permissions:
+                raise UnauthorizedException(detail=f'Missing "{permission}" permission')
+
+        return payload
+
+    async def decode(self, credentials: str) -> Dict[str, Any]:
+        """Verify the signature and claims of a token, returning its payload"""
         # This gets the 'kid' from the passed token
         try:
-            signing_key = self.jwks_client.get_signing_key_from_jwt(
-                token.credentials
-            ).key
+            kid = jwt.get_unverified_header(credentials).get("kid", "")
+            signing_key = (await self.jwks.get_signing_key(kid)).key
         except jwt.exceptions.PyJWKClientError as error:
             raise UnauthorizedException(str(error))
         except jwt.exceptions.DecodeError as error:
             raise UnauthorizedException(str(error))
 
         try:
-            payload = jwt.decode(
-                token.credentials,
+            return jwt.decode(
+                credentials,
                 signing_key,
                 algorithms=self.config.AUTH0_ALGORITHMS,
                 audience=self.config.AUTH0_API_AUDIENCE,
@@ -59,10 +207,3 @@ class VerifyToken:
             )
         except Exception as error:
             raise UnauthorizedException(str(error))
-
-        token_permissions = payload.get("permissions", [])
-        for permission in security_scopes.scopes:
-            if permission not in token_permissions:
-                raise UnauthorizedException(detail=f'Missing "{permission}" permission')
-
-        return payload
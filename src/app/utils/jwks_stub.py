@@ -0,0 +1,91 @@
+"""
+A local JWKS endpoint, for testing and benchmarking token verification offline.
+
+StubJwks generates an RSA key, serves it as a JWKS through an httpx transport and signs
+tokens with it for the configured audience and issuer. Run
+
+    PYTHONPATH=src python -m app.utils.jwks_stub
+
+to time verifying a token the first time and again from the token cache.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.security import HTTPAuthorizationCredentials, SecurityScopes
+
+from app.config import config
+from app.utils.auth0 import VerifyToken
+
+JWKS_URL = "https://stub.invalid/.well-known/jwks.json"
+
+
+class StubJwks:
+    def __init__(self, kid: str = "stub-key"):
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+        self.requests = 0
+        self.transport = httpx.MockTransport(self.handle)
+
+    def jwks(self) -> Dict[str, Any]:
+        jwk = json.loads(
+            jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key())
+        )
+        return {"keys": [{**jwk, "kid": self.kid, "use": "sig", "alg": "RS256"}]}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return httpx.Response(200, json=self.jwks())
+
+    def token(self, expires_in: int = 3600, **claims: Any) -> str:
+        now = int(time.time())
+        payload = {"iat": now, "exp": now + expires_in, "sub": "stub|user", **claims}
+        # left out when not configured, as PyJWT then rejects any audience
+        if config.AUTH0_API_AUDIENCE:
+            payload.setdefault("aud", config.AUTH0_API_AUDIENCE)
+        if config.AUTH0_ISSUER:
+            payload.setdefault("iss", config.AUTH0_ISSUER)
+        return jwt.encode(
+            payload, self.private_key, algorithm="RS256", headers={"kid": self.kid}
+        )
+
+    def verifier(self, jwks_url: Optional[str] = None) -> VerifyToken:
+        return VerifyToken(jwks_url or JWKS_URL, self.transport)
+
+
+async def benchmark(verifications: int = 1000) -> None:
+    stub = StubJwks()
+    verifier = stub.verifier()
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=stub.token()
+    )
+
+    started = time.perf_counter()
+    await verifier.verify(SecurityScopes(), credentials)
+    print(f"first verification: {(time.perf_counter() - started) * 1000:.2f}ms")
+
+    started = time.perf_counter()
+    for _ in range(verifications):
+        await verifier.verify(SecurityScopes(), credentials)
+    elapsed = time.perf_counter() - started
+    print(f"cached verification: {elapsed / verifications * 1e6:.1f}us")
+
+    verifier.tokens.size = 0
+    verifier.tokens.payloads.clear()
+    started = time.perf_counter()
+    for _ in range(verifications):
+        await verifier.verify(SecurityScopes(), credentials)
+    elapsed = time.perf_counter() - started
+    print(f"uncached verification: {elapsed / verifications * 1e6:.1f}us")
+    print(f"JWKS requests: {stub.requests}")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,83 @@
+"""
+Incremental parsing of uploaded sheet files.
+
+Starlette spools uploaded files to a temporary file rather than holding them in
+memory, so they are read back here a line at a time and handed to the importers in
+chunks of at most chunk_size rows. Files can be NDJSON or CSV, either of them
+optionally gzip compressed.
+"""
+
+import csv
+import gzip
+import io
+import json
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List
+
+from fastapi import UploadFile
+from starlette.concurrency import iterate_in_threadpool
+
+from app.config import config
+from app.utils.utils import chunked
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_text(file: BinaryIO) -> io.TextIOWrapper:
+    """Open a binary file as text, decompressing it on the fly if it is gzipped"""
+    magic = file.read(len(GZIP_MAGIC))
+    file.seek(0)
+    if magic == GZIP_MAGIC:
+        file = gzip.GzipFile(fileobj=file, mode="rb")  # type: ignore
+    # utf-8-sig drops the byte order mark Excel writes at the start of CSV files
+    return io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+
+
+def read_rows(file: BinaryIO, filename: str) -> Iterator[Dict[str, Any]]:
+    """Read the rows of an NDJSON or CSV file one at a time.
+
+    Empty CSV cells are read as None, to match the JSON the spreadsheet upload sends.
+
+    Args:
+        file (BinaryIO): The uploaded file.
+        filename (str): The name of the uploaded file, used to tell the format.
+
+    Raises:
+        ValueError: If the file is not a .csv, .ndjson or .jsonl file.
+
+    Yields:
+        Dict[str, Any]: The rows of the file.
+    """
+    name = filename.lower().removesuffix(".gz")
+    if name.endswith((".ndjson", ".jsonl")):
+        for line in open_text(file):
+            if line.strip():
+                yield json.loads(line)
+    elif name.endswith(".csv"):
+        for row in csv.DictReader(open_text(file)):
+            yield {key: None if value == "" else value for key, value in row.items()}
+    else:
+        raise ValueError(
+            f"Unsupported file {filename}, expected .csv, .ndjson or .jsonl, optionally .gz"
+        )
+
+
+async def iter_chunks(
+    upload: UploadFile, chunk_size: int = config.UPLOAD_CHUNK_SIZE
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Read the rows of an uploaded file in chunks, off the event loop.
+
+    Args:
+        upload (UploadFile): The uploaded file.
+        chunk_size (int, optional): Maximum number of rows per chunk.
+
+    Yields:
+        List[Dict[str, Any]]: The next chunk of rows.
+    """
+    rows = read_rows(upload.file, upload.filename or "")
+    async for chunk in iterate_in_threadpool(chunked(rows, chunk_size)):
+        yield chunk
+
+
+async def read_all(upload: UploadFile) -> List[Dict[str, Any]]:
+    """Read every row of a small uploaded file, such as a sample mapping"""
+    return [row async for chunk in iter_chunks(upload) for row in chunk]
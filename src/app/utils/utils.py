@@ -1,24 +1,63 @@
 import math
-from typing import Any, Dict, List
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
 
 
 def is_none_or_nan(value):
     return value is None or (isinstance(value, float) and math.isnan(value))
 
 
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Split an iterable into lists of at most size items"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
 # use this instead of pandas merge, as pandas is a heavy dependency
-def merge_lists(
-    list1: List[Dict[str, Any]], list2: List[Dict[str, Any]], key1: str, key2: str
-) -> List[Dict[str, Any]]:
-    # Create a mapping dictionary for quick lookup from list2
-    mapping_dict = {item[key2]: item for item in list2 if key2 in item}
-
-    # Merge the two lists
-    merged_list = []
-    for item1 in list1:
-        key_value = item1.get(key1)
-        if key_value in mapping_dict:
-            merged_item = {**item1, **mapping_dict[key_value]}
-            merged_list.append(merged_item)
-
-    return merged_list
+class IndexedJoin:
+    """Join rows against a hash index of another list of rows, e.g. a GPAS mapping.
+
+    The right hand rows are indexed once on right_key, and join then streams over
+    the left hand rows, yielding each merged row as it goes, so only the index and
+    the row being merged are held rather than a second copy of the left hand rows.
+    The right hand values win where both rows have the same column.
+
+    Rows that could not be joined are recorded rather than dropped silently:
+    unmatched holds the index of every left hand row without a match, and duplicates
+    the index of every right hand row sharing a key with a different earlier row, by
+    key. Rows that repeat an earlier row exactly are not duplicates. It is up to the
+    caller to reject duplicates: mapping_join logs each as an error, which fails the
+    upload, so only exact duplicates are ever joined.
+    """
+
+    def __init__(self, right: Iterable[Dict[str, Any]], right_key: str):
+        self.index: Dict[Any, Dict[str, Any]] = {}
+        self.duplicates: Dict[Any, List[int]] = {}
+        self.unmatched: List[int] = []
+        positions: Dict[Any, int] = {}
+        for position, row in enumerate(right):
+            if right_key not in row:
+                continue
+            key = row[right_key]
+            if key in self.index and self.index[key] != row:
+                self.duplicates.setdefault(key, [positions[key]]).append(position)
+            self.index[key] = row
+            positions[key] = position
+
+    def add(self, key: Any, row: Dict[str, Any]) -> None:
+        """Index another right hand row, unless there is one for key already"""
+        self.index.setdefault(key, row)
+
+    def join(
+        self, left: Iterable[Dict[str, Any]], left_key: str, start: int = 0
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield the index, numbered from start, and merged row of each matched row"""
+        for index, row in enumerate(left, start):
+            match = self.index.get(row.get(left_key))
+            if match is None:
+                self.unmatched.append(index)
+                continue
+            yield index, {**row, **match}
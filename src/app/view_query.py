@@ -0,0 +1,322 @@
+"""
+Keyset paginated queries over the reporting views.
+
+A query selects some of the columns of one of the allowed views, filtered and
+sorted, one page at a time. Rather than skipping rows with OFFSET, each page seeks
+past the (sort column, key column) of the last row of the previous page, which is
+passed back as an opaque cursor. The key column is id, or the parent id the
+flattened views start with, and makes the sort order total.
+
+A view can only be sorted by its key column or by one of its sortable_columns, each
+a column of the table the view's id comes from with an index on (column, id). Postgres
+then starts reading that index at the cursor instead of sorting the whole view and
+discarding every row before it, so a deep page costs the same as the first. Columns
+a view joins in from other tables can not be read in that order from any one index,
+so they can be filtered on but not sorted by.
+
+Columns and filters are validated against the Postgres types of the cached view
+schemas, see app.routes.schema_routes.
+"""
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    String,
+    and_,
+    column,
+    or_,
+    select,
+    table,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.routes.schema_routes import json_type
+
+# the columns besides the key each view can be sorted by, indexed by migration
+# c52e9a17d3b8, views not listed can only be sorted by their key
+sortable_columns: Dict[str, Tuple[str, ...]] = {
+    "runs_view": ("code", "run_date"),
+    "samples_view": ("guid", "sample_category"),
+    "specimens_view": ("accession", "collection_date", "organism"),
+    "storages_view": ("storage_qr_code", "date_into_storage"),
+}
+
+comparisons = {
+    "eq": lambda c, v: c == v,
+    "ne": lambda c, v: c != v,
+    "lt": lambda c, v: c < v,
+    "le": lambda c, v: c <= v,
+    "gt": lambda c, v: c > v,
+    "ge": lambda c, v: c >= v,
+}
+
+
+class QueryError(ValueError):
+    """A query the view can not answer, returned to the client as a 400"""
+
+
+@dataclass(frozen=True)
+class Filter:
+    column: str
+    op: str
+    value: Any
+
+
+@dataclass(frozen=True)
+class ViewQuery:
+    view_name: str
+    # the Postgres type of every column of the view
+    columns: Dict[str, str]
+    select: List[str]
+    filters: List[Filter]
+    sort: str
+    key: str
+    descending: bool
+    limit: int
+    after: Optional[Tuple[Any, Any]] = None
+
+
+def is_array(pg_type: str) -> bool:
+    return pg_type.endswith("[]")
+
+
+def parse_value(pg_type: str, text: str) -> Any:
+    """Parse a filter or cursor value as the type of its column"""
+    element_type = pg_type.removesuffix("[]")
+    try:
+        if element_type in ("integer", "bigint", "smallint"):
+            return int(text)
+        if element_type in ("double precision", "real"):
+            return float(text)
+        if element_type.startswith("numeric"):
+            return Decimal(text)
+        if element_type == "boolean":
+            if text.lower() not in ("true", "false"):
+                raise ValueError(text)
+            return text.lower() == "true"
+        if element_type == "date":
+            return date.fromisoformat(text)
+        if element_type.startswith("timestamp"):
+            return datetime.fromisoformat(text)
+    except (ValueError, InvalidOperation):
+        raise QueryError(f"Invalid value {text!r} for a {pg_type} column")
+    return text
+
+
+def parse_filter(columns: Dict[str, str], text: str) -> Filter:
+    """Parse a filter of the form column:op:value.
+
+    The operators are eq, ne, lt, le, gt and ge, in with comma separated values, like
+    for a case insensitive substring of a text column, null with true or false, and
+    contains with comma separated values that an array column must all contain.
+    """
+    parts = text.split(":", 2)
+    if len(parts) < 2:
+        raise QueryError(f"Filter {text!r} is not of the form column:op:value")
+    name, op = parts[0], parts[1]
+    raw = parts[2] if len(parts) == 3 else ""
+    if name not in columns:
+        raise QueryError(f"Unknown column {name}")
+    pg_type = columns[name]
+
+    if op == "null":
+        return Filter(name, op, parse_value("boolean", raw or "true"))
+    if is_array(pg_type):
+        if op != "contains":
+            raise QueryError(f"Only contains and null filters apply to {name}")
+        return Filter(name, op, [parse_value(pg_type, item) for item in raw.split(",")])
+    if op == "contains":
+        raise QueryError(f"contains only applies to array columns, not {name}")
+    if op == "in":
+        return Filter(name, op, [parse_value(pg_type, item) for item in raw.split(",")])
+    if op == "like":
+        if json_type(pg_type) != "string":
+            raise QueryError(f"like only applies to text columns, not {name}")
+        return Filter(name, op, raw)
+    if op in comparisons:
+        return Filter(name, op, parse_value(pg_type, raw))
+    raise QueryError(f"Unknown filter operator {op}")
+
+
+def encode_cursor(query: ViewQuery, row: Dict[str, Any]) -> str:
+    values = [query.sort, query.descending, row[query.sort], row[query.key]]
+    # numeric values as strings, as a float could fall either side of the boundary
+    payload = json.dumps(
+        jsonable_encoder(values, custom_encoder={Decimal: str})
+    ).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(
+    columns: Dict[str, str], sort: str, key: str, descending: bool, cursor: str
+) -> Tuple[Any, Any]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_descending, value, key_value = json.loads(payload)
+    except (binascii.Error, ValueError, TypeError):
+        raise QueryError("Invalid cursor")
+    if cursor_sort != sort or cursor_descending != descending:
+        raise QueryError("The cursor is for a query with a different sort order")
+    if key_value is None:
+        raise QueryError("Invalid cursor")
+    return (
+        None if value is None else parse_value(columns[sort], str(value)),
+        parse_value(columns[key], str(key_value)),
+    )
+
+
+def make_query(
+    view_name: str,
+    columns: Dict[str, str],
+    select: Optional[List[str]] = None,
+    filters: Optional[List[str]] = None,
+    sort: Optional[str] = None,
+    descending: bool = False,
+    limit: int = 100,
+    after: Optional[str] = None,
+) -> ViewQuery:
+    """Validate a query of a view against the types of its columns.
+
+    Args:
+        view_name (str): The view to query.
+        columns (Dict[str, str]): The Postgres type of every column of the view.
+        select (Optional[List[str]], optional): The columns to return, all by default.
+        filters (Optional[List[str]], optional): Filters of the form column:op:value.
+        sort (Optional[str], optional): The column to sort by, the key column by default
+            or one of the sortable_columns of the view.
+        descending (bool, optional): Sort in descending order.
+        limit (int, optional): The number of rows in a page.
+        after (Optional[str], optional): The cursor of the previous page.
+
+    Raises:
+        QueryError: If a column, filter or the cursor is not valid for the view.
+
+    Returns:
+        ViewQuery: The validated query.
+    """
+    key = "id" if "id" in columns else next(iter(columns))
+    select = select or list(columns)
+    unknown = [name for name in select if name not in columns]
+    if unknown:
+        raise QueryError(f"Unknown columns {', '.join(unknown)}")
+
+    sort = sort or key
+    if sort not in columns:
+        raise QueryError(f"Unknown sort column {sort}")
+    if sort != key and sort not in sortable_columns.get(view_name, ()):
+        raise QueryError(
+            f"{view_name} can only be sorted by "
+            + ", ".join([key, *sortable_columns.get(view_name, ())])
+        )
+
+    return ViewQuery(
+        view_name=view_name,
+        columns=columns,
+        select=select,
+        filters=[parse_filter(columns, text) for text in filters or []],
+        sort=sort,
+        key=key,
+        descending=descending,
+        limit=limit,
+        after=decode_cursor(columns, sort, key, descending, after) if after else None,
+    )
+
+
+def filter_clause(view_column: ColumnElement, view_filter: Filter) -> ColumnElement:
+    if view_filter.op == "null":
+        return view_column.is_(None) if view_filter.value else view_column.is_not(None)
+    if view_filter.op == "contains":
+        return view_column.contains(view_filter.value)
+    if view_filter.op == "in":
+        return view_column.in_(view_filter.value)
+    if view_filter.op == "like":
+        escaped = (
+            view_filter.value.replace("\\", "\\\\")
+            .replace("%", r"\%")
+            .replace("_", r"\_")
+        )
+        return view_column.ilike(f"%{escaped}%", escape="\\")
+    return comparisons[view_filter.op](view_column, view_filter.value)
+
+
+def seek_clause(
+    sort_column: ColumnElement,
+    key_column: ColumnElement,
+    descending: bool,
+    after: Tuple[Any, Any],
+) -> ColumnElement:
+    """Rows after the cursor, with nulls last ascending and first descending as Postgres sorts them"""
+    value, key = after
+    if sort_column is key_column:
+        return key_column < key if descending else key_column > key
+    if descending:
+        if value is None:
+            return or_(
+                and_(sort_column.is_(None), key_column < key), sort_column.is_not(None)
+            )
+        return tuple_(sort_column, key_column) < tuple_(value, key)
+    if value is None:
+        return and_(sort_column.is_(None), key_column > key)
+    return or_(
+        tuple_(sort_column, key_column) > tuple_(value, key), sort_column.is_(None)
+    )
+
+
+def build_statement(query: ViewQuery, paged: bool = True) -> Select:
+    """The statement of a query, of one page of it or, for an export, all of it"""
+    view = table(
+        query.view_name,
+        *(
+            column(name, ARRAY(String)) if is_array(pg_type) else column(name)
+            for name, pg_type in query.columns.items()
+        ),
+    )
+    sort_column, key_column = view.c[query.sort], view.c[query.key]
+    names = query.select
+    if paged:
+        # the cursor is made from the sort and key columns of the last row
+        names = list(dict.fromkeys([*query.select, query.sort, query.key]))
+
+    statement = select(*(view.c[name] for name in names))
+    for view_filter in query.filters:
+        statement = statement.filter(
+            filter_clause(view.c[view_filter.column], view_filter)
+        )
+    if query.after is not None:
+        statement = statement.filter(
+            seek_clause(sort_column, key_column, query.descending, query.after)
+        )
+
+    order = [sort_column, key_column] if sort_column is not key_column else [key_column]
+    statement = statement.order_by(
+        *(c.desc() if query.descending else c.asc() for c in order)
+    )
+    return statement.limit(query.limit + 1) if paged else statement
+
+
+async def query_view(session: AsyncSession, query: ViewQuery) -> Dict[str, Any]:
+    """Fetch one page of a view, with the cursor of the next page if there is one"""
+    result = await session.execute(build_statement(query))
+    rows = [dict(row) for row in result.mappings()]
+
+    next_cursor = None
+    # one row more than the page is fetched to know whether there is a next page
+    if len(rows) > query.limit:
+        rows = rows[: query.limit]
+        next_cursor = encode_cursor(query, rows[-1])
+
+    return {
+        "rows": [{name: row[name] for name in query.select} for row in rows],
+        "next": next_cursor,
+    }